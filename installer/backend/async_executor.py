@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+from typing import AsyncIterator, List, Optional
+from backend.executor import SystemExecutor, InstallCancelled, get_executor
+
+logger = logging.getLogger("EndOS-Installer")
+
+
+class AsyncExecutor:
+    """
+    asyncio counterpart of RealExecutor. Commands run as coroutines, so
+    probes and install steps can overlap on one thread; a semaphore bounds
+    how many children run at once.
+    """
+
+    def __init__(self, max_concurrency: int = 0, default_timeout: Optional[float] = None,
+                 files: Optional[SystemExecutor] = None):
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._max_concurrency = max_concurrency or (os.cpu_count() or 2)
+        self._default_timeout = default_timeout
+        self._procs = set()
+        self._cancelled = False
+        # File operations go through the synchronous executor's privileged helper
+        self._files = files or get_executor(False)
+
+    def _limit(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the loop that actually runs us
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    async def _spawn(self, cmd: List[str], capture_output: bool, has_input: bool):
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if has_input else None,
+            stdout=asyncio.subprocess.PIPE if capture_output else None,
+            stderr=asyncio.subprocess.PIPE if capture_output else None,
+            start_new_session=True,
+        )
+
+    async def run(self, cmd: List[str], check: bool = True, capture_output: bool = True,
+                  input: str = None, log_output: bool = True,
+                  timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        if self._cancelled:
+            raise InstallCancelled("Installation cancelled")
+        timeout = timeout if timeout is not None else self._default_timeout
+
+        async with self._limit():
+            if log_output:
+                logger.info(f"Executing (async): {' '.join(cmd)}")
+            else:
+                logger.info(f"Executing (async): {cmd[0]} ... (args hidden)")
+
+            proc = await self._spawn(cmd, capture_output, input is not None)
+            self._procs.add(proc)
+            if self._cancelled:
+                # cancel() ran while we were spawning and didn't see it
+                self._kill(proc)
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    proc.communicate(input.encode() if input is not None else None), timeout
+                )
+            except asyncio.TimeoutError:
+                self._kill(proc)
+                await proc.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            finally:
+                self._procs.discard(proc)
+
+        if self._cancelled:
+            raise InstallCancelled("Installation cancelled")
+        result = subprocess.CompletedProcess(
+            cmd,
+            proc.returncode,
+            stdout.decode(errors="replace") if stdout is not None else None,
+            stderr.decode(errors="replace") if stderr is not None else None,
+        )
+        if check and result.returncode != 0:
+            logger.error(f"Command failed with exit code {result.returncode}")
+            if result.stderr:
+                logger.error(f"stderr: {result.stderr}")
+            result.check_returncode()
+        return result
+
+    async def stream(self, cmd: List[str], timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yields the command's stdout line by line; raises CalledProcessError on failure."""
+        if self._cancelled:
+            raise InstallCancelled("Installation cancelled")
+        timeout = timeout if timeout is not None else self._default_timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+
+        async with self._limit():
+            logger.info(f"Streaming (async): {' '.join(cmd)}")
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True,
+            )
+            self._procs.add(proc)
+            if self._cancelled:
+                self._kill(proc)
+            try:
+                while True:
+                    remaining = deadline - loop.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    line = await asyncio.wait_for(proc.stdout.readline(), remaining)
+                    if not line:
+                        break
+                    yield line.decode(errors="replace").rstrip("\n")
+                await proc.wait()
+            except asyncio.TimeoutError:
+                self._kill(proc)
+                await proc.wait()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            finally:
+                self._procs.discard(proc)
+
+        if self._cancelled:
+            raise InstallCancelled("Installation cancelled")
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    async def write_file(self, path: str, content: str,
+                         mode: Optional[int] = None, owner: Optional[str] = None, atomic: bool = True):
+        # Blocking file I/O (or a helper round trip) goes to the default thread pool
+        await asyncio.to_thread(self._files.write_file, path, content, mode, owner, atomic)
+
+    def _kill(self, proc, sig=signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def cancel(self, timeout: float = 5.0):
+        """Must be called on the executor's loop."""
+        self._cancelled = True
+        procs = list(self._procs)
+        for proc in procs:
+            self._kill(proc, signal.SIGTERM)
+
+        def escalate():
+            for proc in procs:
+                if proc.returncode is None:
+                    self._kill(proc)
+
+        asyncio.get_running_loop().call_later(timeout, escalate)
+
+    def reset_cancel(self):
+        self._cancelled = False
+
+    def close(self):
+        self._files.close()
@@ -0,0 +1,223 @@
+import json
+import logging
+from typing import List, Dict, Optional
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+KERNELS = ["linux", "linux-lts", "linux-zen", "linux-hardened"]
+MICROCODE = ["intel-ucode", "amd-ucode"]
+
+ESP_PARTTYPE = "c12a7328-f81f-11d2-ba4b-00a0c93ec93b"
+
+
+class BootloaderManager:
+    """
+    Installs GRUB or systemd-boot and writes their configuration directly
+    from what the installer already knows, instead of running grub-mkconfig
+    (which runs os-prober against every attached block device).
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def get_uuid(self, part: str) -> str:
+        result = self.executor.run(["blkid", "-s", "UUID", "-o", "value", part], check=False)
+        return (result.stdout or "").strip()
+
+    def boot_images(self, packages: List[str], fallback: bool = True) -> List[Dict]:
+        """
+        Returns one entry per kernel image that pacstrap will produce, with
+        paths relative to /boot.
+        """
+        ucode = [f"/{p}.img" for p in MICROCODE if p in packages]
+        images = []
+        for kernel in [k for k in KERNELS if k in packages] or ["linux"]:
+            images.append({
+                "title": "EndOS" if kernel == "linux" else f"EndOS ({kernel})",
+                "id": f"endos-{kernel}",
+                "linux": f"/vmlinuz-{kernel}",
+                "initrd": ucode + [f"/initramfs-{kernel}.img"],
+            })
+            if fallback:
+                images.append({
+                    "title": f"EndOS ({kernel}, fallback initramfs)",
+                    "id": f"endos-{kernel}-fallback",
+                    "linux": f"/vmlinuz-{kernel}",
+                    "initrd": ucode + [f"/initramfs-{kernel}-fallback.img"],
+                })
+        return images
+
+    def install(self, mount_point: str, boot_mode: str, target_disk: str,
+                root_part: str, boot_part: Optional[str], packages: List[str],
+                loader: str = "grub", cmdline: str = "loglevel=3 quiet splash",
+                probe_disks: Optional[List[str]] = None, fallback: bool = True,
+                uuids: Optional[Dict[str, str]] = None, crypt_params: str = "",
+                root_subvol: str = ""):
+        """
+        Installs the bootloader for the detected boot mode.
+        probe_disks: disks to search for other operating systems (opt-in).
+        uuids: filesystem UUIDs already known for root_part/boot_part.
+        crypt_params: kernel parameters that unlock an encrypted root.
+        root_subvol: btrfs subvolume holding the root filesystem.
+        """
+        uuids = uuids or {}
+        if loader == "systemd-boot" and boot_mode != "UEFI":
+            logger.warning("systemd-boot requires UEFI, falling back to GRUB")
+            loader = "grub"
+
+        root_uuid = uuids.get(root_part) or self.get_uuid(root_part)
+        rootflags = f"rootflags=subvol=/{root_subvol}" if root_subvol else ""
+        options = " ".join(p for p in (crypt_params, f"root=UUID={root_uuid}", rootflags, "rw", cmdline) if p)
+        images = self.boot_images(packages, fallback)
+        others = self.probe_other_systems(probe_disks, boot_mode, mount_point, exclude=[root_part, boot_part])
+
+        if loader == "systemd-boot":
+            if others:
+                logger.warning("systemd-boot cannot chainload other disks' ESPs, skipping probed entries")
+            self._install_systemd_boot(mount_point, images, options)
+        else:
+            # Kernels live on the ESP in UEFI mode, and under /boot on root otherwise
+            if boot_part:
+                search_uuid = uuids.get(boot_part) or self.get_uuid(boot_part)
+                prefix = ""
+            else:
+                search_uuid = root_uuid
+                # GRUB resolves paths from the btrfs top level, not the root subvolume
+                prefix = f"/{root_subvol}/boot" if root_subvol else "/boot"
+            self._install_grub(mount_point, boot_mode, target_disk, images, options,
+                               cmdline, search_uuid, prefix, others, crypt_params)
+
+    def _install_grub(self, mount_point: str, boot_mode: str, target_disk: str,
+                      images: List[Dict], options: str, cmdline: str,
+                      search_uuid: str, prefix: str, others: List[Dict], crypt_params: str = ""):
+        if boot_mode == "UEFI":
+            cmd = ["grub-install", "--target=x86_64-efi", "--efi-directory=/boot", "--bootloader-id=EndOS"]
+        else:
+            cmd = ["grub-install", "--target=i386-pc", target_disk]
+        self.executor.run(["arch-chroot", mount_point] + cmd, capture_output=False)
+
+        # Keep /etc/default/grub in sync for anyone regenerating later with grub-mkconfig
+        self.executor.run(
+            [
+                "sed",
+                "-i",
+                "-e",
+                f's|^GRUB_CMDLINE_LINUX_DEFAULT=.*|GRUB_CMDLINE_LINUX_DEFAULT="{cmdline}"|',
+                "-e",
+                f's|^GRUB_CMDLINE_LINUX=.*|GRUB_CMDLINE_LINUX="{crypt_params}"|',
+                f"{mount_point}/etc/default/grub",
+            ],
+            check=False,
+        )
+
+        self.executor.makedirs(f"{mount_point}/boot/grub")
+        self.executor.write_file(
+            f"{mount_point}/boot/grub/grub.cfg",
+            self.render_grub_cfg(images, options, search_uuid, prefix, others),
+        )
+
+    def render_grub_cfg(self, images: List[Dict], options: str, search_uuid: str,
+                        prefix: str = "", others: Optional[List[Dict]] = None) -> str:
+        lines = [
+            "# Generated by the EndOS installer",
+            "# Run 'grub-mkconfig -o /boot/grub/grub.cfg' to regenerate with os-prober",
+            "insmod part_gpt",
+            "insmod part_msdos",
+            "insmod ext2",
+            "insmod fat",
+            "insmod all_video",
+            "set default=0",
+            "set timeout=5",
+            "set gfxpayload=keep",
+            f"search --no-floppy --fs-uuid --set=root {search_uuid}",
+            "",
+        ]
+        for img in images:
+            initrd = " ".join(f"{prefix}{i}" for i in img["initrd"])
+            lines += [
+                f"menuentry '{img['title']}' --class endos --class gnu-linux --class os $menuentry_id_option '{img['id']}' {{",
+                f"    linux {prefix}{img['linux']} {options}",
+                f"    initrd {initrd}",
+                "}",
+                "",
+            ]
+        for other in others or []:
+            lines += [f"menuentry '{other['title']}' --class os {{"]
+            lines += [f"    {line}" for line in other["grub"]]
+            lines += ["}", ""]
+        return "\n".join(lines)
+
+    def _install_systemd_boot(self, mount_point: str, images: List[Dict], options: str):
+        self.executor.run(
+            ["arch-chroot", mount_point, "bootctl", "--esp-path=/boot", "install"],
+            capture_output=False,
+        )
+        entries_dir = f"{mount_point}/boot/loader/entries"
+        self.executor.makedirs(entries_dir)
+        self.executor.write_file(
+            f"{mount_point}/boot/loader/loader.conf",
+            f"default {images[0]['id']}.conf\ntimeout 3\neditor no\n",
+        )
+        for img in images:
+            content = f"title {img['title']}\nlinux {img['linux']}\n"
+            content += "".join(f"initrd {i}\n" for i in img["initrd"])
+            content += f"options {options}\n"
+            self.executor.write_file(f"{entries_dir}/{img['id']}.conf", content)
+
+    def probe_other_systems(self, disks: Optional[List[str]], boot_mode: str,
+                            mount_point: str, exclude: List[Optional[str]]) -> List[Dict]:
+        """
+        Looks for Windows boot managers on the given disks only. Returns
+        GRUB menu entry bodies for each one found.
+        """
+        if not disks:
+            return []
+
+        result = self.executor.run(
+            ["lsblk", "-J", "-o", "PATH,FSTYPE,PARTTYPE,UUID"] + list(disks),
+            capture_output=True, check=False,
+        )
+        try:
+            data = json.loads(result.stdout or "{}")
+        except json.JSONDecodeError:
+            return []
+
+        parts = []
+
+        def walk(items):
+            for item in items:
+                parts.append(item)
+                walk(item.get("children", []))
+
+        walk(data.get("blockdevices", []))
+
+        probe_mnt = "/tmp/endos-osprobe"
+        others = []
+        for part in parts:
+            path, uuid = part.get("path"), part.get("uuid")
+            if not uuid or path in exclude:
+                continue
+            if boot_mode == "UEFI" and (part.get("parttype") or "").lower() == ESP_PARTTYPE:
+                loader_path = "/EFI/Microsoft/Boot/bootmgfw.efi"
+                body = ["insmod fat", f"search --no-floppy --fs-uuid --set=root {uuid}",
+                        f"chainloader {loader_path}"]
+            elif boot_mode == "BIOS" and part.get("fstype") == "ntfs":
+                loader_path = "/bootmgr"
+                body = ["insmod ntfs", "insmod ntldr", f"search --no-floppy --fs-uuid --set=root {uuid}",
+                        f"ntldr {loader_path}"]
+            else:
+                continue
+
+            self.executor.makedirs(probe_mnt)
+            mounted = self.executor.run(["mount", "-o", "ro", path, probe_mnt], check=False)
+            if mounted.returncode != 0:
+                continue
+            try:
+                found = self.executor.run(["test", "-f", f"{probe_mnt}{loader_path}"], check=False)
+                if found.returncode == 0:
+                    logger.info(f"Found Windows Boot Manager on {path}")
+                    others.append({"title": f"Windows Boot Manager (on {path})", "grub": body})
+            finally:
+                self.executor.run(["umount", probe_mnt], check=False)
+        return others
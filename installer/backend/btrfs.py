@@ -0,0 +1,107 @@
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Subvolume -> mountpoint, in mount order
+SUBVOLUMES = [
+    ("@", "/"),
+    ("@home", "/home"),
+    ("@cache", "/var/cache"),
+    ("@log", "/var/log"),
+]
+
+# Directories (relative to the target root) created with chattr +C: their
+# contents are rewritten in place or already compressed, so copy-on-write
+# and compression only cost throughput. Must be set while they are empty.
+NODATACOW_DIRS = ["/var/cache", "/var/lib/libvirt/images"]
+
+# btrfs compresses in 128 KiB extents, so the benchmark does too
+CHUNK = 128 * 1024
+SAMPLE_BYTES = 8 * 1024 * 1024
+# What gets installed is mostly what the live system already has under /usr
+SAMPLE_DIRS = ["/usr/bin", "/usr/lib", "/usr/share"]
+
+CANDIDATE_LEVELS = [1, 2, 3, 5, 7, 9]
+# btrfs' own default, used when no zstd binding is available
+DEFAULT_LEVEL = 3
+# A higher level wins if it is at most this much slower: it saves space for free
+LEVEL_TOLERANCE = 0.95
+
+
+def zstd_compressor() -> Optional[Callable[[bytes, int], bytes]]:
+    try:
+        # Python 3.14+
+        from compression import zstd
+        return lambda data, level: zstd.compress(data, level=level)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return lambda data, level: zstandard.ZstdCompressor(level=level).compress(data)
+    except ImportError:
+        return None
+
+
+def sample_payload(limit: int = SAMPLE_BYTES, dirs: List[str] = SAMPLE_DIRS) -> List[bytes]:
+    """Up to limit bytes of regular files, as CHUNK-sized pieces."""
+    chunks, total = [], 0
+    for root in dirs:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if os.path.islink(path):
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read(CHUNK)
+                except OSError:
+                    continue
+                if data:
+                    chunks.append(data)
+                    total += len(data)
+                if total >= limit:
+                    return chunks
+    return chunks
+
+
+def choose_zstd_level(disk_mbps: float, chunks: Optional[List[bytes]] = None,
+                      levels: List[int] = CANDIDATE_LEVELS,
+                      cpus: Optional[int] = None) -> Tuple[int, Dict]:
+    """
+    Picks the zstd level that writes uncompressed data to disk fastest:
+    each level is limited either by compression speed (across every core,
+    as btrfs compresses on all of them) or by the disk writing the
+    compressed bytes. Returns (level, per-level figures).
+    """
+    compress = zstd_compressor()
+    if compress is None:
+        logger.info(f"No zstd binding available, using compress=zstd:{DEFAULT_LEVEL}")
+        return DEFAULT_LEVEL, {}
+    chunks = sample_payload() if chunks is None else chunks
+    if not chunks:
+        return DEFAULT_LEVEL, {}
+
+    cpus = cpus or os.cpu_count() or 1
+    size = sum(len(c) for c in chunks)
+    results = {}
+    for level in levels:
+        start = time.perf_counter()
+        compressed = sum(min(len(compress(c, level)), len(c)) for c in chunks)
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        ratio = size / compressed
+        cpu_mbps = size / elapsed / 1e6 * cpus
+        results[level] = {
+            "ratio": round(ratio, 2),
+            "cpu_mbps": round(cpu_mbps, 1),
+            "effective_mbps": round(min(cpu_mbps, disk_mbps * ratio), 1),
+        }
+
+    best = max(r["effective_mbps"] for r in results.values())
+    level = max(l for l, r in results.items() if r["effective_mbps"] >= best * LEVEL_TOLERANCE)
+    logger.info(f"Chose compress=zstd:{level} (ratio {results[level]['ratio']}, "
+                f"{results[level]['effective_mbps']} MB/s vs {disk_mbps:.0f} MB/s raw)")
+    return level, results
@@ -0,0 +1,96 @@
+import json
+import logging
+import mmap
+import os
+import random
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Results are kept per disk serial for the live session, so rescans and
+# installer restarts don't benchmark again
+CACHE_PATH = "/tmp/endos-diskbench.json"
+
+SEQ_BLOCK = 1024 * 1024
+RAND_BLOCK = 4096
+# Sequential reads start this far in, past partition tables and boot code
+# that may sit in the drive's cache
+SEQ_OFFSET = 64 * 1024 * 1024
+
+
+def _device_size(fd: int) -> int:
+    return os.lseek(fd, 0, os.SEEK_END)
+
+
+def benchmark_device(device: str, budget: float = 1.5) -> Dict:
+    """
+    Read-only O_DIRECT probe: sequential 1 MiB reads for 60% of the
+    budget, then queue-depth-1 random 4 KiB reads for the rest.
+    Returns {"mbps", "iops"}; raises OSError if the device can't be read.
+    """
+    # O_DIRECT bypasses the page cache; mmap gives the aligned buffer it needs
+    fd = os.open(device, os.O_RDONLY | os.O_DIRECT)
+    try:
+        size = _device_size(fd)
+        seq_buf = mmap.mmap(-1, SEQ_BLOCK)
+        rand_buf = mmap.mmap(-1, RAND_BLOCK)
+
+        offset = SEQ_OFFSET if size > SEQ_OFFSET * 2 else 0
+        read = 0
+        start = time.monotonic()
+        deadline = start + budget * 0.6
+        while time.monotonic() < deadline and offset + SEQ_BLOCK <= size:
+            n = os.preadv(fd, [seq_buf], offset)
+            if n <= 0:
+                break
+            read += n
+            offset += n
+        seq_time = time.monotonic() - start
+
+        rng = random.Random(0)
+        blocks = size // RAND_BLOCK
+        ios = 0
+        start = time.monotonic()
+        deadline = start + budget * 0.4
+        while blocks and time.monotonic() < deadline:
+            os.preadv(fd, [rand_buf], rng.randrange(blocks) * RAND_BLOCK)
+            ios += 1
+        rand_time = time.monotonic() - start
+    finally:
+        os.close(fd)
+
+    return {
+        "mbps": round(read / seq_time / 1e6, 1) if seq_time else 0.0,
+        "iops": int(ios / rand_time) if rand_time else 0,
+    }
+
+
+def load_cache(path: str = CACHE_PATH) -> Dict[str, Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache: Dict[str, Dict], path: str = CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logger.debug(f"Could not save disk benchmarks: {e}")
+
+
+def parse_size(text: str) -> Optional[int]:
+    """lsblk's human-readable SIZE ("238.5G") in bytes."""
+    units = "BKMGTPE"
+    text = (text or "").strip().upper()
+    if not text:
+        return None
+    unit = text[-1] if text[-1] in units else "B"
+    number = text[:-1] if text[-1] in units else text
+    try:
+        return int(float(number) * 1024 ** units.index(unit))
+    except ValueError:
+        return None
@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+MAPPER_NAME = "cryptroot"
+
+# Length-preserving disk ciphers we consider secure. XTS with a 256-bit key
+# is AES-128; 512-bit is AES-256. Adiantum is for CPUs without AES-NI.
+ADIANTUM = ("xchacha12,aes-adiantum", 256)
+
+# "        aes-xts        512b      3025.7 MiB/s      3018.2 MiB/s"
+BENCH_RE = re.compile(r"^\s*(\S+)\s+(\d+)b\s+([\d.]+)\s+MiB/s\s+([\d.]+)\s+MiB/s")
+
+# A larger key wins if it is at most this much slower than the fastest cipher
+KEY_SIZE_TOLERANCE = 0.9
+
+# argon2id memory cost bounds, KiB
+PBKDF_MEMORY_MIN = 64 * 1024
+PBKDF_MEMORY_MAX = 1024 * 1024
+
+
+def cpu_has_aes() -> bool:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return " aes" in line
+    except OSError:
+        pass
+    return False
+
+
+def parse_benchmark(output: str) -> List[Dict]:
+    results = []
+    for line in output.splitlines():
+        m = BENCH_RE.match(line)
+        if not m:
+            continue
+        alg, key_size, enc, dec = m.group(1), int(m.group(2)), float(m.group(3)), float(m.group(4))
+        if "xts" in alg or "adiantum" in alg:
+            results.append({"cipher": alg, "key_size": key_size, "mibps": min(enc, dec)})
+    return results
+
+
+def cipher_spec(alg: str) -> str:
+    """cryptsetup --cipher argument for a benchmark algorithm name."""
+    return f"{alg}-plain64"
+
+
+class EncryptionManager:
+    """
+    LUKS2 root encryption. The cipher and PBKDF cost are chosen for the
+    machine at install time, and the target's initramfs and kernel cmdline
+    are set up to unlock it.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+        # Set once the root container has been formatted
+        self.luks_uuid: Optional[str] = None
+        self.device: Optional[str] = None
+
+    @property
+    def mapper(self) -> str:
+        return f"/dev/mapper/{MAPPER_NAME}"
+
+    def benchmark(self) -> List[Dict]:
+        """In-memory cipher throughput, from cryptsetup benchmark."""
+        result = self.executor.run(["cryptsetup", "benchmark"], check=False)
+        results = parse_benchmark(result.stdout or "")
+        # Adiantum isn't in the default set
+        alg, key_size = ADIANTUM
+        result = self.executor.run(
+            ["cryptsetup", "benchmark", "-c", cipher_spec(alg), "-s", str(key_size)], check=False
+        )
+        results += parse_benchmark(result.stdout or "")
+        return results
+
+    def choose_cipher(self, results: Optional[List[Dict]] = None) -> Tuple[str, int]:
+        """Returns (cipher, key size in bits) for luksFormat."""
+        results = self.benchmark() if results is None else results
+        if not results:
+            # No benchmark (dry run, or cryptsetup failed): go by the CPU flags
+            if cpu_has_aes():
+                return cipher_spec("aes-xts"), 512
+            return cipher_spec(ADIANTUM[0]), ADIANTUM[1]
+
+        best = max(r["mibps"] for r in results)
+        eligible = [r for r in results if r["mibps"] >= best * KEY_SIZE_TOLERANCE]
+        pick = max(eligible, key=lambda r: (r["key_size"], r["mibps"]))
+        logger.info(f"Cipher: {pick['cipher']} {pick['key_size']}b ({pick['mibps']:.0f} MiB/s)")
+        return cipher_spec(pick["cipher"]), pick["key_size"]
+
+    def pbkdf_options(self, iter_time_ms: int = 2000) -> List[str]:
+        """
+        argon2id with a quarter of RAM (64 MiB - 1 GiB), capped by what is
+        free right now so luksFormat doesn't push the live system into swap.
+        cryptsetup then tunes the time cost to iter_time_ms.
+        """
+        info = self.executor.meminfo()
+        memory = PBKDF_MEMORY_MAX
+        if info.get("MemTotal"):
+            memory = min(memory, info["MemTotal"] // 4)
+        if info.get("MemAvailable"):
+            memory = min(memory, info["MemAvailable"] // 2)
+        memory = max(memory, PBKDF_MEMORY_MIN)
+        parallel = min(4, os.cpu_count() or 1)
+        return [
+            "--pbkdf", "argon2id",
+            "--pbkdf-memory", str(memory),
+            "--pbkdf-parallel", str(parallel),
+            "--iter-time", str(iter_time_ms),
+        ]
+
+    def format(self, part: str, passphrase: str, rotational: bool = False,
+               cipher: Optional[str] = None, key_size: Optional[int] = None,
+               iter_time_ms: int = 2000) -> str:
+        """
+        Creates a LUKS2 container on part and opens it.
+        Returns the mapper device to put the filesystem on.
+        """
+        if not cipher:
+            cipher, key_size = self.choose_cipher()
+        self.luks_uuid = str(uuid.uuid4())
+        self.device = part
+
+        # The passphrase goes in on stdin, without a trailing newline
+        self.executor.run(
+            [
+                "cryptsetup", "luksFormat", "--type", "luks2", "--batch-mode",
+                "--cipher", cipher, "--key-size", str(key_size or 512),
+                *self.pbkdf_options(iter_time_ms),
+                "--uuid", self.luks_uuid,
+                "--key-file", "-",
+                part,
+            ],
+            input=passphrase,
+            log_output=False,
+        )
+
+        open_cmd = ["cryptsetup", "open", "--key-file", "-"]
+        if not rotational:
+            # dm-crypt's workqueues only add latency on fast flash;
+            # --persistent stores the flags in the header for every boot
+            open_cmd += ["--perf-no_read_workqueue", "--perf-no_write_workqueue", "--persistent"]
+        self.executor.run(open_cmd + [part, MAPPER_NAME], input=passphrase, log_output=False)
+        return self.mapper
+
+    def configure_target(self, mount_point: str) -> str:
+        """
+        Adds the unlock hook to the target's mkinitcpio.conf (sd-encrypt for
+        systemd-based initramfs, encrypt otherwise) and returns the kernel
+        parameters that go with it.
+        """
+        conf_path = f"{mount_point}/etc/mkinitcpio.conf"
+        try:
+            with open(conf_path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            lines = []
+
+        systemd = True
+        for i, line in enumerate(lines):
+            m = re.match(r"^HOOKS=\((.*)\)", line)
+            if not m:
+                continue
+            hooks = m.group(1).split()
+            systemd = "systemd" in hooks
+            hook = "sd-encrypt" if systemd else "encrypt"
+            if hook not in hooks:
+                at = hooks.index("filesystems") if "filesystems" in hooks else len(hooks)
+                hooks.insert(at, hook)
+            lines[i] = f"HOOKS=({' '.join(hooks)})"
+        if lines:
+            self.executor.write_file(conf_path, "\n".join(lines) + "\n")
+        else:
+            logger.warning(f"{conf_path} not found, assuming a systemd-based initramfs")
+
+        if systemd:
+            return f"rd.luks.name={self.luks_uuid}={MAPPER_NAME}"
+        return f"cryptdevice=UUID={self.luks_uuid}:{MAPPER_NAME}"
+
+    def close(self):
+        if self.luks_uuid:
+            self.executor.run(["cryptsetup", "close", MAPPER_NAME], check=False)
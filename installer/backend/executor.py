@@ -1,33 +1,248 @@
 import subprocess
 import logging
+import os
+import signal
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Union
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Union
+from backend.privhelper import PrivilegedHelper, apply_ops, write_op
+from backend.sysinfo import read_meminfo
 
 logger = logging.getLogger("EndOS-Installer")
 
+class InstallCancelled(Exception):
+    """Raised by run() once cancel() has been called."""
+
+# Read-only commands whose result only changes when something touches the
+# devices or paths they name
+PROBE_COMMANDS = {"lsblk", "blkid", "findmnt", "test", "stat", "ls"}
+# Commands that change block devices, partition tables or mounts. They can
+# change what any device probe reports (lsblk /dev/sda lists sda2's new
+# filesystem, a LUKS mapping shows up under its parent, ...)
+DEVICE_COMMANDS = {"parted", "sgdisk", "sfdisk", "wipefs", "mkswap", "cryptsetup", "partprobe",
+                   "udevadm", "mount", "umount", "swapon", "swapoff", "losetup", "btrfs", "dd"}
+
+
+def _paths(cmd: List[str]) -> List[str]:
+    """Absolute paths named by cmd, including option values like of=/dev/sda."""
+    paths = []
+    for arg in cmd[1:]:
+        if "=/" in arg:
+            arg = arg.split("=", 1)[1]
+        if arg.startswith("/"):
+            paths.append(arg.rstrip("/") or "/")
+    return paths
+
+
+def _related(a: str, b: str) -> bool:
+    return a == b or a.startswith(b.rstrip("/") + "/") or b.startswith(a.rstrip("/") + "/")
+
+
+class ProbeCache:
+    """
+    Small LRU of probe results keyed by argv. Every other command counts as
+    a mutation of the paths it names and drops the probes it may affect;
+    device commands drop every device probe.
+    """
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        self._results: "OrderedDict[Tuple[str, ...], subprocess.CompletedProcess]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_probe(cmd: List[str]) -> bool:
+        return bool(cmd) and os.path.basename(cmd[0]) in PROBE_COMMANDS
+
+    @staticmethod
+    def is_device_command(cmd: List[str]) -> bool:
+        name = os.path.basename(cmd[0]) if cmd else ""
+        return name in DEVICE_COMMANDS or name.startswith("mkfs")
+
+    def get(self, cmd: List[str]) -> Optional[subprocess.CompletedProcess]:
+        key = tuple(cmd)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, cmd: List[str], result: subprocess.CompletedProcess):
+        with self._lock:
+            self._results[tuple(cmd)] = result
+            self._results.move_to_end(tuple(cmd))
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+    def invalidate(self, cmd: List[str]):
+        """Drops the probes a (mutating) cmd may change."""
+        changed = _paths(cmd)
+        devices = self.is_device_command(cmd)
+        if not changed and not devices:
+            return
+        with self._lock:
+            for key in list(self._results):
+                probed = _paths(list(key))
+                if devices and (not probed or any(p.startswith("/dev/") for p in probed)):
+                    del self._results[key]
+                elif any(_related(p, c) for p in probed for c in changed):
+                    del self._results[key]
+
+    def invalidate_paths(self, *paths: str):
+        """Drops the probes of paths changed by file operations."""
+        self.invalidate(["write"] + list(paths))
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
 class SystemExecutor(ABC):
     """Abstract base class for system command execution."""
-    
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self.probes = ProbeCache()
+
     @abstractmethod
     def run(self, cmd: List[str], check: bool = True, capture_output: bool = True, input: str = None, log_output: bool = True) -> subprocess.CompletedProcess:
         pass
     
     @abstractmethod
-    def write_file(self, path: str, content: str, sudo: bool = False):
+    def write_file(self, path: str, content: str,
+                   mode: Optional[int] = None, owner: Optional[str] = None, atomic: bool = True):
+        """atomic=False writes in place, e.g. for sysfs/procfs attributes."""
+        pass
+
+    @abstractmethod
+    def makedirs(self, path: str):
+        pass
+
+    @abstractmethod
+    def symlink(self, target: str, link: str):
+        """Creates (or replaces) link pointing at target, like ln -sfn."""
+        pass
+
+    @abstractmethod
+    def remove(self, path: str, recursive: bool = False):
+        pass
+
+    @abstractmethod
+    def write_blocks(self, device: str, zero: List[Tuple[int, int]], chunks: List[Tuple[int, str]]):
+        """
+        Zeroes the (offset, length) ranges of device, then writes each
+        (offset, file) chunk at its offset and syncs; all in one operation.
+        """
+        pass
+
+    @contextmanager
+    def batch(self):
+        """Groups file operations so they can be sent in one round trip."""
+        yield
+
+    def close(self):
+        """Releases per-session resources (e.g. the privileged helper)."""
         pass
 
+    def cancel(self, timeout: float = 5.0):
+        """Makes running and future commands fail with InstallCancelled."""
+        self._cancelled.set()
+
+    def reset_cancel(self):
+        """Allows commands again, e.g. for cleanup after a cancel."""
+        self._cancelled.clear()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise InstallCancelled("Installation cancelled")
+
+    # run() implementations call these around the actual command: probes are
+    # answered from self.probes, anything else invalidates what it touches
+    def _cached_probe(self, cmd: List[str], check: bool, capture_output: bool,
+                      input: Optional[str]) -> Optional[subprocess.CompletedProcess]:
+        if not self.probes.is_probe(cmd):
+            self.probes.invalidate(cmd)
+            return None
+        if not capture_output or input is not None:
+            return None
+        result = self.probes.get(cmd)
+        if result is not None:
+            logger.debug(f"Cached probe: {' '.join(cmd)}")
+            if check:
+                result.check_returncode()
+        return result
+
+    def _record_result(self, cmd: List[str], capture_output: bool, input: Optional[str],
+                       result: subprocess.CompletedProcess):
+        if self.probes.is_probe(cmd):
+            if capture_output and input is None:
+                self.probes.put(cmd, result)
+        else:
+            # Again once it has finished, in case a probe ran meanwhile
+            self.probes.invalidate(cmd)
+
+    def invalidate_probes(self):
+        """Forgets every cached probe, e.g. before rescanning for hotplugged disks."""
+        self.probes.clear()
+
+    def meminfo(self) -> Dict[str, int]:
+        """/proc/meminfo of the machine being installed, in KiB."""
+        return read_meminfo()
+
 class RealExecutor(SystemExecutor):
     """Executes commands on the live system."""
+
+    def __init__(self):
+        super().__init__()
+        self._helper: Optional[PrivilegedHelper] = None
+        self._pending: Optional[List[Dict]] = None
+        self._procs = set()
+        self._procs_lock = threading.Lock()
     
     def run(self, cmd: List[str], check: bool = True, capture_output: bool = True, input: str = None, log_output: bool = True) -> subprocess.CompletedProcess:
+        self.check_cancelled()
+        cached = self._cached_probe(cmd, check, capture_output, input)
+        if cached is not None:
+            return cached
         if log_output:
             logger.info(f"Executing: {' '.join(cmd)}")
         else:
              logger.info(f"Executing: {cmd[0]} ... (args hidden)")
         
         try:
-            result = subprocess.run(cmd, check=check, capture_output=capture_output, text=True, input=input)
+            # Each child leads its own process group so cancel() can take
+            # down the whole tree (pacstrap -> pacman -> hooks, ...)
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if input is not None else None,
+                stdout=subprocess.PIPE if capture_output else None,
+                stderr=subprocess.PIPE if capture_output else None,
+                text=True,
+                start_new_session=True,
+            )
+            with self._procs_lock:
+                self._procs.add(proc)
+                # cancel() sets the flag before it looks at _procs; a child
+                # started in between is ours to stop
+                started_late = self._cancelled.is_set()
+            if started_late:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            try:
+                stdout, stderr = proc.communicate(input=input)
+            finally:
+                with self._procs_lock:
+                    self._procs.discard(proc)
+            self.check_cancelled()
+
+            result = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+            self._record_result(cmd, capture_output, input, result)
+            if check:
+                result.check_returncode()
             if result.stderr and result.stderr.strip():
                 logger.warning(f"Command stderr: {result.stderr}")
             return result
@@ -39,22 +254,88 @@ class RealExecutor(SystemExecutor):
                 logger.error(f"stdout: {e.stdout}")
             raise
 
-    def write_file(self, path: str, content: str, sudo: bool = False):
-        logger.info(f"Writing file: {path}")
-        if sudo:
-            # Use tee to write as root
-            proc = subprocess.Popen(['sudo', 'tee', path], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
-            proc.communicate(input=content.encode())
-            if proc.returncode != 0:
-                raise Exception(f"Failed to write to {path} with sudo")
+    def cancel(self, timeout: float = 5.0):
+        """Terminates every running child's process group within timeout seconds."""
+        super().cancel(timeout)
+        with self._procs_lock:
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        for proc in procs:
+            try:
+                proc.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                pass
+            try:
+                # Kill whatever is left of the group, even if the leader exited
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    # File operations run in-process when we are root. Otherwise they go to a
+    # single long-lived privileged helper instead of one sudo per operation.
+    def _apply(self, ops: List[Dict]):
+        self.probes.invalidate_paths(*[op.get("path") or op.get("link") or "" for op in ops])
+        if self._pending is not None:
+            self._pending.extend(ops)
+            return
+        if os.geteuid() == 0:
+            results = apply_ops(ops)
         else:
-            with open(path, 'w') as f:
-                f.write(content)
+            if self._helper is None:
+                self._helper = PrivilegedHelper()
+            results = self._helper.call(ops)
+        errors = [r["error"] for r in results if not r["ok"]]
+        if errors:
+            raise Exception("; ".join(errors))
+
+    @contextmanager
+    def batch(self):
+        if self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            ops, self._pending = self._pending, None
+        if ops:
+            self._apply(ops)
+
+    def close(self):
+        if self._helper:
+            self._helper.close()
+            self._helper = None
+
+    def write_file(self, path: str, content: str,
+                   mode: Optional[int] = None, owner: Optional[str] = None, atomic: bool = True):
+        logger.info(f"Writing file: {path}")
+        self._apply([write_op(path, content, mode, owner, atomic)])
+
+    def makedirs(self, path: str):
+        self._apply([{"op": "mkdir", "path": path}])
+
+    def symlink(self, target: str, link: str):
+        self._apply([{"op": "symlink", "target": target, "link": link}])
+
+    def remove(self, path: str, recursive: bool = False):
+        self._apply([{"op": "remove", "path": path, "recursive": recursive}])
+
+    def write_blocks(self, device: str, zero: List[Tuple[int, int]], chunks: List[Tuple[int, str]]):
+        self._apply([{"op": "blocks", "path": device, "zero": zero, "chunks": chunks}])
 
 class DryRunExecutor(SystemExecutor):
     """Mocks command execution for testing."""
     
     def run(self, cmd: List[str], check: bool = True, capture_output: bool = True, input: str = None, log_output: bool = True) -> subprocess.CompletedProcess:
+        self.check_cancelled()
+        cached = self._cached_probe(cmd, check, capture_output, input)
+        if cached is not None:
+            return cached
         cmd_str = ' '.join(cmd)
         if log_output and not input: # Don't log input in dry run if possible, or mark as sensitive
              logger.warning(f"[DRY-RUN] Would execute: {cmd_str}")
@@ -74,10 +355,31 @@ class DryRunExecutor(SystemExecutor):
         else:
             time.sleep(0.1) # Simulate work
             
-        return subprocess.CompletedProcess(args=cmd, returncode=returncode, stdout=stdout, stderr=stderr)
+        result = subprocess.CompletedProcess(args=cmd, returncode=returncode, stdout=stdout, stderr=stderr)
+        self._record_result(cmd, capture_output, input, result)
+        return result
+
+    def write_file(self, path: str, content: str,
+                   mode: Optional[int] = None, owner: Optional[str] = None, atomic: bool = True):
+        logger.warning(f"[DRY-RUN] Would write to {path}:\n{content[:100]}...")
+
+    def makedirs(self, path: str):
+        logger.warning(f"[DRY-RUN] Would create directory {path}")
+
+    def symlink(self, target: str, link: str):
+        logger.warning(f"[DRY-RUN] Would link {link} -> {target}")
+
+    def remove(self, path: str, recursive: bool = False):
+        logger.warning(f"[DRY-RUN] Would remove {path}")
 
-    def write_file(self, path: str, content: str, sudo: bool = False):
-        logger.warning(f"[DRY-RUN] Would write to {path} (Sudo: {sudo}):\n{content[:100]}...")
+    def write_blocks(self, device: str, zero: List[Tuple[int, int]], chunks: List[Tuple[int, str]]):
+        logger.warning(f"[DRY-RUN] Would zero {len(zero)} ranges and write {len(chunks)} chunks to {device}")
 
-def get_executor(dry_run: bool = False) -> SystemExecutor:
-    return DryRunExecutor() if dry_run else RealExecutor()
+def get_executor(dry_run: bool = False, simulation=None) -> SystemExecutor:
+    if simulation is not None:
+        # A HardwareSimulation; imported here, simulator builds on this module
+        from backend.simulator import SimulatedExecutor
+        return SimulatedExecutor(simulation)
+    if dry_run:
+        return DryRunExecutor()
+    return RealExecutor()
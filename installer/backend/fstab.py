@@ -0,0 +1,57 @@
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("EndOS-Installer")
+
+VFAT_OPTIONS = "fmask=0022,dmask=0022,codepage=437,iocharset=ascii,shortname=mixed,utf8,errors=remount-ro"
+
+
+def mount_options(entry: Dict, storage: Dict) -> str:
+    """Chooses mount options for a filesystem from the target disk's storage profile."""
+    if entry.get("options"):
+        return entry["options"]
+
+    # atime updates are pure write amplification on flash; HDDs keep relatime
+    options = ["rw", "relatime" if storage.get("rotational") else "noatime"]
+    if storage.get("transport") == "usb" or storage.get("removable"):
+        # Batch inode timestamp writes on slow, wear-sensitive USB media
+        options.append("lazytime")
+    if entry["fstype"] == "vfat":
+        options.append(VFAT_OPTIONS)
+    if entry["fstype"] == "btrfs":
+        if entry.get("compress"):
+            options.append(f"compress={entry['compress']}")
+        if entry.get("subvol"):
+            options.append(f"subvol=/{entry['subvol']}")
+    return ",".join(options)
+
+
+def render_swapfiles(swapfiles: List[str]) -> str:
+    return "".join(f"{path}\tnone\tswap\tdefaults\t0 0\n" for path in swapfiles)
+
+
+def render_fstab(layout: List[Dict], storage: Dict, swapfiles: Optional[List[str]] = None) -> str:
+    """Renders /etc/fstab from DiskManager.layout, root first, then any swapfiles."""
+    entries = [e for e in layout if e.get("mountpoint")]
+    entries.sort(key=lambda e: (e["mountpoint"] != "/", e["mountpoint"].count("/"), e["mountpoint"]))
+
+    lines = ["# /etc/fstab: static file system information (generated by the EndOS installer)", ""]
+    for entry in entries:
+        # fsck.btrfs is a no-op; btrfs checks itself on mount
+        if entry["fstype"] in ("swap", "btrfs"):
+            passno = 0
+        else:
+            passno = 1 if entry["mountpoint"] == "/" else 2
+        lines.append(f"# {entry['device']}")
+        lines.append(
+            f"UUID={entry['uuid']}\t{entry['mountpoint']}\t{entry['fstype']}\t"
+            f"{mount_options(entry, storage)}\t0 {passno}"
+        )
+        lines.append("")
+    return "\n".join(lines) + render_swapfiles(swapfiles or [])
+
+
+def covers_layout(layout: List[Dict]) -> bool:
+    """True if the layout describes a mounted root whose UUIDs are all known."""
+    mounted = [e for e in layout if e.get("mountpoint")]
+    return any(e["mountpoint"] == "/" for e in mounted) and all(e.get("uuid") for e in mounted)
@@ -0,0 +1,436 @@
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.btrfs import zstd_compressor
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+CHUNK_SIZE = 16 * 1024 * 1024
+ZSTD_LEVEL = 3
+MAX_WORKERS = 8
+
+# Files that make an installed system unique; replay removes them so the
+# machine makes its own (sshdgenkeys, systemd-random-seed, ...)
+MACHINE_FILES = [
+    "/etc/machine-id",
+    "/var/lib/systemd/random-seed",
+    "/var/lib/systemd/credential.secret",
+]
+MACHINE_GLOB = "/etc/ssh/ssh_host_*"
+
+
+class GoldenImageError(Exception):
+    """Raised when an image can't be captured or doesn't fit this machine."""
+
+
+def zstd_decompressor() -> Optional[Callable[[bytes], bytes]]:
+    try:
+        # Python 3.14+
+        from compression import zstd
+        return zstd.decompress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    except ImportError:
+        return None
+
+
+def partition_path(device: str, number: int) -> str:
+    # nvme0n1 -> nvme0n1p1, sda -> sda1
+    return f"{device}{'p' if device[-1].isdigit() else ''}{number}"
+
+
+def partition_number(device: str, disk: str) -> int:
+    return int(device[len(partition_path(disk, 0)) - 1:])
+
+
+def data_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """(offset, length) of every chunk of a sparse file that holds data."""
+    chunks = []
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError:
+                # ENXIO: nothing but holes from here on
+                break
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            chunk = start - start % chunk_size
+            while chunk < end:
+                length = min(chunk_size, size - chunk)
+                if not chunks or chunks[-1][0] != chunk:
+                    chunks.append((chunk, length))
+                chunk += chunk_size
+            offset = end
+    finally:
+        os.close(fd)
+    return chunks
+
+
+def _compress_chunk(path: str, offset: int, length: int, level: int) -> bytes:
+    compress = zstd_compressor()
+    with open(path, "rb") as f:
+        return compress(os.pread(f.fileno(), length, offset), level)
+
+
+def holes(frames: List[List[int]], size: int) -> List[Tuple[int, int]]:
+    """(offset, length) of every range of a partition image that no frame covers."""
+    result = []
+    position = 0
+    for offset, length, _, _ in sorted(frames):
+        if offset > position:
+            result.append((position, offset - position))
+        position = max(position, offset + length)
+    if position < size:
+        result.append((position, size - position))
+    return result
+
+
+def overlap(ranges: List[Tuple[int, int]], other: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """(offset, length) of what two sorted lists of ranges have in common."""
+    result = []
+    i = j = 0
+    while i < len(ranges) and j < len(other):
+        start = max(ranges[i][0], other[j][0])
+        end = min(ranges[i][0] + ranges[i][1], other[j][0] + other[j][1])
+        if start < end:
+            result.append((start, end - start))
+        if ranges[i][0] + ranges[i][1] < other[j][0] + other[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def ext4_used(dumpe2fs: str) -> List[Tuple[int, int]]:
+    """(offset, length) in bytes of every allocated range (metadata and data) in dumpe2fs output."""
+    block_size = None
+    group = None
+    used = []
+
+    def add(first: int, end: int):
+        if used and used[-1][1] == first:
+            used[-1] = (used[-1][0], end)
+        else:
+            used.append((first, end))
+
+    for line in dumpe2fs.splitlines():
+        line = line.strip()
+        if line.startswith("Block size:"):
+            block_size = int(line.split(":")[1])
+        match = re.match(r"Group \d+: \(Blocks (\d+)-(\d+)\)", line)
+        if match:
+            group = (int(match[1]), int(match[2]) + 1)
+        elif group and line.startswith("Free blocks:"):
+            position, end = group
+            for free in filter(None, (r.strip() for r in line[len("Free blocks:"):].split(","))):
+                first, _, last = free.partition("-")
+                if int(first) > position:
+                    add(position, int(first))
+                position = int(last or first) + 1
+            if position < end:
+                add(position, end)
+            group = None
+    if not block_size:
+        return []
+    return [(first * block_size, (end - first) * block_size) for first, end in used]
+
+
+def _decompress_chunk(image: str, frame_offset: int, frame_size: int, out: str) -> str:
+    decompress = zstd_decompressor()
+    with open(image, "rb") as f:
+        data = decompress(os.pread(f.fileno(), frame_size, frame_offset))
+    with open(out, "wb") as f:
+        f.write(data)
+    return out
+
+
+def capturable(layout: List[Dict]) -> Optional[str]:
+    """Why this layout can't be captured, or None if it can."""
+    if any(e.get("luks_device") for e in layout):
+        # Every replayed machine would share one LUKS master key
+        return "encrypted root"
+    unsupported = {e["fstype"] for e in layout} - {"ext4", "vfat"}
+    if unsupported:
+        return f"no used-block imaging for {', '.join(sorted(unsupported))}"
+    return None
+
+
+class GoldenImage:
+    """
+    Captures a finished install as per-partition images (only used
+    blocks, zstd-compressed in parallel CHUNK_SIZE frames) plus a manifest
+    with the partition layout and install metadata, and writes them back
+    to a disk partitioned the same way.
+    """
+
+    def __init__(self, executor: SystemExecutor, workers: Optional[int] = None):
+        self.executor = executor
+        self.workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+
+    def _device_size(self, device: str) -> Optional[int]:
+        """Size of a block device in bytes; None where the executor can't tell (dry runs)."""
+        result = self.executor.run(["blockdev", "--getsize64", device], check=False)
+        try:
+            return int(result.stdout)
+        except (TypeError, ValueError):
+            return None
+
+    def _zeroes_cheaply(self, disk: str) -> bool:
+        """Whether the disk zeroes ranges without writing them (write-zeroes offload)."""
+        name = os.path.basename(os.path.realpath(disk))
+        try:
+            with open(f"/sys/block/{name}/queue/write_zeroes_max_bytes") as f:
+                return int(f.read()) > 0
+        except (OSError, ValueError):
+            return False
+
+    def _pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("forkserver"))
+
+    def _in_order(self, pool: ProcessPoolExecutor, fn: Callable, args: List[Tuple]):
+        """pool.map, but with only a few chunks in flight so results don't pile up in RAM."""
+        window = self.workers * 2
+        pending = [pool.submit(fn, *a) for a in args[:window]]
+        try:
+            for i in range(len(args)):
+                self.executor.check_cancelled()
+                result = pending.pop(0).result()
+                if i + window < len(args):
+                    pending.append(pool.submit(fn, *args[i + window]))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def capture(self, dest: str, target_disk: str, layout: List[Dict], meta: Dict,
+                progress_cb: Optional[Callable[[float], None]] = None) -> Dict:
+        """
+        Images the (unmounted) filesystems in layout into dest.
+        meta: install details replay needs (boot_mode, separate_boot,
+        username, bootloader settings, packages).
+        """
+        reason = capturable(layout)
+        if reason:
+            raise GoldenImageError(f"Cannot capture this install: {reason}")
+        if zstd_compressor() is None:
+            raise GoldenImageError("No zstd binding available (needs Python 3.14 or zstandard)")
+        os.makedirs(dest, exist_ok=True)
+
+        partitions = []
+        devices = []
+        for entry in layout:
+            if entry["device"] not in devices:
+                devices.append(entry["device"])
+        start = time.monotonic()
+        total_in = total_out = 0
+        for index, device in enumerate(devices):
+            entry = next(e for e in layout if e["device"] == device)
+            number = partition_number(device, target_disk)
+            name = f"part{number}"
+            # Both copy the partition into a sparse file in dest, so the
+            # workers only read files and the device I/O stays with the executor
+            temp = f"{dest}/{name}.raw"
+            if entry["fstype"] == "ext4":
+                # e2image -ra copies only used blocks and metadata, writing
+                # zero blocks as holes
+                self.executor.run(["e2image", "-ra", "-p", device, temp])
+                used = ext4_used(self.executor.run(["dumpe2fs", device]).stdout or "")
+            else:
+                # The ESP is small; take all of it, zero blocks as holes
+                self.executor.run(["dd", f"if={device}", f"of={temp}", "bs=4M", "conv=sparse", "status=none"])
+                used = None
+            # Everything in dest belongs to the user running us, who reads
+            # and removes the copy below (e2image won't write holes into a
+            # file it didn't create, so it can't be made up front)
+            self.executor.run(["chown", f"{os.getuid()}:{os.getgid()}", temp])
+            chunks = data_chunks(temp)
+
+            image = f"{name}.img.zst"
+            frames = []
+            try:
+                with open(f"{dest}/{image}", "wb") as out, self._pool() as pool:
+                    results = self._in_order(
+                        pool, _compress_chunk, [(temp, o, n, ZSTD_LEVEL) for o, n in chunks]
+                    )
+                    for i, ((offset, length), data) in enumerate(zip(chunks, results)):
+                        frames.append([offset, length, out.tell(), len(data)])
+                        out.write(data)
+                        total_in += length
+                        total_out += len(data)
+                        if progress_cb:
+                            progress_cb((index + (i + 1) / len(chunks)) / len(devices))
+                    out.flush()
+                    os.fsync(out.fileno())
+                size = os.path.getsize(temp)
+            finally:
+                if os.path.exists(temp):
+                    os.unlink(temp)
+
+            # Holes that must read back as zeros: allocated blocks (metadata
+            # or file data) that were all zeros. Free space may keep whatever
+            # the target disk held before.
+            zero = holes(frames, size)
+            if used is not None:
+                zero = overlap(zero, used)
+            partitions.append({
+                "number": number,
+                "fstype": entry["fstype"],
+                "size": size,
+                "image": image,
+                "frames": frames,
+                "zero": zero,
+            })
+
+        manifest = dict(meta)
+        manifest.update({
+            "version": FORMAT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "disk_size": self._device_size(target_disk),
+            "chunk_size": CHUNK_SIZE,
+            "partitions": partitions,
+            # Device names are per-machine; replay maps them by partition number
+            "layout": [dict(e, device=None, partuuid=None, number=p["number"])
+                       for e in layout for p in partitions
+                       if partition_number(e["device"], target_disk) == p["number"]],
+        })
+        with open(f"{dest}/{MANIFEST}.tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{dest}/{MANIFEST}.tmp", f"{dest}/{MANIFEST}")
+        elapsed = time.monotonic() - start
+        logger.info(f"Captured {total_in / 1e6:.0f} MB of used blocks as {total_out / 1e6:.0f} MB in {elapsed:.1f}s")
+        return {
+            "capture_mb": round(total_in / (1024 * 1024)),
+            "capture_image_mb": round(total_out / (1024 * 1024)),
+        }
+
+    def load(self, path: str, boot_mode: str) -> Dict:
+        """Reads and checks a manifest (path: its directory) against this machine."""
+        try:
+            with open(f"{path}/{MANIFEST}") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise GoldenImageError(f"Cannot read golden image at {path}: {e}")
+        if manifest.get("version") != FORMAT_VERSION:
+            raise GoldenImageError(f"Unsupported golden image version {manifest.get('version')}")
+        if manifest.get("boot_mode") != boot_mode:
+            raise GoldenImageError(
+                f"Golden image was captured on a {manifest.get('boot_mode')} install, this machine boots {boot_mode}"
+            )
+        if zstd_decompressor() is None:
+            raise GoldenImageError("No zstd binding available (needs Python 3.14 or zstandard)")
+        manifest["path"] = path
+        return manifest
+
+    def restore(self, manifest: Dict, target_disk: str,
+                progress_cb: Optional[Callable[[float], None]] = None) -> List[Dict]:
+        """
+        Writes the images to the partitions partition_disk made on target_disk,
+        gives every filesystem a new UUID and grows it to its partition.
+        Returns the layout (DiskManager.layout format) for the new disk.
+        """
+        parts = manifest["partitions"]
+        for p in parts:
+            device = partition_path(target_disk, p["number"])
+            size = self._device_size(device)
+            if size is not None and size < p["size"]:
+                raise GoldenImageError(f"{device} is smaller than the captured filesystem ({p['size']} bytes)")
+
+        start = time.monotonic()
+        written = 0
+        total = sum(len(p["frames"]) for p in parts)
+        done = 0
+        # Workers decompress frames into files here; the executor writes
+        # them to the device a batch at a time, a few frames behind
+        staging = tempfile.mkdtemp(prefix="endos-restore-")
+        try:
+            with self._pool() as pool:
+                for p in parts:
+                    device = partition_path(target_disk, p["number"])
+                    if self._zeroes_cheaply(target_disk):
+                        # Offloaded: one request for the whole partition
+                        zero = [(0, p["size"])]
+                    else:
+                        zero = [tuple(r) for r in p["zero"]]
+                    image = f"{manifest['path']}/{p['image']}"
+                    chunks = self._in_order(pool, _decompress_chunk, [
+                        (image, f[2], f[3], f"{staging}/{p['number']}-{i}") for i, f in enumerate(p["frames"])
+                    ])
+                    pending = []
+                    for i, ((offset, length, _, _), chunk) in enumerate(zip(p["frames"], chunks)):
+                        pending.append((offset, chunk))
+                        written += length
+                        if len(pending) < self.workers and i + 1 < len(p["frames"]):
+                            continue
+                        self.executor.write_blocks(device, zero, pending)
+                        for _, path in pending:
+                            os.unlink(path)
+                        done += len(pending)
+                        zero, pending = [], []
+                        if progress_cb:
+                            progress_cb(done / total)
+                    if zero:
+                        # No frames at all
+                        self.executor.write_blocks(device, zero, [])
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        elapsed = time.monotonic() - start
+        logger.info(f"Restored {written / 1e6:.0f} MB in {elapsed:.1f}s")
+
+        uuids = {}
+        for p in parts:
+            device = partition_path(target_disk, p["number"])
+            if p["fstype"] == "ext4":
+                new = str(uuid.uuid4())
+                self.executor.run(["e2fsck", "-f", "-p", device])
+                self.executor.run(["tune2fs", "-U", new, device])
+                self.executor.run(["resize2fs", device])
+            else:
+                serial = secrets.token_hex(4).upper()
+                self.executor.run(["fatlabel", "-i", device, serial])
+                new = f"{serial[:4]}-{serial[4:]}"
+            uuids[p["number"]] = new
+
+        layout = []
+        for entry in manifest["layout"]:
+            entry = dict(entry)
+            entry["device"] = partition_path(target_disk, entry["number"])
+            entry["uuid"] = uuids[entry.pop("number")]
+            entry["partuuid"] = ""
+            layout.append(entry)
+        return layout
+
+    def personalize(self, mount_point: str, old_user: str, new_user: str):
+        """Drops the captured machine's identity and renames its user."""
+        with self.executor.batch():
+            for path in MACHINE_FILES:
+                self.executor.remove(f"{mount_point}{path}")
+            for path in glob.glob(f"{mount_point}{MACHINE_GLOB}"):
+                self.executor.remove(path)
+        # A new ID now rather than on first boot, which would also count as
+        # systemd's first boot and apply the unit presets over our choices
+        self.executor.run(["arch-chroot", mount_point, "systemd-machine-id-setup"])
+        if old_user and new_user and old_user != new_user:
+            self.executor.run(["arch-chroot", mount_point, "usermod", "-l", new_user,
+                               "-d", f"/home/{new_user}", "-m", old_user])
+            self.executor.run(["arch-chroot", mount_point, "groupmod", "-n", new_user, old_user], check=False)
@@ -0,0 +1,144 @@
+import glob
+import logging
+import re
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger("EndOS-Installer")
+
+MICROCODE = {"GenuineIntel": "intel-ucode", "AuthenticAMD": "amd-ucode"}
+
+# PCI display controllers (class 0x03) by vendor: firmware, then userspace drivers
+GPU_PACKAGES = {
+    0x1002: ["linux-firmware-amdgpu", "linux-firmware-radeon", "vulkan-radeon"],
+    0x8086: ["linux-firmware-intel", "vulkan-intel", "intel-media-driver"],
+    0x10DE: ["linux-firmware-nvidia", "vulkan-nouveau"],
+}
+
+# Network, wireless and audio devices by PCI vendor -> linux-firmware split package
+PCI_FIRMWARE = {
+    0x8086: "linux-firmware-intel",
+    0x10EC: "linux-firmware-realtek",
+    0x14E4: "linux-firmware-broadcom",
+    0x168C: "linux-firmware-atheros",
+    0x17CB: "linux-firmware-atheros",
+    0x14C3: "linux-firmware-mediatek",
+    0x11AB: "linux-firmware-marvell",
+    0x1B4B: "linux-firmware-marvell",
+    0x15B3: "linux-firmware-mellanox",
+    0x1077: "linux-firmware-qlogic",
+    0x19EE: "linux-firmware-nfp",
+    0x1013: "linux-firmware-cirrus",
+}
+# PCI base classes PCI_FIRMWARE applies to: network, multimedia, wireless
+FIRMWARE_CLASSES = {0x02, 0x04, 0x0D}
+# Network/wireless vendors that need no firmware (virtio, VMware, Hyper-V, QEMU)
+NO_FIRMWARE = {0x1AF4, 0x15AD, 0x1414, 0x1234, 0x1B36}
+
+# USB network and bluetooth adapters by vendor
+USB_FIRMWARE = {
+    0x0BDA: "linux-firmware-realtek",
+    0x0E8D: "linux-firmware-mediatek",
+    0x0CF3: "linux-firmware-atheros",
+    0x8087: "linux-firmware-intel",
+    0x0A5C: "linux-firmware-broadcom",
+}
+
+# Packages the profiler decides on; anything else in the list is left alone
+MANAGED = {"amd-ucode", "intel-ucode", "linux-firmware", "vulkan-radeon", "vulkan-intel",
+           "intel-media-driver", "vulkan-nouveau"}
+MANAGED_PREFIXES = ("linux-firmware-",)
+
+MODALIAS_RE = re.compile(r"^(pci):v0000([0-9A-F]{4})|^(usb):v([0-9A-F]{4})", re.IGNORECASE)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class HardwareProfile:
+    """What the installer needs to know about the machine to pick packages."""
+
+    def __init__(self, cpu_vendor: str = "", pci: Optional[List[Dict]] = None, usb: Optional[Set[int]] = None):
+        self.cpu_vendor = cpu_vendor
+        # {"vendor": int, "class": int (base class)}
+        self.pci = pci or []
+        # USB vendor IDs of network/bluetooth adapters
+        self.usb = usb or set()
+
+    @classmethod
+    def probe(cls, root: str = "") -> "HardwareProfile":
+        cpu_vendor = ""
+        for line in (_read(f"{root}/proc/cpuinfo") or "").splitlines():
+            if line.startswith("vendor_id"):
+                cpu_vendor = line.split(":", 1)[1].strip()
+                break
+
+        pci = []
+        for dev in sorted(glob.glob(f"{root}/sys/bus/pci/devices/*")):
+            vendor, pci_class = _read(f"{dev}/vendor"), _read(f"{dev}/class")
+            if vendor and pci_class:
+                pci.append({"vendor": int(vendor, 16), "class": int(pci_class, 16) >> 16})
+
+        usb = set()
+        # USB NICs show up under /sys/class/net; USB bluetooth adapters under /sys/class/bluetooth
+        for alias in glob.glob(f"{root}/sys/class/net/*/device/modalias") + \
+                glob.glob(f"{root}/sys/class/bluetooth/*/device/modalias"):
+            m = MODALIAS_RE.match(_read(alias) or "")
+            if m and m.group(3):
+                usb.add(int(m.group(4), 16))
+        return cls(cpu_vendor, pci, usb)
+
+    def packages(self) -> Optional[List[str]]:
+        """
+        The microcode, firmware and GPU packages this machine needs, or None
+        if it has a device the tables don't know (keep the full set then).
+        """
+        wanted: List[str] = []
+
+        def add(*names):
+            wanted.extend(n for n in names if n not in wanted)
+
+        if self.cpu_vendor in MICROCODE:
+            add(MICROCODE[self.cpu_vendor])
+        else:
+            add(*MICROCODE.values())
+
+        for dev in self.pci:
+            if dev["class"] == 0x03 and dev["vendor"] in GPU_PACKAGES:
+                add(*GPU_PACKAGES[dev["vendor"]])
+            elif dev["class"] in FIRMWARE_CLASSES:
+                if dev["vendor"] in PCI_FIRMWARE:
+                    add(PCI_FIRMWARE[dev["vendor"]])
+                elif dev["class"] != 0x04 and dev["vendor"] not in NO_FIRMWARE:
+                    logger.info(f"Unknown network device vendor {dev['vendor']:04x}, keeping all firmware")
+                    return None
+        for vendor in sorted(self.usb):
+            if vendor in USB_FIRMWARE:
+                add(USB_FIRMWARE[vendor])
+        return wanted
+
+
+def is_managed(package: str) -> bool:
+    return package in MANAGED or package.startswith(MANAGED_PREFIXES)
+
+
+def rewrite_packages(packages: List[str], hardware: HardwareProfile) -> Dict:
+    """
+    Swaps the list's generic microcode/firmware/GPU packages for the ones
+    the hardware needs. Returns {"packages", "added", "removed"}.
+    """
+    wanted = hardware.packages()
+    if wanted is None:
+        return {"packages": packages, "added": [], "removed": []}
+
+    kept = [p for p in packages if not is_managed(p)]
+    removed = [p for p in packages if is_managed(p) and p not in wanted]
+    added = [p for p in wanted if p not in packages]
+    # Keep the hardware packages where the list had them
+    first = next((i for i, p in enumerate(packages) if is_managed(p)), len(kept))
+    at = len([p for p in packages[:first] if not is_managed(p)])
+    return {"packages": kept[:at] + wanted + kept[at:], "added": added, "removed": removed}
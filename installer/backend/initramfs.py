@@ -0,0 +1,150 @@
+import glob
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+# alpm hooks that (re)build the initramfs whenever kernels, modules or
+# mkinitcpio hooks change. Overriding them with /dev/null disables them.
+MKINITCPIO_HOOKS = ["90-mkinitcpio-install.hook", "60-mkinitcpio-remove.hook"]
+
+HOOK_SCRIPT = "/usr/share/libalpm/scripts/mkinitcpio"
+
+
+class InitramfsManager:
+    """
+    Holds off initramfs generation while packages are installed and the
+    system is configured, then builds every image exactly once.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def hook_dir(self, mount_point: str) -> str:
+        return f"{mount_point}/etc/pacman.d/hooks"
+
+    def pacman_config(self, mount_point: str, base_conf: str = "/etc/pacman.conf",
+                      gpg_dir: Optional[str] = None, cache_dir: Optional[str] = None) -> str:
+        """
+        Writes a copy of the live pacman.conf that also reads hooks from the
+        target, so the overrides apply while pacstrap runs on the host.
+        gpg_dir: keyring to verify packages with, instead of the live one.
+        cache_dir: package cache for pacstrap -c, instead of the live one.
+        Returns its path, for pacstrap -C.
+        """
+        conf_path = "/tmp/endos-pacstrap.conf"
+        try:
+            with open(base_conf) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            lines = ["[options]"]
+
+        out = []
+        for line in lines:
+            out.append(line)
+            if line.strip() == "[options]":
+                out.append(f"HookDir = {self.hook_dir(mount_point)}/")
+                if gpg_dir:
+                    # pacman keeps the first GPGDir it reads
+                    out.append(f"GPGDir = {gpg_dir}/")
+                if cache_dir:
+                    # The first writable CacheDir is where downloads go
+                    out.append(f"CacheDir = {cache_dir}/")
+        self.executor.write_file(conf_path, "\n".join(out) + "\n")
+        return conf_path
+
+    def defer(self, mount_point: str):
+        """Disables the mkinitcpio alpm hooks in the target."""
+        hook_dir = self.hook_dir(mount_point)
+        with self.executor.batch():
+            self.executor.makedirs(hook_dir)
+            for hook in MKINITCPIO_HOOKS:
+                self.executor.symlink("/dev/null", f"{hook_dir}/{hook}")
+
+    def kernels(self, mount_point: str) -> Dict[str, str]:
+        """Maps each installed kernel's pkgbase to its vmlinuz path inside the target."""
+        found = {}
+        for pkgbase_file in glob.glob(f"{mount_point}/usr/lib/modules/*/pkgbase"):
+            try:
+                with open(pkgbase_file) as f:
+                    pkgbase = f.read().strip()
+            except OSError:
+                continue
+            found[pkgbase] = os.path.relpath(os.path.join(os.path.dirname(pkgbase_file), "vmlinuz"), mount_point)
+        return found
+
+    def render_preset(self, pkgbase: str, fallback: bool) -> str:
+        presets = "'default' 'fallback'" if fallback else "'default'"
+        lines = [
+            f"# mkinitcpio preset file for the '{pkgbase}' package (generated by the EndOS installer)",
+            "",
+            f'ALL_kver="/boot/vmlinuz-{pkgbase}"',
+            "",
+            f"PRESETS=({presets})",
+            "",
+            f'default_image="/boot/initramfs-{pkgbase}.img"',
+        ]
+        if fallback:
+            lines += [
+                "",
+                f'fallback_image="/boot/initramfs-{pkgbase}-fallback.img"',
+                'fallback_options="-S autodetect"',
+            ]
+        return "\n".join(lines) + "\n"
+
+    def build(self, mount_point: str, fallback: bool = True,
+              compression: Optional[str] = None) -> Dict:
+        """
+        Re-enables the hooks, writes the presets and compression setting and
+        builds each kernel's images in a single pass. Returns step metrics.
+        """
+        hook_dir = self.hook_dir(mount_point)
+        with self.executor.batch():
+            for hook in MKINITCPIO_HOOKS:
+                self.executor.remove(f"{hook_dir}/{hook}")
+
+        if compression:
+            self.executor.run(
+                [
+                    "sed",
+                    "-i",
+                    f's/^#\\?COMPRESSION=.*/COMPRESSION="{compression}"/',
+                    f"{mount_point}/etc/mkinitcpio.conf",
+                ]
+            )
+
+        kernels = self.kernels(mount_point)
+        if not kernels:
+            logger.warning("No installed kernels found, skipping initramfs generation")
+            return {"images": 0}
+
+        with self.executor.batch():
+            for pkgbase in kernels:
+                self.executor.write_file(
+                    f"{mount_point}/etc/mkinitcpio.d/{pkgbase}.preset",
+                    self.render_preset(pkgbase, fallback),
+                )
+
+        # The hook script copies each vmlinuz to /boot and runs every preset,
+        # exactly as the deferred pacman transaction would have.
+        start = time.monotonic()
+        self.executor.run(
+            ["arch-chroot", mount_point, HOOK_SCRIPT, "install"],
+            input="\n".join(kernels.values()) + "\n",
+        )
+        duration = time.monotonic() - start
+
+        images = len(kernels) * (2 if fallback else 1)
+        # pacstrap would have built default + fallback for every kernel
+        per_image = duration / images
+        saved = per_image * (len(kernels) * 2 - images)
+        logger.info(f"Built {images} initramfs image(s) in {duration:.1f}s (saved ~{saved:.1f}s)")
+        return {
+            "images": images,
+            "fallback": fallback,
+            "compression": compression or "default",
+            "saved_s": round(saved, 1),
+        }
@@ -1,17 +1,77 @@
+import json
 import logging
 import time
 import os
 import subprocess
+import threading
+from contextlib import contextmanager
 from PySide6.QtCore import QObject, Signal, Slot, QThread
-from backend.executor import SystemExecutor, get_executor
-from backend.partition_utils import DiskManager
+from backend.executor import SystemExecutor, InstallCancelled, get_executor
+from backend.partition_utils import BTRFS_TOP, DiskManager
+from backend.bootloader import BootloaderManager
+from backend.initramfs import InitramfsManager
+from backend.locale_utils import LocaleManager
+from backend.venv import VenvProvisioner
+from backend.units import UnitEnabler
+from backend.mirrors import MirrorRanker
+from backend.encryption import EncryptionManager
+from backend.btrfs import choose_zstd_level
+from backend.swap import SwapProvisioner
+from backend.iotuning import InstallIOTuner
+from backend.keyring import KeyringManager, REGEN_UNIT
+from backend.hardware import HardwareProfile, rewrite_packages
+from backend.verify import PackageVerifier
+from backend.golden import GoldenImage, capturable
+from backend.integrity import IntegrityChecker, REPORT_PATH as INTEGRITY_REPORT
+from backend.placement import TMPFS_CACHE, PlacementManager, package_set_mb, plan_placement
+from backend.fstab import render_fstab, render_swapfiles, covers_layout
+from backend.teardown import TeardownManager
+from backend.instrumentation import StepRecorder
+from backend.progress import (ProgressEstimator, ProgressTicker, RECORDED_TIMINGS, estimate_disk_mbps,
+                             load_recorded, load_timings)
+from backend.profile import load_profile
 
 logger = logging.getLogger("EndOS-Installer")
 
+# Every step run_install_steps runs, in order; used to weight the progress bar
+INSTALL_STEPS = [
+    "verify",
+    "partition",
+    "format",
+    "mount",
+    "mirrors",
+    "pacstrap",
+    "swap",
+    "timezone",
+    "locale",
+    "user",
+    "sudoers",
+    "hostname",
+    "services",
+    "bootloader",
+    "replicate",
+    "venv",
+    "integrity",
+    "initramfs",
+    "fstab",
+    "teardown",
+    "capture",
+]
+
+# The steps _run_replay_steps runs instead when installing from a golden image
+REPLAY_STEPS = [
+    "partition",
+    "restore",
+    "mount",
+    "fixup",
+    "bootloader",
+    "teardown",
+]
 
 class InstallWorker(QThread):
-    progress = Signal(float, str)
+    progress = Signal(float, str, float)
     finished = Signal(bool, str)
+    cancelled = Signal()
 
     def __init__(self, installer, config):
         super().__init__()
@@ -22,31 +82,57 @@ class InstallWorker(QThread):
         try:
             self.installer.run_install_steps(self.config, self.report)
             self.finished.emit(True, "Installation Complete")
+        except InstallCancelled:
+            logger.warning("Installation cancelled")
+            self.cancelled.emit()
         except Exception as e:
             logger.error(f"Installation failed: {e}")
             self.finished.emit(False, str(e))
+        finally:
+            self.installer.executor.close()
 
-    def report(self, percent, msg):
-        self.progress.emit(percent, msg)
+    def report(self, percent, msg, eta=0.0):
+        self.progress.emit(percent, msg, eta)
 
 
 class Installer(QObject):
     # Signals
-    progressChanged = Signal(float, str)  # percent, message
+    progressChanged = Signal(float, str, float)  # percent, message, eta (seconds)
     finished = Signal(bool, str)  # success, error_message
+    cancelled = Signal()  # cleanup done, ready to start again
+    disksBenchmarked = Signal()  # new disk benchmark results are available
 
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, simulation=None):
         super().__init__()
-        self._dry_run = dry_run
-        self.executor = get_executor(dry_run)
+        self._dry_run = dry_run or simulation is not None
+        self.executor = get_executor(dry_run, simulation)
         self.disk_manager = DiskManager(self.executor)
+        self.bootloader = BootloaderManager(self.executor)
+        self.initramfs = InitramfsManager(self.executor)
+        self.locales = LocaleManager(self.executor)
+        self.venv = VenvProvisioner(self.executor)
+        self.units = UnitEnabler(self.executor)
+        self.mirrors = MirrorRanker(self.executor)
+        self.encryption = EncryptionManager(self.executor)
+        self.swap = SwapProvisioner(self.executor)
+        self.io_tuner = InstallIOTuner(self.executor)
+        self.keyring = KeyringManager(self.executor)
+        self.placement = PlacementManager(self.executor)
+        self.verifier = PackageVerifier(self.executor)
+        self.integrity = IntegrityChecker(self.executor)
+        self.golden = GoldenImage(self.executor)
+        self.teardown = TeardownManager(self.executor, self._dry_run)
+        self.steps = StepRecorder()
         self._worker = None
+        self._cancel_thread = None
+        self._mount_point = None
         self._is_online = self._check_internet_connection()
 
     def _check_internet_connection(self):
         """Simple check for internet connectivity."""
         if self._dry_run:
-            return True  # Simulate online in dry run for UI testing
+            # Whatever the executor simulates (DryRunExecutor: always online)
+            return self.executor.run(["ping", "-c", "1", "-W", "2", "8.8.8.8"], check=False).returncode == 0
         try:
             # Ping Google DNS
             subprocess.run(
@@ -80,43 +166,125 @@ class Installer(QObject):
         if self._worker and self._worker.isRunning():
             return
 
+        self.executor.reset_cancel()
         self._worker = InstallWorker(self, config)
         self._worker.progress.connect(self.progressChanged)
         self._worker.finished.connect(self.finished)
+        self._worker.cancelled.connect(self.cancelled)
         self._worker.start()
 
-    def run_install_steps(self, config, report_cb):
-        target_disk = config.get("targetDisk")
-        username = config.get("username")
-        password = config.get("password")
-        timezone = config.get("timezone", "UTC")
+    @Slot()
+    def cancelInstall(self):
+        """Stops the running step; the worker then cleans up and emits cancelled."""
+        if not (self._worker and self._worker.isRunning()):
+            return
+        logger.warning("Cancelling installation...")
+        # Terminating the process groups blocks for up to the timeout, keep it off the UI thread
+        self._cancel_thread = threading.Thread(target=self.executor.cancel, daemon=True)
+        self._cancel_thread.start()
+
+    def _cleanup_aborted(self):
+        """Releases the target disk after a cancel or failure so the install can be re-run."""
+        # Until cancel() is through killing children it could take the
+        # cleanup's own umounts with them
+        if self._cancel_thread:
+            self._cancel_thread.join()
+            self._cancel_thread = None
+        self.executor.reset_cancel()
+        # Closes a log file held open on the target before unmounting it
+        self.placement.finish(None)
+        # Mounts outside the target a step may have left behind: a cancel can
+        # land inside the finally that unmounts them. The target itself is
+        # only mounted from the mount step on
+        self.teardown.abort(self._mount_point, [BTRFS_TOP, TMPFS_CACHE, "/tmp/endos-osprobe"])
+        # Mount options went with the mounts; the queue settings outlive them
+        self.io_tuner.restore()
+        self.encryption.close()
 
-        # Helper wrapper
-        def report(p, m):
-            report_cb(p, m)
+    def run_install_steps(self, config, report_cb):
+        profile = load_profile(config)
+        self.steps = StepRecorder()
+        replay = bool(profile["replayImage"])
+        self.progress = ProgressEstimator(self._planned_steps(profile, replay),
+                                          load_timings(profile["stepTimings"]))
+        message = [""]
+
+        def emit():
+            report_cb(self.progress.percent(), message[0], self.progress.eta())
+
+        @contextmanager
+        def step(name, m):
+            self.executor.check_cancelled()
+            message[0] = m
+            self.progress.start(name)
+            emit()
             get_executor(self._dry_run).run(["sleep", "0.2"], check=False)
+            with self.steps.step(name) as metrics:
+                yield metrics
+            self.progress.finish(name, self.steps.steps[-1]["duration"])
+
+        def step_progress(fraction, m):
+            message[0] = m
+            self.progress.step_fraction(fraction)
+            emit()
+
+        ticker = ProgressTicker(emit)
+        ticker.start()
+        self._mount_point = None
+        try:
+            if replay:
+                self._run_replay_steps(config, profile, step, step_progress)
+            else:
+                self._run_steps(config, profile, step, step_progress)
+        except InstallCancelled:
+            message[0] = "Cancelling, cleaning up..."
+            emit()
+            self._cleanup_aborted()
+            raise
+        except Exception:
+            message[0] = "Installation failed, cleaning up..."
+            emit()
+            try:
+                self._cleanup_aborted()
+            except Exception as e:
+                logger.error(f"Cleanup after the failed install failed too: {e}")
+            raise
+        finally:
+            ticker.stop()
+            # The raised queue settings outlive the install; put them back
+            # whatever happened (a no-op once the fstab step has)
+            self.io_tuner.restore()
+
+        report_cb(100, "Done!", 0.0)
+
+    def _planned_steps(self, profile, replay):
+        """The steps that will do work; skipped ones mustn't count towards the ETA."""
+        if replay:
+            return REPLAY_STEPS
+        skipped = set()
+        if not profile["verifyPackages"]:
+            skipped.add("verify")
+        if not profile["integrityCheck"] or self._dry_run:
+            skipped.add("integrity")
+        if not profile["captureImage"] or self._dry_run:
+            skipped.add("capture")
+        return [s for s in INSTALL_STEPS if s not in skipped]
+
+    def _save_timings(self, mount_point):
+        """
+        Stores this run's measured step durations in the target, folded into
+        any the installer was started with. Called before teardown, which
+        the file therefore never includes.
+        """
+        if self._dry_run:
+            return
+        self.executor.makedirs(f"{mount_point}{RECORDED_TIMINGS.parent}")
+        self.executor.write_file(f"{mount_point}{RECORDED_TIMINGS}",
+                                 json.dumps(self.progress.record(load_recorded()), indent=2))
 
-        if not target_disk:
-            raise ValueError("No target disk selected")
-
-        # 1. Partition
-        report(5, f"Partitioning {target_disk}...")
-        self.disk_manager.partition_disk(target_disk)
-
-        # 2. Format
-        report(15, "Formatting partitions...")
-        root_part, boot_part = self.disk_manager.format_partitions(target_disk)
-
-        # 3. Mount
-        report(20, "Mounting filesystems...")
-        mount_point = "/tmp/endos-install-test" if self._dry_run else "/mnt"
-        self.executor.run(["mkdir", "-p", mount_point])
-        self.disk_manager.mount_partitions(root_part, boot_part, mount_point)
-
-        # 4. Package Installation
-        report(30, "Installing system packages...")
-
-        # Get packages from config or defaults
+    def _resolve_packages(self, config, profile, swap_plan):
+        """The package list for pacstrap (config, then the default list) and its metrics."""
+        package_metrics = {}
         packages_str = config.get("packages", "")
         packages = [p.strip() for p in packages_str.split("\n") if p.strip() and not p.strip().startswith("#")]
 
@@ -125,7 +293,7 @@ class Installer(QObject):
             logger.warning("No packages in config, loading from /etc/endos-packages.txt")
             default_packages = self.getDefaultPackages()
             packages = [p.strip() for p in default_packages.split("\n") if p.strip() and not p.strip().startswith("#")]
-        
+
         if not packages:
             # Ultimate fallback if package list file doesn't exist
             logger.error("No package list found! Using minimal fallback.")
@@ -139,63 +307,390 @@ class Installer(QObject):
                 "networkmanager",
             ]
 
-        logger.info(f"Installing {len(packages)} packages...")
+        if profile["hardwarePackages"]:
+            # Only the microcode, firmware and GPU drivers this machine uses
+            rewrite = rewrite_packages(packages, HardwareProfile.probe())
+            packages = rewrite["packages"]
+            if rewrite["removed"] or rewrite["added"]:
+                logger.info(f"Hardware packages: +{rewrite['added']} -{rewrite['removed']}")
+                package_metrics["hw_added"] = len(rewrite["added"])
+                package_metrics["hw_removed"] = len(rewrite["removed"])
+
+        if profile["filesystem"] == "btrfs" and "btrfs-progs" not in packages:
+            packages.append("btrfs-progs")
+        packages += [p for p in self.swap.packages(swap_plan) if p not in packages]
+        return packages, package_metrics
+
+    def _run_steps(self, config, profile, step, step_progress):
+        target_disk = config.get("targetDisk")
+        username = config.get("username")
+        password = config.get("password")
+        timezone = config.get("timezone", "UTC")
 
-        # 5. Pacstrap
-        # Disable capture_output to stream to stdout/stderr for logging visibility
-        self.executor.run(
-            ["pacstrap", "-K", mount_point] + packages, capture_output=False
-        )
+        if not target_disk:
+            raise ValueError("No target disk selected")
 
-        # 6. Fstab
-        report(50, "Generating fstab...")
-        if not self._dry_run:
-            fstab = self.executor.run(
-                ["genfstab", "-U", mount_point], capture_output=True
-            ).stdout
-            self.executor.write_file(f"{mount_point}/etc/fstab", fstab)
+        encrypt = bool(profile["encryption"])
+        self.encryption.luks_uuid = None
+
+        swap_plan = self.swap.plan(profile["zram"], profile["swapfile"], profile["swapfileSize"],
+                                   meminfo=self.executor.meminfo())
+        packages, package_metrics = self._resolve_packages(config, profile, swap_plan)
+
+        # A failing USB stick should stop the install before the disk is wiped
+        with step("verify", "Verifying packages on the install medium...") as metrics:
+            if profile["verifyPackages"]:
+                keyring = self.keyring.source() if profile["reuseKeyring"] else None
+                metrics.update(self.verifier.verify(
+                    packages, gpg_dir=keyring,
+                    progress_cb=lambda f: step_progress(f, "Verifying packages on the install medium..."),
+                ))
+            else:
+                metrics["skipped"] = True
+
+        # 1. Partition
+        with step("partition", f"Partitioning {target_disk}..."):
+            self.disk_manager.partition_disk(target_disk, separate_boot=encrypt)
+
+        # 2. Format
+        with step("format", "Encrypting and formatting partitions..." if encrypt else "Formatting partitions...") as metrics:
+            storage = self.disk_manager.get_storage_profile(target_disk)
+            measured = self.disk_manager.benchmark_result(target_disk)
+            disk_mbps = measured["mbps"] if measured else estimate_disk_mbps(storage)
+            self.progress.update(disk_mbps=disk_mbps)
+            encrypt_root = None
+            if encrypt:
+                def encrypt_root(part):
+                    return self.encryption.format(
+                        part,
+                        config.get("encryptionPassphrase") or password,
+                        rotational=storage["rotational"],
+                        cipher=profile["luksCipher"] or None,
+                        key_size=profile["luksKeySize"] or None,
+                        iter_time_ms=profile["luksIterTime"],
+                    )
+            filesystem = profile["filesystem"]
+            level = profile["btrfsCompressLevel"]
+            if filesystem == "btrfs" and not level:
+                level, _ = choose_zstd_level(disk_mbps)
+            root_part, boot_part = self.disk_manager.format_partitions(
+                target_disk, encrypt_root, filesystem, level or 3
+            )
+            metrics["encrypted"] = encrypt
+            metrics["filesystem"] = filesystem
+            if filesystem == "btrfs":
+                metrics["compress"] = f"zstd:{level}"
+
+        # 3. Mount
+        with step("mount", "Mounting filesystems...") as metrics:
+            mount_point = "/tmp/endos-install-test" if self._dry_run else "/mnt"
+            self._mount_point = mount_point
+            self.executor.makedirs(mount_point)
+            self.disk_manager.mount_partitions(root_part, boot_part, mount_point)
+            if profile["ioTuning"]:
+                metrics.update(self.io_tuner.apply(
+                    target_disk, self.disk_manager.layout, mount_point, profile["ioTuningUnsafe"]
+                ))
+
+        # Rank mirrors while nothing else needs the network
+        with step("mirrors", "Finding the fastest mirrors...") as metrics:
+            if self._is_online and profile["rankMirrors"] and not self._dry_run:
+                self.mirrors.budget = float(profile["mirrorBudget"])
+                metrics.update(self.mirrors.apply())
+            else:
+                metrics["skipped"] = True
+
+        # 4. Package Installation
+        with step("pacstrap", "Installing system packages...") as metrics:
+            metrics.update(package_metrics)
+
+            logger.info(f"Installing {len(packages)} packages...")
+            metrics["packages"] = len(packages)
+            self.progress.update(packages=len(packages))
+
+            # 5. Pacstrap
+            # The initramfs is built once at the end, not on every kernel/hook trigger
+            self.initramfs.defer(mount_point)
+            # Verify with an already populated keyring and copy it over,
+            # rather than having -K build a new one from scratch
+            keyring = self.keyring.source() if profile["reuseKeyring"] else None
+
+            # Package cache and install log in RAM only if the whole set fits
+            placement = plan_placement(package_set_mb(self.executor, packages, "/etc/pacman.conf"),
+                                       self.executor.meminfo())
+            metrics.update({f"placement_{k}": v for k, v in placement.items()})
+            self.placement.start_log(placement, mount_point)
+            cache_dir = self.placement.cache_dir(placement)
+            pacman_conf = self.initramfs.pacman_config(mount_point, gpg_dir=keyring, cache_dir=cache_dir)
+
+            # -c: use the tmpfs cache from pacman_conf instead of the target's
+            flags = ([] if keyring else ["-K"]) + (["-c"] if cache_dir else [])
+            # Disable capture_output to stream to stdout/stderr for logging visibility
+            self.executor.run(
+                ["pacstrap"] + flags + ["-C", pacman_conf, mount_point] + packages,
+                capture_output=False,
+            )
+            # Nothing needs the downloaded packages any more; give the RAM back
+            self.placement.release()
+            self.mirrors.write_target(mount_point)
+            if keyring:
+                metrics.update(self.keyring.install(mount_point, keyring))
+            else:
+                metrics["keyring"] = "pacstrap -K"
+
+        # Memory: zram, optional swapfile and VM sysctls
+        with step("swap", "Setting up swap...") as metrics:
+            metrics.update(self.swap.provision(mount_point, swap_plan, filesystem, storage["rotational"]))
+            swapfiles = [metrics["swapfile"]] if "swapfile" in metrics else []
 
         # 7. Timezone
-        report(55, f"Setting timezone to {timezone}...")
-        self.executor.run(
-            [
-                "ln",
-                "-sf",
-                f"/usr/share/zoneinfo/{timezone}",
-                f"{mount_point}/etc/localtime",
-            ]
-        )
-        self.executor.run(["arch-chroot", mount_point, "hwclock", "--systohc"])
+        with step("timezone", f"Setting timezone to {timezone}..."):
+            self.executor.symlink(f"/usr/share/zoneinfo/{timezone}", f"{mount_point}/etc/localtime")
+            self.executor.run(["arch-chroot", mount_point, "hwclock", "--systohc"])
 
         # 8. Localization
-        report(58, "Configuring locale...")
-        self.executor.run(
-            [
-                "sed",
-                "-i",
-                "s/#en_US.UTF-8 UTF-8/en_US.UTF-8 UTF-8/",
-                f"{mount_point}/etc/locale.gen",
-            ]
-        )
-        self.executor.run(["arch-chroot", mount_point, "locale-gen"])
-        self.executor.write_file(f"{mount_point}/etc/locale.conf", "LANG=en_US.UTF-8")
+        with step("locale", "Configuring locale...") as metrics:
+            locales = config.get("locales") or ["en_US.UTF-8"]
+            metrics.update(self.locales.provision(mount_point, locales))
 
         # 9. User Setup
-        report(65, f"Creating user {username}...")
-        self.executor.run(
-            [
-                "arch-chroot",
+        with step("user", f"Creating user {username}..."):
+            self.executor.run(
+                [
+                    "arch-chroot",
+                    mount_point,
+                    "useradd",
+                    "-m",
+                    "-G",
+                    "wheel,video,audio,storage,input",
+                    "-s",
+                    "/bin/bash",
+                    username,
+                ]
+            )
+
+            self._set_passwords(mount_point, username, password)
+
+        # Sudoers
+        with step("sudoers", "Configuring sudoers..."):
+            self.executor.run(
+                [
+                    "sed",
+                    "-i",
+                    "s/# %wheel ALL=(ALL:ALL) ALL/%wheel ALL=(ALL:ALL) ALL/",
+                    f"{mount_point}/etc/sudoers",
+                ]
+            )
+
+        # Hostname
+        with step("hostname", "Setting hostname..."):
+            self._write_hostname(mount_point)
+
+        # 10. Enable Services
+        with step("services", "Enabling system services...") as metrics:
+            services = list(profile["services"])
+            if keyring:
+                services.append(REGEN_UNIT)
+            if not storage["rotational"]:
+                services.append("fstrim.timer")
+            metrics.update(self.units.enable(mount_point, services))
+
+        # 11. Bootloader
+        loader = profile["bootloader"]
+        with step("bootloader", f"Installing bootloader ({'systemd-boot' if loader == 'systemd-boot' else 'GRUB'})..."):
+            probe_disks = profile["osProberDisks"] if profile["osProber"] else None
+            # Adds the unlock hook before the initramfs is built at the end
+            crypt_params = self.encryption.configure_target(mount_point) if encrypt else ""
+            self.bootloader.install(
                 mount_point,
-                "useradd",
-                "-m",
-                "-G",
-                "wheel,video,audio,storage,input",
-                "-s",
-                "/bin/bash",
-                username,
-            ]
-        )
+                self.disk_manager.get_boot_mode(),
+                target_disk,
+                root_part,
+                boot_part,
+                packages,
+                loader=loader,
+                cmdline=profile["kernelCmdline"],
+                probe_disks=probe_disks,
+                fallback=profile["initramfsFallback"],
+                uuids={e["device"]: e["uuid"] for e in self.disk_manager.layout},
+                crypt_params=crypt_params,
+                root_subvol="@" if filesystem == "btrfs" else "",
+            )
+
+        # 12. Post-Config (Replica)
+        with step("replicate", "Replicating environment..."):
+            if not self._dry_run:
+                # Copy skel to /etc/skel (preserve permissions)
+                self.executor.run(["cp", "-a", "/etc/skel/.", f"{mount_point}/etc/skel/"])
+
+                # Copy skel to user home
+                user_home = f"{mount_point}/home/{username}"
+                self.executor.run(["cp", "-a", "/etc/skel/.", f"{user_home}/"])
+                self.executor.run(
+                    [
+                        "arch-chroot",
+                        mount_point,
+                        "chown",
+                        "-R",
+                        f"{username}:{username}",
+                        f"/home/{username}",
+                    ]
+                )
+
+        # Quickshell Venv
+        with step("venv", "Setting up Python environment...") as metrics:
+            if not self._dry_run:
+                metrics.update(self.venv.provision(mount_point))
+
+        # Read every installed file back from the disk; bad USB-SATA bridges
+        # truncate files silently. Before the initramfs, so a repaired
+        # kernel or module package still ends up in it.
+        with step("integrity", "Checking installed files...") as metrics:
+            if profile["integrityCheck"] and not self._dry_run:
+                metrics.update(self._check_integrity(mount_point, pacman_conf, profile, step_progress))
+            else:
+                metrics["skipped"] = True
+
+        # 13. Initramfs (single pass, after every package and config change)
+        with step("initramfs", "Generating initramfs...") as metrics:
+            metrics.update(
+                self.initramfs.build(
+                    mount_point,
+                    fallback=profile["initramfsFallback"],
+                    compression=profile["initramfsCompression"],
+                )
+            )
+
+        # 14. Fstab, once the install-time tuning is undone, so genfstab
+        # and the live mounts agree with what the system will boot with
+        with step("fstab", "Generating fstab...") as metrics:
+            self.io_tuner.restore(mount_point, storage)
+            if covers_layout(self.disk_manager.layout):
+                # Rendered from what we created; no need to re-probe every mount
+                metrics["source"] = "native"
+                fstab = render_fstab(self.disk_manager.layout, storage, swapfiles)
+                self.executor.write_file(f"{mount_point}/etc/fstab", fstab)
+            elif not self._dry_run:
+                metrics["source"] = "genfstab"
+                fstab = self.executor.run(
+                    ["genfstab", "-U", mount_point], capture_output=True
+                ).stdout
+                # genfstab only lists active swap
+                self.executor.write_file(f"{mount_point}/etc/fstab", fstab + render_swapfiles(swapfiles))
+
+        # Keep this run's timings and log with the installed system for support
+        self.placement.finish(mount_point)
+        self.executor.makedirs(f"{mount_point}/var/log/endos-installer")
+        self.executor.write_file(f"{mount_point}/var/log/endos-installer/steps.json",
+                                 json.dumps(self.steps.steps, indent=2))
+        self._save_timings(mount_point)
+
+        # 15. Teardown: flush and unmount so "Done" means the data is on disk
+        with step("teardown", "Flushing data to disk...") as metrics:
+            metrics.update(
+                self.teardown.teardown(
+                    mount_point,
+                    [e["mountpoint"] for e in self.disk_manager.layout if e.get("mountpoint")],
+                    step_progress,
+                )
+            )
+            self.encryption.close()
+
+        # Golden image of this install, for replaying onto identical machines
+        with step("capture", "Capturing system image...") as metrics:
+            reason = capturable(self.disk_manager.layout)
+            if not profile["captureImage"] or self._dry_run:
+                metrics["skipped"] = True
+            elif reason:
+                logger.warning(f"Not capturing a golden image: {reason}")
+                metrics["skipped"] = True
+            else:
+                meta = {
+                    "boot_mode": self.disk_manager.get_boot_mode(),
+                    "separate_boot": encrypt,
+                    "username": username,
+                    "swapfiles": swapfiles,
+                    "loader": loader,
+                    "cmdline": profile["kernelCmdline"],
+                    "fallback": profile["initramfsFallback"],
+                    "packages": packages,
+                }
+                metrics.update(self.golden.capture(
+                    profile["captureImage"], target_disk, self.disk_manager.layout, meta,
+                    lambda f: step_progress(f, "Capturing system image..."),
+                ))
+
+        logger.info(f"Step timings:\n{self.steps.summary()}")
+
+    def _run_replay_steps(self, config, profile, step, step_progress):
+        """
+        Installs from a golden image (see GoldenImage.capture) instead of
+        packages: partition, write the image, then redo only what is per
+        machine.
+        """
+        target_disk = config.get("targetDisk")
+        username = config.get("username")
+        password = config.get("password")
+
+        if not target_disk:
+            raise ValueError("No target disk selected")
+        manifest = self.golden.load(profile["replayImage"], self.disk_manager.get_boot_mode())
+
+        with step("partition", f"Partitioning {target_disk}..."):
+            self.disk_manager.partition_disk(target_disk, separate_boot=manifest["separate_boot"])
+
+        with step("restore", "Writing the system image...") as metrics:
+            storage = self.disk_manager.get_storage_profile(target_disk)
+            self.disk_manager.layout = self.golden.restore(
+                manifest, target_disk, lambda f: step_progress(f, "Writing the system image...")
+            )
+            metrics["partitions"] = len(manifest["partitions"])
+        layout = self.disk_manager.layout
+        root_part = next(e["device"] for e in layout if e["mountpoint"] == "/")
+        boot_part = next((e["device"] for e in layout if e["mountpoint"] == "/boot"), None)
+
+        with step("mount", "Mounting filesystems...") as metrics:
+            mount_point = "/tmp/endos-install-test" if self._dry_run else "/mnt"
+            self._mount_point = mount_point
+            self.executor.makedirs(mount_point)
+            self.disk_manager.mount_partitions(root_part, boot_part, mount_point)
+
+        with step("fixup", f"Setting up this machine for {username}..."):
+            self.golden.personalize(mount_point, manifest["username"], username)
+            self._set_passwords(mount_point, username, password)
+            self._write_hostname(mount_point)
+            self.executor.write_file(f"{mount_point}/etc/fstab",
+                                     render_fstab(layout, storage, manifest["swapfiles"]))
+
+        # Installs the boot code (not part of any partition image) and writes
+        # the entries for the new UUIDs
+        with step("bootloader", "Installing bootloader..."):
+            self.bootloader.install(
+                mount_point,
+                manifest["boot_mode"],
+                target_disk,
+                root_part,
+                boot_part,
+                manifest["packages"],
+                loader=manifest["loader"],
+                cmdline=manifest["cmdline"],
+                fallback=manifest["fallback"],
+                uuids={e["device"]: e["uuid"] for e in layout},
+            )
+
+        self._save_timings(mount_point)
+        with step("teardown", "Flushing data to disk...") as metrics:
+            metrics.update(
+                self.teardown.teardown(
+                    mount_point,
+                    [e["mountpoint"] for e in layout if e.get("mountpoint")],
+                    step_progress,
+                )
+            )
 
+        logger.info(f"Step timings:\n{self.steps.summary()}")
+
+    def _set_passwords(self, mount_point, username, password):
         # Set password securely
         if not self._dry_run:
             # chpasswd expects "user:password" on stdin
@@ -216,94 +711,50 @@ class Installer(QObject):
         else:
             logger.info(f"[DRY-RUN] Setting password for {username}")
 
-        # Sudoers
-        report(70, "Configuring sudoers...")
-        self.executor.run(
-            [
-                "sed",
-                "-i",
-                "s/# %wheel ALL=(ALL:ALL) ALL/%wheel ALL=(ALL:ALL) ALL/",
-                f"{mount_point}/etc/sudoers",
-            ]
-        )
-
-        # Hostname
-        report(72, "Setting hostname...")
-        self.executor.write_file(f"{mount_point}/etc/hostname", "endos")
+    def _write_hostname(self, mount_point):
         hosts_content = "127.0.0.1\tlocalhost\n::1\t\tlocalhost\n127.0.1.1\tendos.localdomain\tendos\n"
-        self.executor.write_file(f"{mount_point}/etc/hosts", hosts_content)
-
-        # 10. Enable Services
-        report(75, "Enabling system services...")
-        services = ["NetworkManager", "bluetooth", "sddm", "greetd"]
-        for svc in services:
-            self.executor.run(
-                ["arch-chroot", mount_point, "systemctl", "enable", svc], check=False
-            )
-
-        # 11. Bootloader
-        report(80, "Installing bootloader (GRUB)...")
-        # Ensure packages are installed (they should be in the list)
-        self.executor.run(
-            [
-                "arch-chroot",
-                mount_point,
-                "grub-install",
-                "--target=x86_64-efi",
-                "--efi-directory=/boot",
-                "--bootloader-id=EndOS",
-            ],
-            capture_output=False,
-        )
-
-        # Configure GRUB for seamless boot (add quiet splash)
-        self.executor.run(
-            [
-                "sed",
-                "-i",
-                's/GRUB_CMDLINE_LINUX_DEFAULT="loglevel=3 quiet"/GRUB_CMDLINE_LINUX_DEFAULT="loglevel=3 quiet splash"/',
-                f"{mount_point}/etc/default/grub",
-            ]
-        )
-        self.executor.run(
-            ["arch-chroot", mount_point, "grub-mkconfig", "-o", "/boot/grub/grub.cfg"],
-            capture_output=False,
+        with self.executor.batch():
+            self.executor.write_file(f"{mount_point}/etc/hostname", "endos")
+            self.executor.write_file(f"{mount_point}/etc/hosts", hosts_content)
+
+    def _check_integrity(self, mount_point, pacman_conf, profile, step_progress):
+        budget = float(profile["integrityBudget"])
+        result = self.integrity.check(
+            mount_point, budget, lambda f: step_progress(f, "Checking installed files...")
         )
-
-        # 12. Post-Config (Replica)
-        report(90, "Replicating environment...")
-
-        if not self._dry_run:
-            # Copy skel to /etc/skel (preserve permissions)
-            self.executor.run(["cp", "-a", "/etc/skel/.", f"{mount_point}/etc/skel/"])
-
-            # Copy skel to user home
-            user_home = f"{mount_point}/home/{username}"
-            self.executor.run(["cp", "-a", "/etc/skel/.", f"{user_home}/"])
-            self.executor.run(
-                [
-                    "arch-chroot",
-                    mount_point,
-                    "chown",
-                    "-R",
-                    f"{username}:{username}",
-                    f"/home/{username}",
-                ]
+        repaired = []
+        if result["bad"] and profile["integrityRepair"]:
+            step_progress(1.0, f"Reinstalling {len(result['bad'])} damaged packages...")
+            self.integrity.repair(mount_point, pacman_conf, result["bad"])
+            recheck = self.integrity.check(mount_point, budget, packages=result["bad"])
+            repaired = [p for p in result["bad"] if p not in recheck["bad"]]
+            result["packages"] = recheck["packages"]
+            result["bad"] = recheck["bad"]
+        result["repaired"] = repaired
+
+        self.executor.makedirs(f"{mount_point}{os.path.dirname(INTEGRITY_REPORT)}")
+        self.executor.write_file(f"{mount_point}{INTEGRITY_REPORT}", json.dumps(result, indent=2))
+        if result["bad"]:
+            raise RuntimeError(
+                f"Damaged files on the target disk in: {', '.join(result['bad'])}. "
+                f"Check the disk and its connection; details in {INTEGRITY_REPORT}"
             )
-
-            # Quickshell Venv Replication
-            venv_src = "/usr/share/quickshell/venv"
-            venv_dest = f"{mount_point}/usr/share/quickshell/venv"
-            if os.path.exists(venv_src):
-                self.executor.run(["mkdir", "-p", os.path.dirname(venv_dest)])
-                self.executor.run(["cp", "-a", venv_src, venv_dest])
-
-        report(100, "Done!")
+        return {
+            "integrity_checked": result["checked"],
+            "integrity_total": result["total"],
+            "integrity_mb": round(result["bytes"] / (1024 * 1024)),
+            "integrity_repaired": len(repaired),
+        }
 
     # Helper for Disk Page
     @Slot(result=list)
     def scanDisks(self):
-        return self.disk_manager.list_disks()
+        disks = self.disk_manager.list_disks()
+        # Results arrive via disksBenchmarked; the UI rescans to pick them up.
+        # Dry runs list made-up devices, which must not be opened on this machine
+        if not self._dry_run:
+            self.disk_manager.start_benchmarks(disks, self.disksBenchmarked.emit)
+        return disks
 
     @Slot(result=list)
     def getTimezones(self):
@@ -0,0 +1,49 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+from backend.sysinfo import read_pressure
+
+logger = logging.getLogger("EndOS-Installer")
+
+
+class StepRecorder:
+    """
+    Records the duration of each named install step, plus any metrics the
+    step attaches and the memory pressure (PSI stall time) it ran under.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict] = []
+
+    @contextmanager
+    def step(self, name: str):
+        record = {"name": name, "duration": 0.0, "metrics": {}}
+        self.steps.append(record)
+        start = time.monotonic()
+        pressure = read_pressure("memory")
+        try:
+            yield record["metrics"]
+        finally:
+            record["duration"] = time.monotonic() - start
+            after = read_pressure("memory")
+            # Time some/all tasks were stalled waiting for memory during the step
+            for kind in ("some", "full"):
+                stall_ms = (after.get(kind, 0) - pressure.get(kind, 0)) // 1000
+                if stall_ms > 0:
+                    record["metrics"][f"mem_stall_{kind}_ms"] = stall_ms
+            logger.info(f"Step '{name}' took {record['duration']:.1f}s")
+
+    def durations(self) -> Dict[str, float]:
+        return {s["name"]: s["duration"] for s in self.steps}
+
+    def summary(self) -> str:
+        lines = []
+        for s in self.steps:
+            line = f"{s['name']:<16} {s['duration']:7.1f}s"
+            if s["metrics"]:
+                line += "  " + ", ".join(f"{k}={v}" for k, v in s["metrics"].items())
+            lines.append(line)
+        total = sum(s["duration"] for s in self.steps)
+        lines.append(f"{'total':<16} {total:7.1f}s")
+        return "\n".join(lines)
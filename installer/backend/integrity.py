@@ -0,0 +1,202 @@
+import glob
+import gzip
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import stat
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+from backend.executor import SystemExecutor
+from backend.teardown import mounts_under, syncfs
+from backend.verify import CHUNK, parse_desc
+
+logger = logging.getLogger("EndOS-Installer")
+
+LOCAL_DB = "/var/lib/pacman/local"
+REPORT_PATH = "/var/log/endos-installer/integrity.json"
+MAX_WORKERS = 8
+
+ESCAPE_RE = re.compile(r"\\([0-7]{3})")
+
+
+def _unescape(path: str) -> str:
+    # mtree escapes spaces and other special characters as \ooo
+    return ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 8)), path)
+
+
+def parse_mtree(text: str) -> List[Dict[str, str]]:
+    """A package's mtree as [{"path", "type", "size", "sha256digest", ...}], /set defaults applied."""
+    defaults: Dict[str, str] = {}
+    entries = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        if fields[0] == "/set":
+            defaults.update(f.split("=", 1) for f in fields[1:] if "=" in f)
+            continue
+        if fields[0] == "/unset":
+            for key in fields[1:]:
+                defaults.pop(key, None)
+            continue
+        path = _unescape(fields[0])
+        # ./.PKGINFO, ./.BUILDINFO, ./.MTREE, ./.INSTALL live in the local DB, not the tree
+        if path.startswith("./."):
+            continue
+        entry = dict(defaults)
+        entry.update(f.split("=", 1) for f in fields[1:] if "=" in f)
+        entry["path"] = path[2:] if path.startswith("./") else path.lstrip("/")
+        entries.append(entry)
+    return entries
+
+
+def _digest(path: str, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        # Read what is on the disk, not what the install left in the page cache
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            block = f.read(CHUNK)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def check_package(root: str, db_dir: str, deadline: float) -> Dict:
+    """
+    Checks one installed package's files against its mtree (type, size,
+    link target, sha256/md5). Stops at deadline (time.monotonic()).
+    Files listed in %BACKUP% are expected to change and are skipped.
+    """
+    with open(f"{db_dir}/desc") as f:
+        desc = parse_desc(f.read())
+    name = desc.get("NAME", os.path.basename(db_dir))
+    backup = {line.split("\t")[0] for line in desc.get("BACKUP", "").splitlines()}
+    report = {"package": name, "checked": 0, "bytes": 0, "missing": [], "corrupt": [], "complete": False}
+
+    with gzip.open(f"{db_dir}/mtree", "rt", errors="replace") as f:
+        entries = parse_mtree(f.read())
+
+    for entry in entries:
+        if time.monotonic() > deadline:
+            return report
+        rel = entry["path"]
+        if rel in backup:
+            continue
+        path = f"{root}/{rel}"
+        kind = entry.get("type", "file")
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            report["missing"].append(rel)
+            continue
+        except OSError:
+            report["corrupt"].append(rel)
+            continue
+        report["checked"] += 1
+        if kind == "dir":
+            if not stat.S_ISDIR(st.st_mode):
+                report["corrupt"].append(rel)
+        elif kind == "link":
+            if not stat.S_ISLNK(st.st_mode) or os.readlink(path) != _unescape(entry.get("link", "")):
+                report["corrupt"].append(rel)
+        elif kind == "file":
+            if not stat.S_ISREG(st.st_mode) or ("size" in entry and st.st_size != int(entry["size"])):
+                report["corrupt"].append(rel)
+                continue
+            algorithm = "sha256" if "sha256digest" in entry else "md5" if "md5digest" in entry else None
+            if not algorithm:
+                continue
+            try:
+                if _digest(path, algorithm) != entry[f"{algorithm}digest"]:
+                    report["corrupt"].append(rel)
+            except PermissionError:
+                continue
+            except OSError:
+                # EIO: the very thing we're looking for
+                report["corrupt"].append(rel)
+                continue
+            report["bytes"] += st.st_size
+    report["complete"] = True
+    return report
+
+
+class IntegrityChecker:
+    """
+    Verifies the installed files against the target's package mtrees,
+    split by package across a process pool, within a time budget.
+    """
+
+    def __init__(self, executor: SystemExecutor, workers: Optional[int] = None):
+        self.executor = executor
+        self.workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+
+    def check(self, mount_point: str, budget: float = 300.0,
+              progress_cb: Optional[Callable[[float], None]] = None,
+              packages: Optional[List[str]] = None) -> Dict:
+        """
+        Returns {"packages": [per-package report with problems], "checked",
+        "total", "bytes", "seconds", "bad": [package names]}. Packages not
+        reached within the budget count as unchecked, not bad.
+        packages: check only these (e.g. after a repair).
+        """
+        db_dirs = sorted(glob.glob(f"{mount_point}{LOCAL_DB}/*/"))
+        db_dirs = [d.rstrip("/") for d in db_dirs if os.path.exists(f"{d}mtree")]
+        if packages is not None:
+            wanted = set(packages)
+            db_dirs = [d for d in db_dirs if os.path.basename(d).rsplit("-", 2)[0] in wanted]
+        if not db_dirs:
+            return {"packages": [], "checked": 0, "total": 0, "bytes": 0, "seconds": 0.0, "bad": []}
+
+        # Dirty pages can't be dropped; flush them so every read hits the disk
+        for mnt in mounts_under(mount_point):
+            try:
+                syncfs(mnt)
+            except OSError as e:
+                logger.warning(f"syncfs {mnt}: {e}")
+
+        start = time.monotonic()
+        deadline = start + budget
+        reports = []
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            futures = [pool.submit(check_package, mount_point, d, deadline) for d in db_dirs]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    self.executor.check_cancelled()
+                    try:
+                        reports.append(future.result())
+                    except Exception as e:
+                        logger.warning(f"Integrity check failed for a package: {e}")
+                    if progress_cb:
+                        progress_cb(done / len(futures))
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        elapsed = time.monotonic() - start
+
+        bad = [r for r in reports if r["missing"] or r["corrupt"]]
+        checked = sum(1 for r in reports if r["complete"])
+        total_bytes = sum(r["bytes"] for r in reports)
+        for r in bad:
+            logger.error(f"{r['package']}: {len(r['missing'])} missing, {len(r['corrupt'])} corrupt "
+                         f"(e.g. {(r['missing'] + r['corrupt'])[0]})")
+        logger.info(f"Integrity: {checked}/{len(db_dirs)} packages fully checked, "
+                    f"{total_bytes / 1e6:.0f} MB in {elapsed:.1f}s")
+        return {
+            "packages": bad,
+            "checked": checked,
+            "total": len(db_dirs),
+            "bytes": total_bytes,
+            "seconds": round(elapsed, 1),
+            "bad": sorted(r["package"] for r in bad),
+        }
+
+    def repair(self, mount_point: str, pacman_conf: str, packages: List[str]):
+        """Reinstalls just the given packages into the target."""
+        logger.info(f"Reinstalling damaged packages: {' '.join(packages)}")
+        self.executor.run(["pacstrap", "-C", pacman_conf, mount_point] + packages, capture_output=False)
@@ -0,0 +1,118 @@
+import logging
+import os
+from typing import Dict, List, Optional
+from backend.executor import SystemExecutor
+from backend.fstab import mount_options
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Mount options while the install runs. A crash mid-install means starting
+# over, so giving up crash consistency for throughput costs nothing.
+INSTALL_OPTIONS = {
+    # ext4 can't switch data= on remount; dropping barriers is the
+    # remountable equivalent of writeback's relaxed ordering
+    "ext4": {"safe": "noatime,commit=60", "unsafe": "barrier=0"},
+    "btrfs": {"safe": "noatime,commit=120", "unsafe": "nobarrier"},
+}
+
+# What INSTALL_OPTIONS changed, back at the kernel defaults
+DURABLE_OPTIONS = {
+    "ext4": "commit=5,barrier=1",
+    "btrfs": "commit=30,barrier",
+}
+
+# Options the VFS keeps per mount rather than per filesystem; every btrfs
+# subvolume mount needs these, the rest only once per filesystem
+MOUNT_OPTIONS = {"ro", "rw", "noatime", "atime", "relatime", "strictatime", "nodiratime", "diratime",
+                 "nosuid", "suid", "nodev", "dev", "noexec", "exec"}
+
+# Block queue settings for the duration of the install
+QUEUE_SETTINGS = {"nr_requests": 1024, "read_ahead_kb": 4096}
+
+
+class InstallIOTuner:
+    """
+    Write-optimised mount and block queue settings for the install, and
+    the final durable settings restored before fstab generation and teardown.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+        # sysfs path -> original value
+        self._saved_queue: Dict[str, str] = {}
+        self._tuned_mounts: List[Dict] = []
+
+    def _queue_dirs(self, disk: str, layout: List[Dict]) -> List[str]:
+        devices = [disk] + [e["device"] for e in layout if e["device"].startswith("/dev/mapper/")]
+        dirs = []
+        for dev in devices:
+            name = os.path.basename(os.path.realpath(dev))
+            path = f"/sys/block/{name}/queue"
+            if path not in dirs:
+                dirs.append(path)
+        return dirs
+
+    def _set(self, path: str, value: str) -> bool:
+        try:
+            self.executor.write_file(path, value, atomic=False)
+            return True
+        except Exception as e:
+            # e.g. nr_requests above what the hardware queue allows
+            logger.debug(f"Could not set {path} to {value}: {e}")
+            return False
+
+    def apply(self, disk: str, layout: List[Dict], mount_point: str, unsafe: bool = False) -> Dict:
+        """Returns step metrics."""
+        for queue in self._queue_dirs(disk, layout):
+            for attr, value in QUEUE_SETTINGS.items():
+                path = f"{queue}/{attr}"
+                try:
+                    with open(path) as f:
+                        original = f.read().strip()
+                except OSError:
+                    continue
+                if original.isdigit() and int(original) >= value:
+                    continue
+                if self._set(path, str(value)):
+                    self._saved_queue[path] = original
+
+        self._tuned_mounts = []
+        seen = set()
+        for entry in layout:
+            options = INSTALL_OPTIONS.get(entry["fstype"])
+            if not options or not entry.get("mountpoint"):
+                continue
+            opts = options["safe"] + (f",{options['unsafe']}" if unsafe else "")
+            self._remount(mount_point, entry, opts, seen)
+            self._tuned_mounts.append(entry)
+
+        return {"queues": len(self._saved_queue), "remounted": len(self._tuned_mounts), "unsafe": unsafe}
+
+    def restore(self, mount_point: Optional[str] = None, storage: Optional[Dict] = None):
+        """Puts back the queue settings and, if mount_point is given, durable mount options."""
+        if mount_point:
+            seen = set()
+            for entry in self._tuned_mounts:
+                final = mount_options(entry, storage or {})
+                # subvol= can't change on remount and isn't needed for it
+                final = ",".join(o for o in final.split(",") if not o.startswith("subvol="))
+                self._remount(mount_point, entry, f"{final},{DURABLE_OPTIONS[entry['fstype']]}", seen)
+        self._tuned_mounts = []
+
+        for path, original in self._saved_queue.items():
+            self._set(path, original)
+        self._saved_queue = {}
+
+    def _remount(self, mount_point: str, entry: Dict, options: str, seen: set):
+        """
+        Remounts entry. Filesystem-wide options go only with the first mount
+        of each filesystem (seen: uuids already done), per-mount ones with all.
+        """
+        if entry["uuid"] in seen:
+            options = ",".join(o for o in options.split(",") if o in MOUNT_OPTIONS)
+        seen.add(entry["uuid"])
+        if options:
+            self.executor.run(["mount", "-o", f"remount,{options}", self._path(mount_point, entry)], check=False)
+
+    def _path(self, mount_point: str, entry: Dict) -> str:
+        return mount_point if entry["mountpoint"] == "/" else f"{mount_point.rstrip('/')}{entry['mountpoint']}"
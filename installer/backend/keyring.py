@@ -0,0 +1,96 @@
+import logging
+import os
+from typing import Dict, Optional
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+GNUPG_DIR = "/etc/pacman.d/gnupg"
+# Populated keyring built into the ISO by customize_airootfs.sh, usable
+# before pacman-init.service has finished on the live system
+SNAPSHOT_DIR = "/usr/share/endos/pacman-keyring"
+
+REGEN_UNIT = "endos-pacman-keyring.service"
+REGEN_SCRIPT = "/usr/local/lib/endos/regen-pacman-keyring"
+# Present in a copied keyring until the target has made its own
+REGEN_MARKER = ".endos-regenerate"
+
+# Never leaves the live system: the private master key (and gpg-agent's
+# sockets). The public half stays, so the local signatures it made on the
+# archlinux keys still verify.
+EXCLUDE = ["private-keys-v1.d", "secring.gpg", "openpgp-revocs.d", "S.*"]
+
+REGEN_SCRIPT_BODY = f"""#!/bin/bash
+# Replaces the keyring copied in by the installer with one whose master key
+# was generated on this machine. The old one keeps working until the swap.
+set -e
+new={GNUPG_DIR}.new
+rm -rf "$new"
+pacman-key --gpgdir "$new" --init
+pacman-key --gpgdir "$new" --populate
+gpgconf --homedir "$new" --kill all || true
+gpgconf --homedir {GNUPG_DIR} --kill all || true
+rm -rf {GNUPG_DIR}.old
+mv {GNUPG_DIR} {GNUPG_DIR}.old
+mv "$new" {GNUPG_DIR}
+rm -rf {GNUPG_DIR}.old
+"""
+
+REGEN_UNIT_BODY = f"""[Unit]
+Description=Generate this machine's pacman keyring master key
+ConditionPathExists={GNUPG_DIR}/{REGEN_MARKER}
+After=time-sync.target
+Before=archlinux-keyring-wkd-sync.service
+
+[Service]
+Type=oneshot
+ExecStart={REGEN_SCRIPT}
+Nice=19
+IOSchedulingClass=idle
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def is_populated(gpg_dir: str) -> bool:
+    return os.path.exists(f"{gpg_dir}/trustdb.gpg") and (
+        os.path.exists(f"{gpg_dir}/pubring.gpg") or os.path.exists(f"{gpg_dir}/pubring.kbx")
+    )
+
+
+class KeyringManager:
+    """
+    Gives the target a copy of an already populated pacman keyring instead
+    of letting pacstrap -K generate a master key and lsign every key.
+    The target replaces the copied master key on first boot.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def source(self) -> Optional[str]:
+        """The keyring to verify packages with and copy, or None to fall back to pacstrap -K."""
+        if is_populated(SNAPSHOT_DIR):
+            return SNAPSHOT_DIR
+        state = self.executor.run(
+            ["systemctl", "show", "-p", "ActiveState", "--value", "pacman-init.service"], check=False
+        ).stdout or ""
+        if state.strip() == "activating":
+            # Still populating; a half-built keyring would fail verification
+            return None
+        return GNUPG_DIR if is_populated(GNUPG_DIR) else None
+
+    def install(self, mount_point: str, source: str) -> Dict:
+        """Copies the keyring into the target and sets up first-boot regeneration."""
+        dest = f"{mount_point}{GNUPG_DIR}"
+        self.executor.makedirs(dest)
+        self.executor.run(
+            ["rsync", "-a"] + [f"--exclude={e}" for e in EXCLUDE] + [f"{source}/", f"{dest}/"]
+        )
+        with self.executor.batch():
+            self.executor.write_file(f"{dest}/{REGEN_MARKER}", "")
+            self.executor.makedirs(f"{mount_point}{os.path.dirname(REGEN_SCRIPT)}")
+            self.executor.write_file(f"{mount_point}{REGEN_SCRIPT}", REGEN_SCRIPT_BODY, mode=0o755)
+            self.executor.write_file(f"{mount_point}/etc/systemd/system/{REGEN_UNIT}", REGEN_UNIT_BODY)
+        return {"keyring": "copied", "keyring_source": source}
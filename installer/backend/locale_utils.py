@@ -0,0 +1,126 @@
+import glob
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+LOCALE_ARCHIVE = "/usr/lib/locale/locale-archive"
+SUPPORTED_PATH = "/usr/share/i18n/SUPPORTED"
+
+
+def normalize_locale(name: str) -> str:
+    """Normalizes a locale name the way localedef does (en_US.UTF-8 -> en_US.utf8)."""
+    base, _, modifier = name.partition("@")
+    if "." in base:
+        lang, codeset = base.split(".", 1)
+        base = f"{lang}.{re.sub(r'[^a-z0-9]', '', codeset.lower())}"
+    return f"{base}@{modifier}" if modifier else base
+
+
+class LocaleManager:
+    """
+    Provisions the target's locales. Copies the live system's compiled
+    locale-archive when it holds exactly the requested locales, otherwise
+    compiles only the requested ones, in parallel.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+        self._supported: Optional[Dict[str, str]] = None
+
+    def supported(self) -> Dict[str, str]:
+        """Maps locale names to their charmap, from glibc's SUPPORTED list."""
+        if self._supported is None:
+            self._supported = {}
+            try:
+                with open(SUPPORTED_PATH) as f:
+                    for line in f:
+                        if "/" in line:
+                            name, charmap = line.strip().rstrip("\\").strip().split("/", 1)
+                            self._supported[name] = charmap
+            except OSError:
+                pass
+        return self._supported
+
+    def charmap(self, name: str) -> str:
+        if name in self.supported():
+            return self.supported()[name]
+        base = name.partition("@")[0]
+        return base.split(".", 1)[1] if "." in base else "ISO-8859-1"
+
+    def live_locales(self) -> Set[str]:
+        result = self.executor.run(["localedef", "--list-archive"], check=False)
+        return {l.strip() for l in (result.stdout or "").splitlines() if l.strip()}
+
+    def _glibc_version(self, root: str = "") -> Optional[str]:
+        found = glob.glob(f"{root}/var/lib/pacman/local/glibc-[0-9]*")
+        return os.path.basename(found[0]) if found else None
+
+    def can_reuse_archive(self, mount_point: str, locales: List[str]) -> bool:
+        if not os.path.exists(LOCALE_ARCHIVE):
+            return False
+        # The archive format is tied to the glibc that built it
+        live_glibc = self._glibc_version()
+        if not live_glibc or live_glibc != self._glibc_version(mount_point):
+            return False
+        return self.live_locales() == {normalize_locale(l) for l in locales}
+
+    def provision(self, mount_point: str, locales: List[str]) -> Dict:
+        """Returns step metrics."""
+        locales = list(dict.fromkeys(locales)) or ["en_US.UTF-8"]
+
+        # Keep /etc/locale.gen accurate so a later locale-gen reproduces the same set
+        self.executor.run(
+            ["sed", "-i"]
+            + [arg for l in locales for arg in ("-e", f"s/^#{l.replace('.', '[.]')} /{l} /")]
+            + [f"{mount_point}/etc/locale.gen"],
+            check=False,
+        )
+
+        if self.can_reuse_archive(mount_point, locales):
+            logger.info("Reusing the live system's compiled locale archive")
+            self.executor.run(["cp", LOCALE_ARCHIVE, f"{mount_point}{LOCALE_ARCHIVE}"])
+            mode = "copied"
+        else:
+            self.generate(mount_point, locales)
+            mode = "generated"
+
+        self.executor.write_file(f"{mount_point}/etc/locale.conf", f"LANG={locales[0]}\n")
+        return {"locales": len(locales), "mode": mode}
+
+    def generate(self, mount_point: str, locales: List[str]):
+        """Compiles each locale separately so they can build concurrently."""
+
+        def build(name):
+            base, _, modifier = name.partition("@")
+            source = base.split(".", 1)[0] + (f"@{modifier}" if modifier else "")
+            # chroot, not arch-chroot: localedef needs no API filesystems, and
+            # concurrent arch-chroot sessions would tear down each other's mounts
+            result = self.executor.run(
+                [
+                    "chroot",
+                    mount_point,
+                    "localedef",
+                    "--no-archive",
+                    "-c",
+                    "-i",
+                    source,
+                    "-f",
+                    self.charmap(name),
+                    "-A",
+                    "/usr/share/locale/locale.alias",
+                    name,
+                ],
+                check=False,
+            )
+            # localedef exits non-zero on warnings even when -c writes the locale
+            if result.returncode != 0:
+                logger.warning(f"localedef reported problems for {name} (exit {result.returncode})")
+
+        logger.info(f"Generating {len(locales)} locale(s)")
+        with ThreadPoolExecutor(max_workers=min(len(locales), os.cpu_count() or 1)) as pool:
+            list(pool.map(build, locales))
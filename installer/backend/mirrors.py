@@ -0,0 +1,145 @@
+import logging
+import re
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+MIRRORLIST = "/etc/pacman.d/mirrorlist"
+
+# Probed with a ranged GET of the core sync db: always present, never cached
+# by a CDN for long, and large enough for a throughput reading
+PROBE_REPO = "core"
+PROBE_ARCH = "x86_64"
+PROBE_BYTES = 256 * 1024
+
+# Typical package size, used to weigh latency against throughput
+SCORE_BYTES = 4 * 1024 * 1024
+
+SERVER_RE = re.compile(r"^\s*#?\s*Server\s*=\s*(\S+)")
+
+# (url, nbytes, timeout) -> (seconds to first byte, bytes read, total seconds)
+Fetcher = Callable[[str, int, float], Tuple[float, int, float]]
+
+
+def http_range_fetch(url: str, nbytes: int, timeout: float) -> Tuple[float, int, float]:
+    request = urllib.request.Request(
+        url, headers={"Range": f"bytes=0-{nbytes - 1}", "User-Agent": "endos-installer"}
+    )
+    start = time.monotonic()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        first = response.read(1)
+        ttfb = time.monotonic() - start
+        # Servers that ignore Range send the whole file; stop at nbytes anyway
+        received = len(first) + len(response.read(nbytes - len(first)))
+    return ttfb, received, time.monotonic() - start
+
+
+def read_servers(path: str = MIRRORLIST) -> List[str]:
+    """Server URLs from a mirrorlist, active ones first, then commented-out ones."""
+    active, commented = [], []
+    try:
+        with open(path) as f:
+            for line in f:
+                m = SERVER_RE.match(line)
+                if m:
+                    (commented if line.lstrip().startswith("#") else active).append(m.group(1))
+    except OSError:
+        pass
+    seen = set()
+    return [s for s in active + commented if not (s in seen or seen.add(s))]
+
+
+def probe_url(server: str) -> str:
+    return server.replace("$repo", PROBE_REPO).replace("$arch", PROBE_ARCH).rstrip("/") + f"/{PROBE_REPO}.db"
+
+
+def render_mirrorlist(ranked: List[Dict]) -> str:
+    lines = ["# Ranked by the EndOS installer (latency + throughput)", ""]
+    for r in ranked:
+        lines.append(f"# {r['ttfb'] * 1000:.0f} ms, {r['mbps']:.1f} MB/s")
+        lines.append(f"Server = {r['server']}")
+    return "\n".join(lines) + "\n"
+
+
+class MirrorRanker:
+    """
+    Probes candidate mirrors concurrently and orders them by the expected
+    time to fetch a typical package. The whole ranking is bounded by
+    `budget` seconds; mirrors that haven't answered by then are dropped.
+    """
+
+    def __init__(self, executor: SystemExecutor, fetch: Fetcher = http_range_fetch,
+                 budget: float = 6.0, max_candidates: int = 24, workers: int = 12):
+        self.executor = executor
+        self.fetch = fetch
+        self.budget = budget
+        self.max_candidates = max_candidates
+        self.workers = workers
+        self.mirrorlist: Optional[str] = None
+
+    def _probe(self, server: str, deadline: float) -> Optional[Dict]:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return None
+        try:
+            ttfb, received, total = self.fetch(probe_url(server), PROBE_BYTES, timeout)
+        except Exception as e:
+            logger.debug(f"Mirror {server} failed: {e}")
+            return None
+        if not received:
+            return None
+        transfer = max(total - ttfb, 1e-3)
+        bps = received / transfer
+        return {
+            "server": server,
+            "ttfb": ttfb,
+            "mbps": bps / 1e6,
+            "score": ttfb + SCORE_BYTES / bps,
+        }
+
+    def rank(self, servers: List[str]) -> List[Dict]:
+        candidates = servers[: self.max_candidates]
+        if not candidates:
+            return []
+        deadline = time.monotonic() + self.budget
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, len(candidates)))
+        futures = [pool.submit(self._probe, s, deadline) for s in candidates]
+        done, _ = wait(futures, timeout=self.budget)
+        # Don't wait for stragglers, their results are discarded anyway
+        pool.shutdown(wait=False, cancel_futures=True)
+        results = [f.result() for f in done if f.result()]
+        return sorted(results, key=lambda r: r["score"])
+
+    def apply(self, source: str = MIRRORLIST) -> Dict:
+        """
+        Ranks the mirrors in the live mirrorlist and writes the result back
+        for pacstrap. Leaves it untouched when no mirror answered.
+        Returns step metrics.
+        """
+        servers = read_servers(source)
+        start = time.monotonic()
+        ranked = self.rank(servers)
+        elapsed = time.monotonic() - start
+        metrics = {"candidates": min(len(servers), self.max_candidates), "responsive": len(ranked),
+                   "rank_s": round(elapsed, 2)}
+        if not ranked:
+            logger.warning("No mirror answered within the time budget, keeping the shipped mirrorlist")
+            return metrics
+
+        logger.info(f"Fastest mirror: {ranked[0]['server']} ({ranked[0]['mbps']:.1f} MB/s)")
+        self.mirrorlist = render_mirrorlist(ranked)
+        self.executor.write_file(MIRRORLIST, self.mirrorlist)
+        metrics["fastest"] = ranked[0]["server"]
+        return metrics
+
+    def write_target(self, mount_point: str):
+        """
+        Installs the ranked list in the target. Must run after pacstrap:
+        pacman refuses to overwrite a mirrorlist it doesn't own.
+        """
+        if self.mirrorlist:
+            self.executor.write_file(f"{mount_point}{MIRRORLIST}", self.mirrorlist)
@@ -1,18 +1,47 @@
 import json
 import logging
-from typing import List, Dict, Optional
+import secrets
+import threading
+import time
+import uuid
+from typing import Callable, List, Dict, Optional
 from backend.executor import SystemExecutor
+from backend.btrfs import SUBVOLUMES, NODATACOW_DIRS
+from backend.diskbench import benchmark_device, load_cache, save_cache, parse_size
 
 logger = logging.getLogger("EndOS-Installer")
 
+# Where format_partitions mounts a new btrfs to create its subvolumes
+BTRFS_TOP = "/tmp/endos-btrfs"
+
+# Smallest disk recommended as an install target
+MIN_RECOMMENDED_BYTES = 32 * 1024 ** 3
+# Per-disk benchmark time budget, seconds
+BENCH_BUDGET = 1.5
+# Where the live medium is mounted on archiso
+LIVE_MEDIUM = "/run/archiso/bootmnt"
+
 class DiskManager:
     def __init__(self, executor: SystemExecutor):
         self.executor = executor
+        # What format_partitions/mount_partitions created, one dict per filesystem
+        # (per subvolume on btrfs): device, uuid, partuuid, fstype, mountpoint,
+        # and for btrfs subvol and compress
+        self.layout: List[Dict] = []
+        # Disk benchmark results by serial (or device when there is none)
+        self._bench: Dict[str, Dict] = load_cache()
+        self._bench_running: set = set()
+        self._bench_lock = threading.Lock()
 
     def list_disks(self) -> List[Dict]:
-        """Returns a list of physical disks."""
-        # lsblk -J -d -o NAME,SIZE,TYPE,MODEL,ROTA
-        cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,TYPE,MODEL,ROTA"]
+        """
+        Returns a list of physical disks, with benchmark results (mbps, iops)
+        where available and the best install target marked recommended.
+        """
+        # Disks may have been plugged in since the last scan
+        self.executor.invalidate_probes()
+        # lsblk -J -d -o NAME,SIZE,TYPE,MODEL,ROTA,SERIAL
+        cmd = ["lsblk", "-J", "-d", "-o", "NAME,SIZE,TYPE,MODEL,ROTA,SERIAL"]
         try:
             result = self.executor.run(cmd, capture_output=True)
             if not result.stdout:
@@ -27,23 +56,110 @@ class DiskManager:
                         "name": item['name'],
                         "size": item['size'],
                         "model": item.get('model', 'Unknown'),
-                        "rota": item.get('rota') == '1' # True if HDD, False if SSD
+                        "rota": item.get('rota') in (True, '1'), # True if HDD, False if SSD
+                        "serial": item.get('serial') or "",
                     })
+            self._annotate(disks)
             return disks
         except Exception as e:
             logger.error(f"Failed to list disks: {e}")
             return []
 
+    def _bench_key(self, disk: Dict) -> str:
+        return disk.get("serial") or disk["device"]
+
+    def benchmark_result(self, device: str) -> Optional[Dict]:
+        """Cached benchmark for a device ({"mbps", "iops"}), if it has been measured."""
+        result = self.executor.run(["lsblk", "-d", "-n", "-o", "SERIAL", device], check=False)
+        key = (result.stdout or "").strip() or device
+        with self._bench_lock:
+            result = self._bench.get(key)
+        return result if result and "mbps" in result else None
+
+    def start_benchmarks(self, disks: List[Dict], on_done: Optional[Callable[[], None]] = None):
+        """
+        Benchmarks every disk not measured (or failed) yet, all at once, in
+        the background. on_done is called (from a worker thread) when they
+        have finished or run out of time, and only if at least one of them
+        produced a new result.
+        """
+        with self._bench_lock:
+            pending = [d for d in disks
+                       if self._bench_key(d) not in self._bench and self._bench_key(d) not in self._bench_running]
+            self._bench_running.update(self._bench_key(d) for d in pending)
+        if not pending:
+            return
+
+        measured = []
+
+        def bench(disk):
+            key = self._bench_key(disk)
+            try:
+                result = benchmark_device(disk["device"], BENCH_BUDGET)
+                logger.info(f"{disk['device']}: {result['mbps']} MB/s, {result['iops']} IOPS")
+                measured.append(key)
+            except OSError as e:
+                # Remembered too: no permission, an empty card reader, ...
+                # won't get better by trying again on every rescan
+                logger.warning(f"Could not benchmark {disk['device']}: {e}")
+                result = {"error": str(e)}
+            with self._bench_lock:
+                self._bench[key] = result
+                self._bench_running.discard(key)
+
+        def run_all():
+            threads = [threading.Thread(target=bench, args=(d,), daemon=True) for d in pending]
+            for t in threads:
+                t.start()
+            # A failing drive can stall a single read for much longer than
+            # the budget; report whatever finished in time
+            deadline = time.monotonic() + BENCH_BUDGET + 2.0
+            for t in threads:
+                t.join(max(0.0, deadline - time.monotonic()))
+            with self._bench_lock:
+                # Failures only for this session; a run as root may succeed
+                save_cache({k: v for k, v in self._bench.items() if "mbps" in v})
+            if on_done and measured:
+                on_done()
+
+        threading.Thread(target=run_all, daemon=True).start()
+
+    def _live_disk(self) -> Optional[str]:
+        result = self.executor.run(["findmnt", "-n", "-o", "SOURCE", LIVE_MEDIUM], check=False)
+        source = (result.stdout or "").strip()
+        if not source:
+            return None
+        parent = self.executor.run(["lsblk", "-n", "-d", "-o", "PKNAME", source], check=False)
+        name = (parent.stdout or "").strip()
+        return f"/dev/{name}" if name else source
+
+    def _annotate(self, disks: List[Dict]):
+        with self._bench_lock:
+            for disk in disks:
+                result = self._bench.get(self._bench_key(disk))
+                if result and "mbps" in result:
+                    disk.update(result)
+        live = self._live_disk()
+        suitable = [d for d in disks
+                    if d["device"] != live and (parse_size(d["size"]) or 0) >= MIN_RECOMMENDED_BYTES]
+        # Measured disks rank by throughput, with random reads breaking near-ties
+        measured = [d for d in suitable if "mbps" in d]
+        best = max(measured, key=lambda d: (d["mbps"], d["iops"]), default=None)
+        for disk in disks:
+            disk["recommended"] = disk is best
+
     def get_boot_mode(self) -> str:
         """Detects if system is UEFI or BIOS."""
         # Check /sys/firmware/efi
         check = self.executor.run(["test", "-d", "/sys/firmware/efi"], check=False)
         return "UEFI" if check.returncode == 0 else "BIOS"
 
-    def partition_disk(self, device: str, mode: str = "erase"):
+    def partition_disk(self, device: str, mode: str = "erase", separate_boot: bool = False):
         """
         Partitions the selected disk.
         mode: 'erase' (wipe and auto-partition)
+        separate_boot: give BIOS installs their own /boot partition, which
+        GRUB needs when root is encrypted
         """
         boot_mode = self.get_boot_mode()
         logger.info(f"Partitioning {device} in {mode} mode ({boot_mode})")
@@ -69,7 +185,6 @@ class DiskManager:
         self.executor.run(["wipefs", "-af", device], check=False)
         
         # Add a small delay to let kernel sync
-        import time
         time.sleep(1)
 
         # Create Label
@@ -86,6 +201,12 @@ class DiskManager:
             # 2. Root (Rest)
             self.executor.run(["parted", "-s", device, "mkpart", "primary", "ext4", "513MiB", "100%"])
             
+        elif separate_boot:
+            # 1. Boot (1GiB), 2. Root (Rest)
+            self.executor.run(["parted", "-s", device, "mkpart", "primary", "ext4", "1MiB", "1025MiB"])
+            self.executor.run(["parted", "-s", device, "set", "1", "boot", "on"])
+            self.executor.run(["parted", "-s", device, "mkpart", "primary", "ext4", "1025MiB", "100%"])
+
         else: # BIOS
             # 1. Root (Rest) - simpler for now
             self.executor.run(["parted", "-s", device, "mkpart", "primary", "ext4", "1MiB", "100%"])
@@ -96,31 +217,149 @@ class DiskManager:
         self.executor.run(["partprobe", device], check=False)
         time.sleep(1)
         
-    def format_partitions(self, device: str):
+    def get_storage_profile(self, device: str) -> Dict:
+        """Describes the target disk's storage class, for choosing mount options."""
+        profile = {"rotational": False, "transport": "", "removable": False}
+        result = self.executor.run(["lsblk", "-J", "-d", "-o", "ROTA,TRAN,RM", device],
+                                   capture_output=True, check=False)
+        try:
+            item = json.loads(result.stdout or "{}").get("blockdevices", [{}])[0]
+        except (json.JSONDecodeError, IndexError):
+            return profile
+        # lsblk reports booleans as true/false or "1"/"0" depending on version
+        profile["rotational"] = item.get("rota") in (True, "1")
+        profile["removable"] = item.get("rm") in (True, "1")
+        profile["transport"] = item.get("tran") or ""
+        return profile
+
+    def _partuuids(self, device: str) -> Dict[str, str]:
+        result = self.executor.run(["lsblk", "-J", "-o", "PATH,PARTUUID", device],
+                                   capture_output=True, check=False)
+        partuuids = {}
+        try:
+            data = json.loads(result.stdout or "{}")
+        except json.JSONDecodeError:
+            return partuuids
+        for disk in data.get("blockdevices", []):
+            for child in disk.get("children", []):
+                if child.get("path") and child.get("partuuid"):
+                    partuuids[child["path"]] = child["partuuid"]
+        return partuuids
+
+    def format_partitions(self, device: str, encrypt_root: Optional[Callable[[str], str]] = None,
+                          filesystem: str = "ext4", compress_level: int = 3):
+        """
+        encrypt_root: sets up encryption on the root partition and returns
+        the unlocked device to put the filesystem on (e.g. EncryptionManager.format).
+        filesystem: "ext4", or "btrfs" with btrfs.SUBVOLUMES compressed at
+        zstd:compress_level.
+        """
         boot_mode = self.get_boot_mode()
+        self.layout = []
         
         # Naive assumption of partition naming (sda1, sda2) vs (nvme0n1p1)
         # In production, use lsblk to find children partitions
         sep = "p" if device[-1].isdigit() else ""
+
+        # Pick the filesystem UUIDs ourselves so nothing has to probe for them later
+        root_uuid = str(uuid.uuid4())
         
         if boot_mode == "UEFI":
             boot_part = f"{device}{sep}1"
             root_part = f"{device}{sep}2"
+            boot_serial = secrets.token_hex(4).upper()
             
             logger.info(f"Formatting Boot: {boot_part}, Root: {root_part}")
-            self.executor.run(["mkfs.fat", "-F32", boot_part])
-            self.executor.run(["mkfs.ext4", "-F", root_part])
-            return root_part, boot_part
+            self.executor.run(["mkfs.fat", "-F32", "-i", boot_serial, boot_part])
+            self.layout.append({"device": boot_part, "uuid": f"{boot_serial[:4]}-{boot_serial[4:]}", "fstype": "vfat"})
+        elif encrypt_root:
+            # partition_disk(separate_boot=True) layout
+            boot_part = f"{device}{sep}1"
+            root_part = f"{device}{sep}2"
+            boot_uuid = str(uuid.uuid4())
+
+            logger.info(f"Formatting Boot: {boot_part}, Root: {root_part}")
+            self.executor.run(["mkfs.ext4", "-F", "-U", boot_uuid, boot_part])
+            self.layout.append({"device": boot_part, "uuid": boot_uuid, "fstype": "ext4"})
         else:
             root_part = f"{device}{sep}1"
+            boot_part = None
             logger.info(f"Formatting Root: {root_part}")
-            self.executor.run(["mkfs.ext4", "-F", root_part])
-            return root_part, None
+
+        luks_device = None
+        if encrypt_root:
+            luks_device = root_part
+            root_part = encrypt_root(root_part)
+
+        if filesystem == "btrfs":
+            self.executor.run(["mkfs.btrfs", "-f", "-U", root_uuid, root_part])
+            root_entries = self._create_subvolumes(root_part, root_uuid, f"zstd:{compress_level}")
+        else:
+            self.executor.run(["mkfs.ext4", "-F", "-U", root_uuid, root_part])
+            root_entries = [{"device": root_part, "uuid": root_uuid, "fstype": "ext4"}]
+        if luks_device:
+            root_entries[0]["luks_device"] = luks_device
+        self.layout[:0] = root_entries
+
+        partuuids = self._partuuids(device)
+        for entry in self.layout:
+            entry["partuuid"] = partuuids.get(entry["device"], "")
+            entry["mountpoint"] = None
+        return root_part, boot_part
+
+    def _create_subvolumes(self, part: str, fs_uuid: str, compress: str) -> List[Dict]:
+        self.executor.makedirs(BTRFS_TOP)
+        self.executor.run(["mount", part, BTRFS_TOP])
+        try:
+            for name, _ in SUBVOLUMES:
+                self.executor.run(["btrfs", "subvolume", "create", f"{BTRFS_TOP}/{name}"])
+        finally:
+            self.executor.run(["umount", BTRFS_TOP], check=False)
+        return [
+            {"device": part, "uuid": fs_uuid, "fstype": "btrfs", "subvol": name, "compress": compress}
+            for name, _ in SUBVOLUMES
+        ]
+
+    def uuid_of(self, part: str) -> Optional[str]:
+        """Returns the UUID of a filesystem this DiskManager created."""
+        for entry in self.layout:
+            if entry["device"] == part:
+                return entry["uuid"]
+        return None
 
     def mount_partitions(self, root: str, boot: Optional[str], mount_point: str = "/mnt"):
-        self.executor.run(["mount", root, mount_point])
+        subvols = [e for e in self.layout if e["device"] == root and e.get("subvol")]
+        if subvols:
+            self._mount_subvolumes(subvols, mount_point)
+        else:
+            self.executor.run(["mount", root, mount_point])
+            self._set_mountpoint(root, "/")
         
         if boot:
             boot_mnt = f"{mount_point}/boot"
-            self.executor.run(["mkdir", "-p", boot_mnt])
+            self.executor.makedirs(boot_mnt)
             self.executor.run(["mount", boot, boot_mnt])
+            self._set_mountpoint(boot, "/boot")
+
+    def _mount_subvolumes(self, entries: List[Dict], mount_point: str):
+        targets = dict(SUBVOLUMES)
+        for entry in entries:
+            target = targets[entry["subvol"]]
+            path = f"{mount_point.rstrip('/')}{target}" if target != "/" else mount_point
+            self.executor.makedirs(path)
+            self.executor.run(
+                ["mount", "-o", f"subvol=/{entry['subvol']},compress={entry['compress']}", entry["device"], path]
+            )
+            entry["mountpoint"] = target
+
+        # +C only sticks to empty directories, so set it before anything is installed
+        for d in NODATACOW_DIRS:
+            path = f"{mount_point.rstrip('/')}{d}"
+            self.executor.makedirs(path)
+            self.executor.run(["chattr", "+C", path], check=False)
+
+    def _set_mountpoint(self, part: str, mountpoint: str):
+        for entry in self.layout:
+            if entry["device"] == part:
+                entry["mountpoint"] = mountpoint
+
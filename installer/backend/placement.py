@@ -0,0 +1,107 @@
+import logging
+import os
+from typing import Dict, List, Optional
+from backend.executor import SystemExecutor
+from backend.sysinfo import read_meminfo
+
+logger = logging.getLogger("EndOS-Installer")
+
+TMPFS_CACHE = "/tmp/endos-pkgcache"
+RAM_LOG = "/tmp/endos-install.log"
+TARGET_LOG = "/var/log/endos-installer/install.log"
+
+# RAM left for extraction page cache, the installer and the live overlay
+# when the package cache goes to tmpfs
+RESERVE_MB = 2048
+# Slack for packages whose download size pacman -Sp can't know yet
+CACHE_SLACK = 1.1
+
+
+def package_set_mb(executor: SystemExecutor, packages: List[str], pacman_conf: str) -> Optional[int]:
+    """Download size of the resolved package set (dependencies included), or None."""
+    result = executor.run(
+        ["pacman", "-Sp", "--config", pacman_conf, "--print-format", "%s"] + packages,
+        check=False,
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None
+    try:
+        return sum(int(line) for line in result.stdout.split() if line.isdigit()) // (1024 * 1024)
+    except ValueError:
+        return None
+
+
+def plan_placement(download_mb: Optional[int], meminfo: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Keeps the package cache and the install log in RAM (tmpfs) when the
+    whole set fits beside RESERVE_MB, otherwise on the target disk so
+    the live overlay can't push out the page cache extraction needs.
+    """
+    info = read_meminfo() if meminfo is None else meminfo
+    available_mb = info.get("MemAvailable", 0) // 1024
+    need_mb = int(download_mb * CACHE_SLACK) if download_mb else None
+    in_ram = need_mb is not None and available_mb >= need_mb + RESERVE_MB
+    return {
+        "available_mb": available_mb,
+        "download_mb": download_mb,
+        "cache": "tmpfs" if in_ram else "target",
+        "cache_mb": need_mb,
+    }
+
+
+class PlacementManager:
+    """Sets up where pacstrap's package cache and the install log live."""
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+        self._tmpfs = False
+        self._log_handler: Optional[logging.Handler] = None
+        self._log_path: Optional[str] = None
+
+    def cache_dir(self, plan: Dict) -> Optional[str]:
+        """
+        Mounts the tmpfs cache if the plan calls for it and returns it, for
+        the pacman.conf CacheDir used with pacstrap -c. None keeps pacstrap's
+        default, the target's /var/cache/pacman/pkg (where pacman's .part
+        download files live too).
+        """
+        if plan["cache"] != "tmpfs":
+            return None
+        self.executor.makedirs(TMPFS_CACHE)
+        self.executor.run(
+            ["mount", "-t", "tmpfs", "-o", f"size={plan['cache_mb'] + 64}m,mode=0755", "tmpfs", TMPFS_CACHE]
+        )
+        self._tmpfs = True
+        return TMPFS_CACHE
+
+    def start_log(self, plan: Dict, mount_point: str):
+        """Logs to tmpfs when RAM allows, straight to the target otherwise."""
+        if plan["cache"] == "tmpfs":
+            path = RAM_LOG
+        else:
+            path = f"{mount_point}{TARGET_LOG}"
+            self.executor.makedirs(os.path.dirname(path))
+        try:
+            handler = logging.FileHandler(path)
+        except OSError as e:
+            logger.warning(f"Cannot write install log to {path}: {e}")
+            return
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+        self._log_handler, self._log_path = handler, path
+
+    def finish(self, mount_point: str):
+        """Stops logging, moves a RAM log into the target and frees the tmpfs."""
+        if self._log_handler:
+            logger.removeHandler(self._log_handler)
+            self._log_handler.close()
+            self._log_handler = None
+            if self._log_path == RAM_LOG and mount_point:
+                self.executor.makedirs(f"{mount_point}{os.path.dirname(TARGET_LOG)}")
+                self.executor.run(["cp", RAM_LOG, f"{mount_point}{TARGET_LOG}"], check=False)
+        self.release()
+
+    def release(self):
+        if self._tmpfs:
+            self.executor.run(["umount", TMPFS_CACHE], check=False)
+            self._tmpfs = False
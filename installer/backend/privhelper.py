@@ -0,0 +1,225 @@
+"""
+Privileged file-operation helper.
+
+Started once per install session (via sudo when the GUI is unprivileged) and
+fed batches of operations as JSON lines on stdin; answers each batch with one
+JSON line on stdout. Only depends on the standard library so it can run as a
+plain script under sudo.
+
+Request:  {"id": 1, "ops": [{"op": "write", "path": "/mnt/etc/hostname", "data": "<base64>",
+                             "mode": 420, "owner": "root:root", "atomic": true}, ...]}
+Response: {"id": 1, "results": [{"ok": true}, {"ok": false, "error": "..."}]}
+
+Operations: write, symlink (target, link), mkdir (path, mode), remove (path, recursive),
+blocks (path, zero: [[offset, length]], chunks: [[offset, file]]).
+"""
+import base64
+import fcntl
+import json
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+# _IO(0x12, 127): zero a byte range of a block device, offloaded where the
+# device supports it
+BLKZEROOUT = 0x127F
+
+
+def _chown(path: str, owner: Optional[str]):
+    if owner:
+        user, _, group = owner.partition(":")
+        shutil.chown(path, user or None, group or None)
+
+
+def _resolve(path: str) -> str:
+    """
+    Follows path while it is a symlink. An absolute link target is taken
+    relative to the filesystem the link is on, so a link in a target tree
+    mounted at /mnt (etc/localtime -> /usr/share/...) stays inside /mnt.
+    """
+    for _ in range(40):
+        if not os.path.islink(path):
+            return path
+        target = os.readlink(path)
+        if os.path.isabs(target):
+            root = os.path.dirname(path)
+            while not os.path.ismount(root):
+                root = os.path.dirname(root)
+            target = root.rstrip("/") + target
+        else:
+            target = os.path.join(os.path.dirname(path), target)
+        path = os.path.normpath(target)
+    raise OSError(f"Too many levels of symbolic links: {path}")
+
+
+def _zero_range(fd: int, offset: int, length: int):
+    try:
+        fcntl.ioctl(fd, BLKZEROOUT, struct.pack("QQ", offset, length))
+        return
+    except OSError:
+        # Not a block device (e.g. an image file)
+        pass
+    zeros = bytes(1024 * 1024)
+    end = offset + length
+    while offset < end:
+        offset += os.pwrite(fd, zeros[:min(len(zeros), end - offset)], offset)
+
+
+def _write_blocks(path: str, zero: List[List[int]], chunks: List[List]):
+    """Zeroes the given ranges of path, then copies each chunk file in at its offset."""
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        for offset, length in zero:
+            _zero_range(fd, offset, length)
+        for offset, chunk in chunks:
+            with open(chunk, "rb") as f:
+                data = f.read()
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def apply_op(op: Dict):
+    kind = op["op"]
+    if kind == "write":
+        # Through a symlink: replace what it points to, not the link
+        path = _resolve(op["path"])
+        data = base64.b64decode(op["data"])
+        mode = op.get("mode")
+        if op.get("atomic", True):
+            try:
+                existing = os.stat(path)
+            except FileNotFoundError:
+                existing = None
+            # Write next to the destination and rename over it, so readers
+            # never see a half-written file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".endos-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                # Unless told otherwise, a replaced file keeps its mode and owner
+                if mode is None:
+                    mode = stat.S_IMODE(existing.st_mode) if existing else 0o644
+                os.chmod(tmp, mode)
+                if op.get("owner"):
+                    _chown(tmp, op["owner"])
+                elif existing:
+                    os.chown(tmp, existing.st_uid, existing.st_gid)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+            if mode is not None:
+                os.chmod(path, mode)
+            _chown(path, op.get("owner"))
+    elif kind == "symlink":
+        link = op["link"]
+        if os.path.lexists(link):
+            os.unlink(link)
+        os.symlink(op["target"], link)
+    elif kind == "mkdir":
+        os.makedirs(op["path"], mode=op.get("mode", 0o755), exist_ok=True)
+    elif kind == "blocks":
+        _write_blocks(op["path"], op.get("zero", []), op.get("chunks", []))
+    elif kind == "remove":
+        path = op["path"]
+        if os.path.isdir(path) and not os.path.islink(path):
+            if op.get("recursive"):
+                shutil.rmtree(path)
+            else:
+                os.rmdir(path)
+        elif os.path.lexists(path):
+            os.unlink(path)
+    else:
+        raise ValueError(f"Unknown operation: {kind}")
+
+
+def apply_ops(ops: List[Dict]) -> List[Dict]:
+    results = []
+    for op in ops:
+        try:
+            apply_op(op)
+            results.append({"ok": True})
+        except Exception as e:
+            results.append({"ok": False, "error": f"{op.get('op')} {op.get('path') or op.get('link')}: {e}"})
+    return results
+
+
+def write_op(path: str, content: str, mode: Optional[int] = None,
+             owner: Optional[str] = None, atomic: bool = True) -> Dict:
+    return {
+        "op": "write",
+        "path": path,
+        "data": base64.b64encode(content.encode()).decode(),
+        "mode": mode,
+        "owner": owner,
+        "atomic": atomic,
+    }
+
+
+class PrivilegedHelper:
+    """Client side: owns the long-lived helper process."""
+
+    def __init__(self):
+        self._proc = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def start(self):
+        if self._proc and self._proc.poll() is None:
+            return
+        self._proc = subprocess.Popen(
+            ["sudo", "-n", sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    def call(self, ops: List[Dict]) -> List[Dict]:
+        with self._lock:
+            self.start()
+            self._next_id += 1
+            self._proc.stdin.write(json.dumps({"id": self._next_id, "ops": ops}) + "\n")
+            self._proc.stdin.flush()
+            line = self._proc.stdout.readline()
+            if not line:
+                raise RuntimeError("Privileged helper exited unexpectedly")
+            return json.loads(line)["results"]
+
+    def close(self):
+        with self._lock:
+            if self._proc and self._proc.poll() is None:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=5)
+            self._proc = None
+
+
+def main():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        response = {"id": request.get("id"), "results": apply_ops(request.get("ops", []))}
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Defaults for every tunable the install pipeline reads.
+# Precedence: wizard config > user-supplied profile file > these defaults.
+DEFAULT_PROFILE = {
+    # Bootloader: "grub" or "systemd-boot" (UEFI only, faster to set up)
+    "bootloader": "grub",
+    # Look for other operating systems; only the disks listed are probed
+    "osProber": False,
+    "osProberDisks": [],
+    "kernelCmdline": "loglevel=3 quiet splash",
+    # Build the generic fallback image alongside the host-only (autodetect) one
+    "initramfsFallback": True,
+    # mkinitcpio COMPRESSION, e.g. "lz4" for speed; empty keeps the target's default
+    "initramfsCompression": "",
+    # Units enabled in the target, in order. sddm and greetd both claim
+    # display-manager.service, so only the first one found is enabled.
+    "services": ["NetworkManager", "bluetooth", "sddm", "greetd"],
+    # Root filesystem: "ext4" or "btrfs" (subvolumes @, @home, @cache, @log).
+    # btrfsCompressLevel 0 picks the zstd level by benchmark.
+    "filesystem": "ext4",
+    "btrfsCompressLevel": 0,
+    # Swap: zram sized by RAM; swapfile true/false or "auto" (only below
+    # 8 GiB RAM), swapfileSize in MiB (0 = RAM, at most 8 GiB)
+    "zram": True,
+    "swapfile": "auto",
+    "swapfileSize": 0,
+    # Check the local repository packages on the install medium (checksums
+    # and signatures from the sync DB) before the target disk is touched
+    "verifyPackages": True,
+    # Read every installed file back and check it against its package's
+    # mtree, for at most integrityBudget seconds; damaged packages are
+    # reinstalled if integrityRepair is set, otherwise the install fails
+    "integrityCheck": False,
+    "integrityBudget": 300,
+    "integrityRepair": True,
+    # Replace the list's microcode, linux-firmware and GPU driver packages
+    # with the ones the detected hardware needs
+    "hardwarePackages": True,
+    # Copy the ISO's (or live system's) populated pacman keyring into the
+    # target instead of pacstrap -K; the target makes its own master key
+    # on first boot
+    "reuseKeyring": True,
+    # Write-optimised mounts and block queue settings while installing,
+    # restored before fstab/teardown. Unsafe also drops write barriers
+    # (a crash mid-install means reinstalling anyway).
+    "ioTuning": True,
+    "ioTuningUnsafe": False,
+    # LUKS2-encrypt the root partition. The cipher is picked by benchmark
+    # unless luksCipher/luksKeySize are set (e.g. "aes-xts-plain64", 512);
+    # argon2id's time cost is tuned to luksIterTime milliseconds.
+    "encryption": False,
+    "luksCipher": "",
+    "luksKeySize": 0,
+    "luksIterTime": 2000,
+    # Rank the live mirrorlist before pacstrap (online installs only);
+    # mirrors slower to answer than the budget (seconds) are dropped
+    "rankMirrors": True,
+    "mirrorBudget": 6.0,
+    # Golden images for batches of identical machines: captureImage is a
+    # directory to image the finished (unencrypted ext4) install into;
+    # replayImage installs from such a directory instead of packages,
+    # redoing only UUIDs, fstab, hostname, user, machine-id and bootloader
+    "captureImage": "",
+    "replayImage": "",
+    # Per-step durations (seconds, normalized to progress.REFERENCE) that
+    # override the recorded ones when weighting the progress bar
+    "stepTimings": {},
+}
+
+PROFILE_PATHS = [
+    Path("/etc/endos/install-profile.json"),
+]
+
+
+def load_profile(config: Dict) -> Dict:
+    """Merges defaults, the first profile file found and the wizard config."""
+    profile = dict(DEFAULT_PROFILE)
+
+    for p in PROFILE_PATHS:
+        if p.exists():
+            try:
+                profile.update(json.loads(p.read_text()))
+                logger.info(f"Loaded install profile from {p}")
+                break
+            except Exception as e:
+                logger.error(f"Failed to parse install profile {p}: {e}")
+
+    for key, value in (config or {}).items():
+        if key in DEFAULT_PROFILE:
+            profile[key] = value
+    return profile
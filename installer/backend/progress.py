@@ -0,0 +1,217 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Seconds each step takes on the reference machine below. Only used until
+# real timings have been recorded.
+DEFAULT_TIMINGS = {
+    "verify": 20.0,
+    "partition": 4.0,
+    "format": 4.0,
+    "mount": 1.0,
+    "mirrors": 6.0,
+    "pacstrap": 540.0,
+    "swap": 2.0,
+    "fstab": 0.5,
+    "timezone": 2.0,
+    "locale": 4.0,
+    "user": 3.0,
+    "sudoers": 0.5,
+    "hostname": 0.5,
+    "services": 0.5,
+    "bootloader": 6.0,
+    "replicate": 25.0,
+    "venv": 30.0,
+    "integrity": 30.0,
+    "initramfs": 25.0,
+    "teardown": 15.0,
+    "restore": 60.0,
+    "fixup": 5.0,
+    "capture": 60.0,
+}
+
+# Timings are stored normalized to this machine/package set
+REFERENCE = {"packages": 250, "disk_mbps": 400.0}
+
+# Steps whose duration scales with disk write speed / package count
+DISK_BOUND = {"format", "pacstrap", "replicate", "venv", "integrity", "initramfs", "teardown", "restore", "capture"}
+PACKAGE_BOUND = {"pacstrap"}
+
+# Measured timings, kept by the installed system (on archiso /var/lib is
+# the tmpfs overlay and gone after a reboot). Read back when the installer
+# runs on a system that has them; never written into a file someone supplied.
+RECORDED_TIMINGS = Path("/var/lib/endos-installer/step-timings.json")
+
+# Earlier paths win: a user-supplied file, then recorded runs, then the
+# file shipped on the live medium
+TIMING_PATHS = [
+    Path("/etc/endos/step-timings.json"),
+    RECORDED_TIMINGS,
+    Path(__file__).resolve().parent.parent / "step-timings.json",
+]
+
+# Weight of a new run when folding it into the stored timings
+LEARNING_RATE = 0.3
+
+
+def estimate_disk_mbps(storage: Dict) -> float:
+    """Rough sequential write speed until the disk has been benchmarked."""
+    if storage.get("transport") == "usb" or storage.get("removable"):
+        return 40.0
+    if storage.get("rotational"):
+        return 120.0
+    if storage.get("transport") == "nvme":
+        return 1200.0
+    return 400.0
+
+
+def load_timings(override: Optional[Dict] = None) -> Dict[str, float]:
+    timings = dict(DEFAULT_TIMINGS)
+    for p in reversed(TIMING_PATHS):
+        if p.exists():
+            try:
+                timings.update(json.loads(p.read_text()).get("steps", {}))
+            except Exception as e:
+                logger.error(f"Failed to parse step timings {p}: {e}")
+    timings.update(override or {})
+    return timings
+
+
+def load_recorded(path: Path = RECORDED_TIMINGS) -> Dict[str, float]:
+    """Just the measured timings, without defaults or overrides."""
+    try:
+        return json.loads(path.read_text()).get("steps", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+class ProgressEstimator:
+    """
+    Turns named steps into monotone, time-based percentages and an ETA,
+    weighting each step by how long it took on previous runs, scaled to
+    this machine's disk speed and package count.
+    """
+
+    def __init__(self, steps: List[str], timings: Optional[Dict[str, float]] = None,
+                 packages: int = REFERENCE["packages"], disk_mbps: float = REFERENCE["disk_mbps"]):
+        self.steps = list(steps)
+        self.timings = timings if timings is not None else load_timings()
+        self.packages = packages
+        self.disk_mbps = disk_mbps
+        self._done: Dict[str, float] = {}
+        self._current: Optional[str] = None
+        self._current_start = 0.0
+        self._current_fraction: Optional[float] = None
+        self._last_percent = 0.0
+        self._lock = threading.Lock()
+
+    def scale(self, name: str) -> float:
+        factor = 1.0
+        if name in DISK_BOUND and self.disk_mbps:
+            factor *= REFERENCE["disk_mbps"] / self.disk_mbps
+        if name in PACKAGE_BOUND and self.packages:
+            factor *= self.packages / REFERENCE["packages"]
+        return factor
+
+    def expected(self, name: str) -> float:
+        return max(self.timings.get(name, 1.0) * self.scale(name), 0.1)
+
+    def update(self, packages: Optional[int] = None, disk_mbps: Optional[float] = None):
+        """Rescales the remaining steps once the real figures are known."""
+        with self._lock:
+            if packages:
+                self.packages = packages
+            if disk_mbps:
+                self.disk_mbps = disk_mbps
+
+    def start(self, name: str):
+        with self._lock:
+            self._current = name
+            self._current_start = time.monotonic()
+            self._current_fraction = None
+
+    def step_fraction(self, fraction: float):
+        """Lets a step report its own progress (0-1) instead of the time-based guess."""
+        with self._lock:
+            self._current_fraction = max(0.0, min(fraction, 1.0))
+
+    def finish(self, name: str, duration: float):
+        with self._lock:
+            self._done[name] = duration
+            if self._current == name:
+                self._current = None
+
+    def _current_progress(self) -> float:
+        """Expected seconds of the running step that are behind us."""
+        if not self._current or self._current not in self.steps:
+            return 0.0
+        expected = self.expected(self._current)
+        if self._current_fraction is not None:
+            return expected * self._current_fraction
+        # Never claim a step is done while it is still running
+        return min(time.monotonic() - self._current_start, expected * 0.95)
+
+    def percent(self) -> float:
+        with self._lock:
+            total = sum(self.expected(s) for s in self.steps)
+            done = sum(self.expected(s) for s in self.steps if s in self._done)
+            value = 100.0 * (done + self._current_progress()) / total if total else 0.0
+            # Monotone even when a rescale shrinks the finished share
+            self._last_percent = max(self._last_percent, min(value, 99.9))
+            return self._last_percent
+
+    def eta(self) -> float:
+        """Seconds remaining."""
+        with self._lock:
+            remaining = sum(self.expected(s) for s in self.steps
+                            if s not in self._done and s != self._current)
+            if self._current:
+                expected = self.expected(self._current)
+                elapsed = time.monotonic() - self._current_start
+                if self._current_fraction:
+                    # Extrapolate from the step's own progress
+                    left = elapsed / self._current_fraction - elapsed
+                else:
+                    left = expected - elapsed
+                remaining += max(left, 1.0)
+            return remaining
+
+    def record(self, previous: Optional[Dict[str, float]] = None) -> Dict:
+        """
+        Folds this run's normalized durations into previously measured
+        timings (see load_recorded) and returns them for storing. Defaults
+        and profile overrides stay out of it.
+        """
+        timings = dict(previous or {})
+        for name, duration in self._done.items():
+            normalized = duration / self.scale(name)
+            if name in timings:
+                timings[name] = (1 - LEARNING_RATE) * timings[name] + LEARNING_RATE * normalized
+            else:
+                timings[name] = normalized
+        return {"reference": REFERENCE, "steps": {k: round(v, 2) for k, v in timings.items()}}
+
+
+class ProgressTicker:
+    """Re-emits the estimate every interval so the bar keeps moving during long steps."""
+
+    def __init__(self, emit: Callable[[], None], interval: float = 1.0):
+        self._emit = emit
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._emit()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
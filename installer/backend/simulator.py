@@ -0,0 +1,496 @@
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from backend.diskbench import parse_size
+from backend.executor import DryRunExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+MIB = 1024 * 1024
+ESP_PARTTYPE = "c12a7328-f81f-11d2-ba4b-00a0c93ec93b"
+LINUX_PARTTYPE = "0fc63daf-8483-4772-8e3d-693d7d47e4c8"
+
+# Used when a profile leaves them out: one 500 GiB SATA SSD, UEFI, 16 GiB RAM
+DEFAULT_HARDWARE = {
+    "bootMode": "UEFI",
+    "ramMB": 16384,
+    "online": True,
+    "seed": 0,
+    "timeScale": 1.0,
+    "latency": {"default": {"dist": "fixed", "value": 0.1}},
+    "disks": [{"name": "sda", "size": "500G", "model": "Simulated SSD", "tran": "sata"}],
+}
+
+# lsblk prints these as JSON booleans
+BOOLEAN_COLUMNS = {"ROTA", "RM"}
+
+# cryptsetup options that take a value as the next argument
+CRYPTSETUP_VALUE_OPTIONS = {
+    "--type", "--cipher", "-c", "--key-size", "-s", "--hash", "-h", "--uuid",
+    "--key-file", "-d", "--pbkdf", "--iter-time", "-i", "--pbkdf-memory",
+    "--pbkdf-parallel", "--pbkdf-force-iterations", "--sector-size", "--label",
+}
+
+
+def human_size(size: int) -> str:
+    """lsblk's SIZE column: 238.5G, 512M, 1T."""
+    units = "BKMGTPE"
+    value, unit = float(size), 0
+    while value >= 1024 and unit < len(units) - 1:
+        value /= 1024
+        unit += 1
+    text = f"{value:.1f}".rstrip("0").rstrip(".")
+    return f"{text}{units[unit]}" if unit else f"{size}B"
+
+
+def _partition_name(disk: str, number: int) -> str:
+    return f"{disk}{'p' if disk[-1].isdigit() else ''}{number}"
+
+
+def _position(text: str, disk_size: int) -> int:
+    """A parted start/end ("1MiB", "100%") in bytes."""
+    if text.endswith("%"):
+        return disk_size * int(float(text[:-1])) // 100
+    if text.endswith("MiB"):
+        return int(float(text[:-3]) * MIB)
+    return parse_size(text) or 0
+
+
+def sample_latency(spec: Dict, rng: random.Random) -> float:
+    """Seconds for one command, drawn from a latency spec."""
+    dist = spec.get("dist", "fixed")
+    if dist == "uniform":
+        return rng.uniform(spec.get("min", 0.0), spec.get("max", 0.0))
+    if dist == "normal":
+        return max(0.0, rng.gauss(spec.get("mean", 0.0), spec.get("stddev", 0.0)))
+    if dist == "lognormal":
+        # mean is the median; sigma the spread of its logarithm
+        return rng.lognormvariate(math.log(max(spec.get("mean", 0.001), 1e-6)), spec.get("sigma", 0.0))
+    return spec.get("value", 0.0)
+
+
+class HardwareSimulation:
+    """
+    Mutable machine state built from a declarative hardware profile:
+    disks and their partitions, filesystems, mounts and the files the
+    installer has written.
+
+    Profile keys (all optional, see DEFAULT_HARDWARE):
+      bootMode       "UEFI" or "BIOS"
+      ramMB          total RAM; availableMB defaults to 80% of it
+      online         whether ping succeeds
+      seed           for the latency draws, so runs are repeatable
+      timeScale      multiplies every latency (0 = no sleeping at all)
+      latency        {command name or "default": {"dist": "fixed"|"uniform"|
+                     "normal"|"lognormal", ...parameters}}
+      disks          [{"name", "size", "model", "serial", "rota", "tran",
+                     "rm", "slowdown", "partitions": [{"size", "fstype",
+                     "mountpoint"}], "count"}]; with count, the entry is
+                     repeated and "{n}" in name/serial is the index
+    """
+
+    def __init__(self, profile: Optional[Dict] = None):
+        spec = dict(DEFAULT_HARDWARE)
+        spec.update(profile or {})
+        self.boot_mode = spec["bootMode"]
+        self.ram_mb = int(spec["ramMB"])
+        self.available_mb = int(spec.get("availableMB", self.ram_mb * 0.8))
+        self.online = bool(spec["online"])
+        self.time_scale = float(spec["timeScale"])
+        self.latency = spec["latency"]
+        self.rng = random.Random(spec["seed"])
+        self.lock = threading.RLock()
+
+        self.disks: Dict[str, Dict] = {}
+        self.mounts: Dict[str, str] = {}  # target -> source
+        self.mappers: Dict[str, Dict] = {}  # /dev/mapper/name -> device
+        self.files: set = set()
+        self.dirs: set = {"/"}
+        for entry in spec["disks"]:
+            for n in range(int(entry.get("count", 1))):
+                self._add_disk(entry, n)
+
+    @classmethod
+    def load(cls, path: str) -> "HardwareSimulation":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _add_disk(self, entry: Dict, n: int):
+        name = entry["name"].format(n=n)
+        size = parse_size(str(entry.get("size", "500G"))) or 0
+        disk = {
+            "name": name,
+            "path": f"/dev/{name}",
+            "size": size,
+            "type": "disk",
+            "model": entry.get("model", "Simulated Disk"),
+            "serial": entry.get("serial", f"SIM{name.upper()}").format(n=n),
+            "rota": bool(entry.get("rota", False)),
+            "tran": entry.get("tran", "nvme" if name.startswith("nvme") else "sata"),
+            "rm": bool(entry.get("rm", entry.get("tran") == "usb")),
+            "slowdown": float(entry.get("slowdown", 1.0)),
+            "pttype": None,
+            "children": [],
+        }
+        self.disks[disk["path"]] = disk
+        start = MIB
+        for p in entry.get("partitions", []):
+            part_size = parse_size(str(p.get("size", "0"))) or size - start
+            part = self._new_partition(disk, part_size)
+            part["fstype"] = p.get("fstype")
+            part["uuid"] = str(uuid.UUID(int=self.rng.getrandbits(128))) if part["fstype"] else None
+            if p.get("mountpoint"):
+                self.mount(part["path"], p["mountpoint"])
+            start += part_size
+
+    def _new_partition(self, disk: Dict, size: int) -> Dict:
+        number = len(disk["children"]) + 1
+        name = _partition_name(disk["name"], number)
+        part = {
+            "name": name,
+            "path": f"/dev/{name}",
+            "size": size,
+            "type": "part",
+            "pkname": disk["name"],
+            "fstype": None,
+            "uuid": None,
+            "partuuid": str(uuid.UUID(int=self.rng.getrandbits(128))),
+            "parttype": LINUX_PARTTYPE,
+            "children": [],
+        }
+        disk["children"].append(part)
+        return part
+
+    def device(self, path: str) -> Optional[Dict]:
+        if path in self.disks:
+            return self.disks[path]
+        if path in self.mappers:
+            return self.mappers[path]
+        for disk in self.disks.values():
+            for part in disk["children"]:
+                if part["path"] == path:
+                    return part
+        return None
+
+    def disk_of(self, path: str) -> Optional[Dict]:
+        """The disk a device, or a path on a mounted filesystem, lives on."""
+        for target in sorted(self.mounts, key=len, reverse=True):
+            if path == target or path.startswith(target.rstrip("/") + "/"):
+                path = self.mounts[target]
+                break
+        dev = self.device(path)
+        while dev is not None and dev["type"] != "disk":
+            dev = self.device(f"/dev/{dev['pkname']}") if dev.get("pkname") else None
+        return dev
+
+    def mountpoint_of(self, dev: Dict) -> Optional[str]:
+        for target, source in self.mounts.items():
+            if source == dev["path"]:
+                return target
+        return None
+
+    def mount(self, source: str, target: str):
+        self.mounts[target.rstrip("/") or "/"] = source
+        self.add_dir(target)
+
+    def add_dir(self, path: str):
+        while path and path not in self.dirs:
+            self.dirs.add(path)
+            path = os.path.dirname(path)
+
+    def meminfo(self) -> Dict[str, int]:
+        return {"MemTotal": self.ram_mb * 1024, "MemAvailable": self.available_mb * 1024}
+
+
+class SimulatedExecutor(DryRunExecutor):
+    """
+    A DryRunExecutor that answers the installer's probes (lsblk, findmnt,
+    blkid, test, ping) from a HardwareSimulation and applies its mutating
+    commands (parted, wipefs, mkfs, cryptsetup, mount, umount) to it, with
+    each command taking a latency drawn from the profile.
+    """
+
+    def __init__(self, simulation: HardwareSimulation):
+        super().__init__()
+        self.sim = simulation
+
+    @classmethod
+    def from_file(cls, path: str) -> "SimulatedExecutor":
+        return cls(HardwareSimulation.load(path))
+
+    def run(self, cmd: List[str], check: bool = True, capture_output: bool = True, input: str = None, log_output: bool = True) -> subprocess.CompletedProcess:
+        self.check_cancelled()
+        cached = self._cached_probe(cmd, check, capture_output, input)
+        if cached is not None:
+            return cached
+        if log_output and input is None:
+            logger.info(f"[SIMULATED] {' '.join(cmd)}")
+        else:
+            logger.info(f"[SIMULATED] {cmd[0]} ... (args hidden/input provided)")
+
+        name = os.path.basename(cmd[0])
+        handler = getattr(self, f"_sim_{name.split('.')[0].replace('-', '_')}", None)
+        with self.sim.lock:
+            returncode, stdout = handler(cmd) if handler else (0, "")
+            delay = self._latency(name, cmd)
+        self.check_cancelled()
+        if delay:
+            time.sleep(delay)
+
+        result = subprocess.CompletedProcess(cmd, returncode, stdout, "")
+        self._record_result(cmd, capture_output, input, result)
+        if check:
+            result.check_returncode()
+        return result
+
+    def _latency(self, name: str, cmd: List[str]) -> float:
+        spec = self.sim.latency.get(name) or self.sim.latency.get("default") or {}
+        delay = sample_latency(spec, self.sim.rng) * self.sim.time_scale
+        # Slow targets (USB sticks, failing drives) stretch whatever touches them
+        slowdown = max((d["slowdown"] for d in (self.sim.disk_of(a) for a in cmd[1:] if a.startswith("/")) if d),
+                       default=1.0)
+        return delay * slowdown
+
+    def meminfo(self) -> Dict[str, int]:
+        return self.sim.meminfo()
+
+    # Probes
+
+    def _sim_lsblk(self, cmd: List[str]) -> Tuple[int, str]:
+        flags, columns, paths = set(), ["NAME"], []
+        args = iter(cmd[1:])
+        for arg in args:
+            if arg in ("-o", "--output"):
+                columns = next(args).upper().split(",")
+            elif arg.startswith("-") and not arg.startswith("--"):
+                flags.update(arg[1:])
+            elif arg.startswith("/"):
+                paths.append(arg)
+        with_children = "d" not in flags
+        if paths:
+            roots = [self.sim.device(p) for p in paths]
+            if None in roots:
+                return 32, ""
+        else:
+            roots = list(self.sim.disks.values())
+
+        def row(dev: Dict) -> Dict:
+            out = {}
+            for col in columns:
+                if col == "SIZE":
+                    value = human_size(dev["size"])
+                elif col == "MOUNTPOINT":
+                    value = self.sim.mountpoint_of(dev)
+                elif col in BOOLEAN_COLUMNS:
+                    value = bool(dev.get(col.lower()))
+                else:
+                    value = dev.get(col.lower())
+                out[col.lower()] = value
+            if with_children and dev["children"]:
+                out["children"] = [row(c) for c in dev["children"]]
+            return out
+
+        if "J" in flags:
+            return 0, json.dumps({"blockdevices": [row(d) for d in roots]})
+
+        lines = [] if "n" in flags else [" ".join(columns)]
+
+        def text(dev: Dict):
+            values = row(dev)
+            lines.append(" ".join("" if values[c.lower()] in (None, False) else
+                                  "1" if values[c.lower()] is True else str(values[c.lower()])
+                                  for c in columns))
+            if with_children:
+                for child in dev["children"]:
+                    text(child)
+
+        for dev in roots:
+            text(dev)
+        return 0, "\n".join(lines) + "\n"
+
+    def _sim_findmnt(self, cmd: List[str]) -> Tuple[int, str]:
+        column, target = "SOURCE", None
+        args = iter(cmd[1:])
+        for arg in args:
+            if arg in ("-o", "--output"):
+                column = next(args).upper()
+            elif not arg.startswith("-"):
+                target = arg.rstrip("/") or "/"
+        if target not in self.sim.mounts:
+            return 1, ""
+        source = self.sim.mounts[target]
+        dev = self.sim.device(source) or {}
+        value = {"SOURCE": source, "TARGET": target, "FSTYPE": dev.get("fstype") or ""}.get(column, "")
+        return 0, f"{value}\n"
+
+    def _sim_blkid(self, cmd: List[str]) -> Tuple[int, str]:
+        tag = "UUID"
+        if "-s" in cmd:
+            tag = cmd[cmd.index("-s") + 1]
+        dev = self.sim.device(cmd[-1])
+        value = dev and dev.get(tag.lower())
+        return (0, f"{value}\n") if value else (2, "")
+
+    def _sim_test(self, cmd: List[str]) -> Tuple[int, str]:
+        if len(cmd) != 3:
+            return 1, ""
+        op, path = cmd[1], cmd[2].rstrip("/") or "/"
+        if path == "/sys/firmware/efi":
+            exists_dir, exists_file = self.sim.boot_mode == "UEFI", False
+        else:
+            exists_dir, exists_file = path in self.sim.dirs, path in self.sim.files
+        ok = {"-d": exists_dir, "-f": exists_file, "-e": exists_dir or exists_file}.get(op, False)
+        return (0 if ok else 1), ""
+
+    def _sim_ping(self, cmd: List[str]) -> Tuple[int, str]:
+        return (0 if self.sim.online else 1), ""
+
+    # Mutations
+
+    def _sim_parted(self, cmd: List[str]) -> Tuple[int, str]:
+        args = [a for a in cmd[1:] if a != "-s"]
+        disk = self.sim.device(args[0])
+        if not disk or disk["type"] != "disk":
+            return 1, ""
+        action = args[1]
+        if action == "mklabel":
+            disk["pttype"] = "gpt" if args[2] == "gpt" else "dos"
+            disk["children"] = []
+        elif action == "mkpart":
+            start, end = _position(args[-2], disk["size"]), _position(args[-1], disk["size"])
+            self.sim._new_partition(disk, max(end - start, 0))
+        elif action == "set":
+            part = disk["children"][int(args[2]) - 1]
+            if args[3] == "esp" and args[4] == "on":
+                part["parttype"] = ESP_PARTTYPE
+        return 0, ""
+
+    def _sim_wipefs(self, cmd: List[str]) -> Tuple[int, str]:
+        dev = self.sim.device(cmd[-1])
+        if not dev:
+            return 1, ""
+        dev["fstype"] = dev["uuid"] = None
+        if dev["type"] == "disk":
+            dev["pttype"] = None
+            dev["children"] = []
+        return 0, ""
+
+    def _format(self, cmd: List[str], fstype: str, fs_uuid: Optional[str]) -> Tuple[int, str]:
+        if not cmd[-1].startswith("/dev/"):
+            # A swapfile or image file
+            self.sim.files.add(cmd[-1])
+            return 0, ""
+        dev = self.sim.device(cmd[-1])
+        if not dev:
+            return 1, ""
+        dev["fstype"] = fstype
+        dev["uuid"] = fs_uuid or str(uuid.UUID(int=self.sim.rng.getrandbits(128)))
+        return 0, ""
+
+    def _sim_mkfs(self, cmd: List[str]) -> Tuple[int, str]:
+        fstype = os.path.basename(cmd[0]).split(".", 1)[1]
+        if fstype == "fat":
+            serial = cmd[cmd.index("-i") + 1] if "-i" in cmd else f"{self.sim.rng.getrandbits(32):08X}"
+            return self._format(cmd, "vfat", f"{serial[:4]}-{serial[4:]}")
+        return self._format(cmd, fstype, cmd[cmd.index("-U") + 1] if "-U" in cmd else None)
+
+    def _sim_mkswap(self, cmd: List[str]) -> Tuple[int, str]:
+        return self._format(cmd, "swap", cmd[cmd.index("-U") + 1] if "-U" in cmd else None)
+
+    def _sim_cryptsetup(self, cmd: List[str]) -> Tuple[int, str]:
+        options, positional = {}, []
+        args = iter(cmd[1:])
+        for arg in args:
+            if arg.startswith("--") and "=" in arg:
+                key, _, value = arg.partition("=")
+                options[key] = value
+            elif arg in CRYPTSETUP_VALUE_OPTIONS:
+                options[arg] = next(args, "")
+            elif not arg.startswith("-"):
+                positional.append(arg)
+        if not positional:
+            return 0, ""
+        action = positional[0]
+        if action == "luksFormat":
+            return self._format(cmd, "crypto_LUKS", options.get("--uuid"))
+        if action in ("open", "luksOpen") and len(positional) >= 3:
+            parent = self.sim.device(positional[1])
+            if not parent:
+                return 1, ""
+            mapper = {
+                "name": positional[2], "path": f"/dev/mapper/{positional[2]}", "size": parent["size"],
+                "type": "crypt", "pkname": parent["name"], "fstype": None, "uuid": None,
+                "children": [],
+            }
+            parent["children"] = [mapper]
+            self.sim.mappers[mapper["path"]] = mapper
+        elif action in ("close", "luksClose") and len(positional) >= 2:
+            mapper = self.sim.mappers.pop(f"/dev/mapper/{positional[1]}", None)
+            parent = mapper and self.sim.device(f"/dev/{mapper['pkname']}")
+            if parent:
+                parent["children"] = []
+        return 0, ""
+
+    def _sim_mount(self, cmd: List[str]) -> Tuple[int, str]:
+        args = iter(cmd[1:])
+        positional = []
+        for arg in args:
+            if arg in ("-o", "-t"):
+                next(args)
+            elif not arg.startswith("-"):
+                positional.append(arg)
+        if len(positional) != 2:
+            return 0, ""
+        source, target = positional
+        if source.startswith("/dev/") and not self.sim.device(source):
+            return 32, ""
+        self.sim.mount(source, target)
+        return 0, ""
+
+    def _sim_umount(self, cmd: List[str]) -> Tuple[int, str]:
+        recursive = any(a in ("-R", "--recursive") for a in cmd)
+        targets = [a.rstrip("/") or "/" for a in cmd[1:] if not a.startswith("-")]
+        found = False
+        for target in targets:
+            for mounted in list(self.sim.mounts):
+                if mounted == target or (recursive and mounted.startswith(target + "/")):
+                    del self.sim.mounts[mounted]
+                    found = True
+        return (0 if found else 32), ""
+
+    # File operations land in the simulated tree so later probes see them
+
+    def write_file(self, path: str, content: str,
+                   mode: Optional[int] = None, owner: Optional[str] = None, atomic: bool = True):
+        self.probes.invalidate_paths(path)
+        with self.sim.lock:
+            self.sim.files.add(path)
+            self.sim.add_dir(os.path.dirname(path))
+
+    def makedirs(self, path: str):
+        self.probes.invalidate_paths(path)
+        with self.sim.lock:
+            self.sim.add_dir(path.rstrip("/") or "/")
+
+    def symlink(self, target: str, link: str):
+        self.probes.invalidate_paths(link)
+        with self.sim.lock:
+            self.sim.files.add(link)
+            self.sim.add_dir(os.path.dirname(link))
+
+    def remove(self, path: str, recursive: bool = False):
+        self.probes.invalidate_paths(path)
+        with self.sim.lock:
+            self.sim.files.discard(path)
+            if recursive:
+                self.sim.files = {f for f in self.sim.files if not f.startswith(path.rstrip("/") + "/")}
+                self.sim.dirs = {d for d in self.sim.dirs if d != path and not d.startswith(path.rstrip("/") + "/")}
+            else:
+                self.sim.dirs.discard(path)
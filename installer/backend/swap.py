@@ -0,0 +1,123 @@
+import logging
+import os
+from typing import Dict, List, Optional
+from backend.executor import SystemExecutor
+from backend.sysinfo import read_meminfo
+
+logger = logging.getLogger("EndOS-Installer")
+
+ZRAM_CONF = "/etc/systemd/zram-generator.conf"
+SYSCTL_CONF = "/etc/sysctl.d/99-endos-swap.conf"
+
+# Machines with less RAM than this get a disk swapfile behind zram when
+# the profile leaves it on "auto"
+SWAPFILE_AUTO_BELOW_MB = 8 * 1024
+SWAPFILE_MAX_MB = 8 * 1024
+
+
+def zram_size(ram_mb: int) -> str:
+    """zram-generator size expression (MiB): all of small RAM, half of mid, capped at 8 GiB."""
+    if ram_mb <= 4 * 1024:
+        return "ram"
+    return "min(ram / 2, 8192)"
+
+
+def zram_algorithm(cpus: int) -> str:
+    # zstd packs ~30% more into the same RAM, but on one or two cores its
+    # compression cost shows up as stalls; lz4 is several times faster
+    return "lz4" if cpus <= 2 else "zstd"
+
+
+def render_sysctl(zram: bool, rotational: bool) -> str:
+    lines = ["# Generated by the EndOS installer"]
+    if zram:
+        # Swapping to zram is far cheaper than dropping page cache that
+        # must be re-read from disk, and it has no seek cost to amortize
+        lines += [
+            "vm.swappiness = 180",
+            "vm.page-cluster = 0",
+            "vm.watermark_boost_factor = 0",
+            "vm.watermark_scale_factor = 125",
+        ]
+    else:
+        # Disk-only swap: read ahead in larger clusters on spinning disks
+        lines += ["vm.swappiness = 60", f"vm.page-cluster = {3 if rotational else 0}"]
+    return "\n".join(lines) + "\n"
+
+
+class SwapProvisioner:
+    """
+    Sizes swap for the installed machine: zram by RAM and CPU, an optional
+    swapfile on the root filesystem, and the matching VM sysctls.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def plan(self, zram: bool = True, swapfile="auto", swapfile_mb: int = 0,
+             meminfo: Optional[Dict[str, int]] = None, cpus: Optional[int] = None) -> Dict:
+        info = read_meminfo() if meminfo is None else meminfo
+        ram_mb = info.get("MemTotal", 0) // 1024
+        cpus = cpus or os.cpu_count() or 1
+
+        if swapfile == "auto":
+            swapfile = 0 < ram_mb < SWAPFILE_AUTO_BELOW_MB
+        size = 0
+        if swapfile:
+            size = swapfile_mb or min(max(ram_mb, 1024), SWAPFILE_MAX_MB)
+        return {
+            "ram_mb": ram_mb,
+            "zram": bool(zram),
+            "zram_size": zram_size(ram_mb),
+            "zram_algorithm": zram_algorithm(cpus),
+            "swapfile_mb": size,
+        }
+
+    def packages(self, plan: Dict) -> List[str]:
+        return ["zram-generator"] if plan["zram"] else []
+
+    def create_swapfile(self, mount_point: str, fstype: str, size_mb: int) -> str:
+        """Creates the swapfile and returns its path inside the target."""
+        if fstype == "btrfs":
+            # A nested subvolume keeps the swapfile out of snapshots of @,
+            # which btrfs would otherwise refuse while it is active.
+            # mkswapfile sets NOCOW and disables compression for it.
+            path = "/swap/swapfile"
+            self.executor.run(["btrfs", "subvolume", "create", f"{mount_point}/swap"])
+            self.executor.run(
+                ["btrfs", "filesystem", "mkswapfile", "--size", f"{size_mb}m", f"{mount_point}{path}"]
+            )
+        else:
+            path = "/swapfile"
+            # Preallocated extents are fine for swap on ext4, no need to write zeros
+            self.executor.run(["fallocate", "-l", f"{size_mb}M", f"{mount_point}{path}"])
+            self.executor.run(["chmod", "600", f"{mount_point}{path}"])
+            self.executor.run(["mkswap", f"{mount_point}{path}"])
+        return path
+
+    def provision(self, mount_point: str, plan: Dict, fstype: str, rotational: bool) -> Dict:
+        """
+        Writes the zram and sysctl config and creates the swapfile.
+        Returns step metrics; "swapfile" is the path for fstab, if any.
+        """
+        with self.executor.batch():
+            if plan["zram"]:
+                self.executor.write_file(
+                    f"{mount_point}{ZRAM_CONF}",
+                    "[zram0]\n"
+                    f"zram-size = {plan['zram_size']}\n"
+                    f"compression-algorithm = {plan['zram_algorithm']}\n"
+                    "swap-priority = 100\n",
+                )
+            self.executor.write_file(
+                f"{mount_point}{SYSCTL_CONF}", render_sysctl(plan["zram"], rotational)
+            )
+
+        metrics = {
+            "ram_mb": plan["ram_mb"],
+            "zram": f"{plan['zram_size']} {plan['zram_algorithm']}" if plan["zram"] else "off",
+        }
+        if plan["swapfile_mb"]:
+            metrics["swapfile"] = self.create_swapfile(mount_point, fstype, plan["swapfile_mb"])
+            metrics["swapfile_mb"] = plan["swapfile_mb"]
+        return metrics
@@ -0,0 +1,33 @@
+from typing import Dict
+
+
+def read_meminfo() -> Dict[str, int]:
+    """Returns /proc/meminfo values in KiB."""
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                info[key] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return info
+
+
+def read_pressure(resource: str = "memory") -> Dict[str, int]:
+    """
+    Returns cumulative PSI stall time in microseconds from /proc/pressure:
+    {"some": ..., "full": ...}. Empty without PSI support (CONFIG_PSI).
+    """
+    totals = {}
+    try:
+        with open(f"/proc/pressure/{resource}") as f:
+            for line in f:
+                kind, *fields = line.split()
+                for field in fields:
+                    key, _, value = field.partition("=")
+                    if key == "total":
+                        totals[kind] = int(value)
+    except (OSError, ValueError):
+        pass
+    return totals
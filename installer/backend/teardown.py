@@ -0,0 +1,128 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from backend.executor import SystemExecutor
+from backend.sysinfo import read_meminfo
+
+logger = logging.getLogger("EndOS-Installer")
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+
+def pending_writeback_kb() -> int:
+    info = read_meminfo()
+    return info.get("Dirty", 0) + info.get("Writeback", 0)
+
+
+def syncfs(path: str):
+    """Flushes one filesystem, unlike sync(2) which waits on every mounted device."""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        if _libc.syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+    finally:
+        os.close(fd)
+
+
+def mounts_under(mount_point: str) -> List[str]:
+    """Every mount at or below mount_point, deepest first (unmount order)."""
+    found = []
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                # Spaces in mount paths are escaped as \040
+                target = line.split()[1].replace("\\040", " ")
+                if target == mount_point or target.startswith(mount_point.rstrip("/") + "/"):
+                    found.append(target)
+    except OSError:
+        pass
+    return sorted(set(found), key=lambda m: m.count("/"), reverse=True)
+
+
+class TeardownManager:
+    """
+    Final install stage: flushes each target filesystem, reporting writeback
+    progress, then unmounts everything in reverse order.
+    """
+
+    def __init__(self, executor: SystemExecutor, dry_run: bool = False):
+        self.executor = executor
+        self._dry_run = dry_run
+
+    def teardown(self, mount_point: str, layout_mounts: List[str],
+                 progress: Optional[Callable[[float, str], None]] = None) -> Dict:
+        """
+        layout_mounts: mountpoints the installer created ("/", "/boot"), used
+        when the live mount table has nothing under mount_point (dry run).
+        progress: called with (fraction 0-1, message) while flushing.
+        Returns step metrics.
+        """
+        mounts = mounts_under(mount_point)
+        if not mounts:
+            mounts = sorted(
+                {f"{mount_point.rstrip('/')}{m}".rstrip("/") or "/" for m in layout_mounts},
+                key=lambda m: m.count("/"),
+                reverse=True,
+            )
+
+        start = time.monotonic()
+        initial_kb = pending_writeback_kb()
+        if not self._dry_run:
+            self._flush(mounts, initial_kb, progress)
+        flush_time = time.monotonic() - start
+
+        for mnt in mounts:
+            result = self.executor.run(["umount", mnt], check=False)
+            if result.returncode != 0:
+                # Something still holds it open; detach it so the disk can be
+                # released; syncfs has already written its data out
+                logger.warning(f"{mnt} is busy, detaching it lazily")
+                self.executor.run(["umount", "-l", mnt], check=False)
+
+        return {
+            "flushed_mb": initial_kb // 1024,
+            "flush_s": round(flush_time, 1),
+            "unmounted": len(mounts),
+        }
+
+    def _flush(self, mounts: List[str], initial_kb: int,
+               progress: Optional[Callable[[float, str], None]]):
+        errors = []
+
+        def worker():
+            # Deepest first, matching the unmount order
+            for mnt in mounts:
+                try:
+                    syncfs(mnt)
+                except OSError as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(0.5)
+            if progress:
+                pending = pending_writeback_kb()
+                fraction = 1.0 - pending / initial_kb if initial_kb else 1.0
+                progress(max(0.0, min(fraction, 1.0)), f"Writing data to disk ({pending // 1024} MiB left)...")
+
+        for e in errors:
+            logger.warning(f"syncfs failed: {e}")
+
+    def abort(self, mount_point: Optional[str], extra_mounts: Optional[List[str]] = None):
+        """
+        Cleanup after a cancelled install: unmounts extra_mounts, then
+        everything under the target (including arch-chroot's API mounts),
+        deepest first, without waiting for a flush. mount_point is None if
+        the target was never mounted.
+        """
+        targets = mounts_under(mount_point) if mount_point else []
+        for mnt in (extra_mounts or []) + targets:
+            result = self.executor.run(["umount", mnt], check=False)
+            if result.returncode != 0:
+                self.executor.run(["umount", "-l", mnt], check=False)
@@ -0,0 +1,149 @@
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+# Searched in this order inside the target root, like systemd's own unit path
+UNIT_DIRS = ["/etc/systemd/system", "/usr/local/lib/systemd/system", "/usr/lib/systemd/system"]
+SYSTEM_CONF = "/etc/systemd/system"
+
+# [Install] directives that create a link in <target>.<suffix>/
+DEPENDENCY_SUFFIXES = {"WantedBy": "wants", "RequiredBy": "requires", "UpheldBy": "upholds"}
+
+
+def unit_name(name: str) -> str:
+    return name if "." in name else f"{name}.service"
+
+
+def parse_install_section(text: str) -> Dict[str, List[str]]:
+    """Returns the [Install] directives of a unit file, as lists of values."""
+    install: Dict[str, List[str]] = {}
+    section = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+            continue
+        if section != "Install" or "=" not in line:
+            continue
+        key, value = (part.strip() for part in line.split("=", 1))
+        if not value:
+            # An empty assignment resets the list
+            install[key] = []
+        else:
+            install.setdefault(key, []).extend(value.split())
+    return install
+
+
+class UnitEnabler:
+    """
+    Enables systemd units in an offline root by reading their [Install]
+    sections and creating the wants/requires/alias symlinks directly,
+    the way `systemctl --root` would, without chrooting.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def find_unit(self, root: str, name: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns (path inside the root, file contents) for a unit. Instances
+        such as getty@tty1.service resolve to their template.
+        """
+        candidates = [name]
+        prefix, at, rest = name.partition("@")
+        if at and not rest.startswith("."):
+            candidates.append(f"{prefix}@{rest[rest.index('.'):]}")
+        for unit_dir in UNIT_DIRS:
+            for candidate in candidates:
+                path = f"{unit_dir}/{candidate}"
+                try:
+                    with open(f"{root}{path}") as f:
+                        return path, f.read()
+                except OSError:
+                    continue
+        return None
+
+    def plan(self, root: str, units: List[str]) -> Dict:
+        """
+        Resolves every link needed to enable the units (following Also=).
+        Returns {"links": {link: target}, "enabled", "missing", "conflicts"}.
+        """
+        links: Dict[str, str] = {}
+        enabled, missing, conflicts = [], [], []
+        queue = [unit_name(u) for u in units]
+        seen = set()
+
+        while queue:
+            name = queue.pop(0)
+            if name in seen:
+                continue
+            seen.add(name)
+
+            found = self.find_unit(root, name)
+            if not found:
+                missing.append(name)
+                continue
+            path, text = found
+            install = parse_install_section(text)
+
+            prefix, at, rest = name.partition("@")
+            if at and rest.startswith(".") and install.get("DefaultInstance"):
+                # Enabling a bare template means enabling its default instance
+                name = f"{prefix}@{install['DefaultInstance'][-1]}{rest}"
+
+            unit_links = {}
+            for key, suffix in DEPENDENCY_SUFFIXES.items():
+                for target in install.get(key, []):
+                    unit_links[f"{SYSTEM_CONF}/{target}.{suffix}/{name}"] = path
+
+            clash = None
+            for alias in install.get("Alias", []):
+                link = f"{SYSTEM_CONF}/{alias}"
+                existing = links.get(link) or self._existing_link(root, link)
+                if existing and os.path.basename(existing) != os.path.basename(path):
+                    clash = (alias, os.path.basename(existing))
+                    break
+                unit_links[link] = path
+
+            if clash:
+                alias, owner = clash
+                logger.warning(f"Not enabling {name}: {alias} is already provided by {owner}")
+                conflicts.append({"unit": name, "alias": alias, "owner": owner})
+                continue
+
+            if not unit_links and not install.get("Also"):
+                logger.info(f"{name} has no [Install] section, nothing to enable")
+            links.update(unit_links)
+            enabled.append(name)
+            queue.extend(install.get("Also", []))
+
+        return {"links": links, "enabled": enabled, "missing": missing, "conflicts": conflicts}
+
+    def _existing_link(self, root: str, link: str) -> Optional[str]:
+        try:
+            return os.readlink(f"{root}{link}")
+        except OSError:
+            return None
+
+    def enable(self, root: str, units: List[str]) -> Dict:
+        """Enables the units in one pass. Returns step metrics."""
+        plan = self.plan(root, units)
+        # One helper round trip for all of them
+        with self.executor.batch():
+            for d in sorted({os.path.dirname(link) for link in plan["links"]}):
+                self.executor.makedirs(f"{root}{d}")
+            for link, target in plan["links"].items():
+                self.executor.symlink(target, f"{root}{link}")
+
+        for name in plan["missing"]:
+            logger.warning(f"Unit {name} not found in target, not enabled")
+        return {
+            "enabled": len(plan["enabled"]),
+            "missing": ",".join(plan["missing"]) or "none",
+            "conflicts": ",".join(c["unit"] for c in plan["conflicts"]) or "none",
+        }
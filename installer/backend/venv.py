@@ -0,0 +1,142 @@
+import glob
+import logging
+import os
+from typing import Dict, Optional
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+VENV_PATH = "/usr/share/quickshell/venv"
+# Wheel caches left on the ISO by build.sh / customize_airootfs.sh
+WHEEL_DIRS = ["/var/cache/wheels", "/root/.cache/wheels"]
+REQUIREMENTS = "/etc/skel/dots-hyprland/sdata/uv/requirements.txt"
+
+WHEEL_MOUNT = "/tmp/endos-wheels"
+
+
+class VenvProvisioner:
+    """
+    Builds the quickshell venv in the target without dragging along the
+    live copy's stale bytecode, then precompiles it for the target's
+    interpreter on every core.
+    """
+
+    def __init__(self, executor: SystemExecutor):
+        self.executor = executor
+
+    def wheel_dir(self) -> Optional[str]:
+        for d in WHEEL_DIRS:
+            if glob.glob(f"{d}/*.whl"):
+                return d
+        return None
+
+    def interpreter(self, venv: str = VENV_PATH) -> str:
+        """Returns the pythonX.Y the live venv was built with, from pyvenv.cfg."""
+        try:
+            with open(f"{venv}/pyvenv.cfg") as f:
+                for line in f:
+                    key, _, value = line.partition("=")
+                    if key.strip() in ("version", "version_info"):
+                        major, minor = value.strip().split(".")[:2]
+                        return f"python{major}.{minor}"
+        except (OSError, ValueError):
+            pass
+        return "python3"
+
+    def requirements(self) -> Optional[str]:
+        if os.path.exists(REQUIREMENTS):
+            with open(REQUIREMENTS) as f:
+                return f.read()
+        if os.path.exists(f"{VENV_PATH}/bin/python"):
+            result = self.executor.run([f"{VENV_PATH}/bin/python", "-m", "pip", "freeze"], check=False)
+            return result.stdout or None
+        return None
+
+    def same_filesystem(self, mount_point: str) -> bool:
+        try:
+            return os.stat(VENV_PATH).st_dev == os.stat(mount_point).st_dev
+        except OSError:
+            return False
+
+    def provision(self, mount_point: str) -> Dict:
+        """Returns step metrics."""
+        dest = f"{mount_point}{VENV_PATH}"
+        python = self.interpreter()
+        wheels = self.wheel_dir()
+        requirements = self.requirements() if wheels else None
+
+        self.executor.makedirs(os.path.dirname(dest))
+
+        if wheels and requirements:
+            mode = "wheels"
+            self._install_from_wheels(mount_point, python, wheels, requirements)
+        elif not os.path.exists(VENV_PATH):
+            logger.warning(f"No wheel cache and no {VENV_PATH} on the live system, skipping venv")
+            return {"mode": "skipped"}
+        elif self.same_filesystem(mount_point):
+            mode = "hardlink"
+            self.executor.run(["cp", "-al", VENV_PATH, dest])
+            self.executor.run(["find", dest, "-name", "__pycache__", "-prune", "-exec", "rm", "-rf", "{}", "+"])
+        else:
+            mode = "copy"
+            self.executor.run(["rsync", "-a", "--exclude=__pycache__", f"{VENV_PATH}/", f"{dest}/"])
+
+        if mode != "wheels":
+            self._relocate(mount_point)
+
+        # -j 0 uses every core
+        self.executor.run(
+            ["arch-chroot", mount_point, python, "-m", "compileall", "-q", "-j", "0", VENV_PATH],
+            check=False,
+        )
+        return {"mode": mode}
+
+    def _install_from_wheels(self, mount_point: str, python: str, wheels: str, requirements: str):
+        logger.info(f"Building venv from wheel cache {wheels}")
+        wheel_mnt = f"{mount_point}{WHEEL_MOUNT}"
+        self.executor.makedirs(wheel_mnt)
+        self.executor.run(["mount", "--bind", "-o", "ro", wheels, wheel_mnt])
+        try:
+            self.executor.write_file(f"{mount_point}/tmp/endos-requirements.txt", requirements)
+            self.executor.run(
+                ["arch-chroot", mount_point, python, "-m", "venv", "--system-site-packages", VENV_PATH]
+            )
+            self.executor.run(
+                [
+                    "arch-chroot",
+                    mount_point,
+                    f"{VENV_PATH}/bin/pip",
+                    "install",
+                    "--no-index",
+                    "--no-cache-dir",
+                    # Bytecode is compiled afterwards, in parallel
+                    "--no-compile",
+                    "--find-links",
+                    WHEEL_MOUNT,
+                    "-r",
+                    "/tmp/endos-requirements.txt",
+                ],
+                capture_output=False,
+            )
+        finally:
+            self.executor.run(["umount", wheel_mnt], check=False)
+            self.executor.remove(f"{mount_point}/tmp/endos-requirements.txt")
+
+    def _relocate(self, mount_point: str):
+        """
+        Points any script shebang that doesn't use the venv's own interpreter
+        back at it. sed -i writes a new file, so hardlinks to the live copy
+        are broken rather than edited in place.
+        """
+        dest = f"{mount_point}{VENV_PATH}"
+        for script in glob.glob(f"{dest}/bin/*"):
+            if os.path.islink(script) or not os.path.isfile(script):
+                continue
+            try:
+                with open(script, "rb") as f:
+                    first = f.readline()
+            except OSError:
+                continue
+            if first.startswith(b"#!") and b"python" in first and not first[2:].startswith(VENV_PATH.encode()):
+                interp = os.path.basename(first[2:].split()[0].decode(errors="ignore"))
+                self.executor.run(["sed", "-i", f"1s|.*|#!{VENV_PATH}/bin/{interp}|", script])
@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import logging
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from backend.executor import SystemExecutor
+
+logger = logging.getLogger("EndOS-Installer")
+
+SYNC_DIR = "/var/lib/pacman/sync"
+GNUPG_DIR = "/etc/pacman.d/gnupg"
+CHUNK = 1024 * 1024
+# More readers than this only makes a USB stick seek
+MAX_WORKERS = 4
+
+
+class PackageVerificationError(Exception):
+    """Raised when packages on the install medium are unreadable or corrupt."""
+
+
+def file_sha256(path: str, drop_cache: bool = False) -> Tuple[str, int]:
+    """SHA-256 and size of a file. drop_cache re-reads it from the device."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        if drop_cache:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            block = f.read(CHUNK)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def parse_desc(text: str) -> Dict[str, str]:
+    """A sync DB desc entry ("%KEY%\\nvalue\\n\\n...") as {KEY: value}."""
+    fields = {}
+    for block in text.split("\n\n"):
+        lines = block.strip().splitlines()
+        if len(lines) >= 2 and lines[0].startswith("%") and lines[0].endswith("%"):
+            fields[lines[0].strip("%")] = "\n".join(lines[1:])
+    return fields
+
+
+def read_sync_db(repo: str, sync_dir: str = SYNC_DIR) -> Dict[str, Dict]:
+    """The repo's sync DB as {filename: {"sha256", "pgpsig"}}."""
+    entries = {}
+    try:
+        with tarfile.open(f"{sync_dir}/{repo}.db", "r:*") as db:
+            for member in db:
+                if not member.name.endswith("/desc"):
+                    continue
+                desc = parse_desc(db.extractfile(member).read().decode(errors="replace"))
+                if "FILENAME" in desc:
+                    entries[desc["FILENAME"]] = {
+                        "sha256": desc.get("SHA256SUM"),
+                        "pgpsig": desc.get("PGPSIG"),
+                    }
+    except (OSError, tarfile.TarError) as e:
+        logger.warning(f"Cannot read the {repo} sync database: {e}")
+    return entries
+
+
+def resolve_files(executor: SystemExecutor, packages: List[str], pacman_conf: str) -> List[Dict]:
+    """
+    The package files the install would read from local repositories
+    (file:// servers, i.e. the live medium), as {"repo", "name", "path"}.
+    Downloads are checked by pacman itself.
+    """
+    result = executor.run(
+        ["pacman", "-Sp", "--config", pacman_conf, "--print-format", "%r %n %l"] + packages,
+        check=False,
+    )
+    if result.returncode != 0 or not result.stdout:
+        return []
+    files = []
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) != 3 or not parts[2].startswith("file://"):
+            continue
+        files.append({"repo": parts[0], "name": parts[1], "path": unquote(urlparse(parts[2]).path)})
+    return files
+
+
+class PackageVerifier:
+    """
+    Checks the package files pacstrap will read from the live medium
+    against the sync DB before anything is written to the target disk:
+    SHA-256 sums in a process pool, then signatures.
+    """
+
+    def __init__(self, executor: SystemExecutor, workers: Optional[int] = None, sync_dir: str = SYNC_DIR):
+        self.executor = executor
+        self.workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+        self.sync_dir = sync_dir
+
+    def verify(self, packages: List[str], pacman_conf: str = "/etc/pacman.conf",
+               gpg_dir: Optional[str] = None,
+               progress_cb: Optional[Callable[[float], None]] = None) -> Dict:
+        """
+        Returns metrics; raises PackageVerificationError listing the files
+        that are still bad after being read again from the device.
+        """
+        files = resolve_files(self.executor, packages, pacman_conf)
+        if not files:
+            return {"verify_files": 0}
+
+        dbs: Dict[str, Dict] = {}
+        for f in files:
+            if f["repo"] not in dbs:
+                dbs[f["repo"]] = read_sync_db(f["repo"], self.sync_dir)
+            f.update(dbs[f["repo"]].get(os.path.basename(f["path"]), {}))
+
+        start = time.monotonic()
+        total = 0
+        suspect = []
+        # forkserver: don't fork the GUI process and its threads for every worker
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            futures = {pool.submit(file_sha256, f["path"]): f for f in files}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    self.executor.check_cancelled()
+                    f = futures[future]
+                    try:
+                        try:
+                            digest, size = future.result()
+                        except BrokenProcessPool:
+                            # A worker died (OOM, ...); hash this one here instead
+                            digest, size = file_sha256(f["path"])
+                        total += size
+                        if f.get("sha256") and digest != f["sha256"]:
+                            suspect.append(f)
+                    except OSError as e:
+                        logger.warning(f"Cannot read {f['path']}: {e}")
+                        suspect.append(f)
+                    if progress_cb:
+                        progress_cb(done / len(files) * 0.8)
+            except BaseException:
+                # Don't hash the rest of the medium before giving up
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        elapsed = time.monotonic() - start
+
+        # A flaky read may have been served from (or into) the page cache;
+        # read it again from the device before calling the file corrupt
+        refetched, bad = [], []
+        for f in suspect:
+            self.executor.check_cancelled()
+            try:
+                digest, _ = file_sha256(f["path"], drop_cache=True)
+                ok = not f.get("sha256") or digest == f["sha256"]
+            except OSError:
+                ok = False
+            (refetched if ok else bad).append(f)
+
+        good = [f for f in files if f not in bad]
+        with ThreadPoolExecutor(self.workers) as pool:
+            signed = list(pool.map(lambda f: self._check_signature(f, gpg_dir), good))
+        bad += [f for f, ok in zip(good, signed) if ok is False]
+        if progress_cb:
+            progress_cb(1.0)
+
+        mb = total / (1024 * 1024)
+        logger.info(f"Verified {len(files)} local packages ({mb:.0f} MiB) at {mb / elapsed if elapsed else 0:.1f} MiB/s")
+        metrics = {
+            "verify_files": len(files),
+            "verify_mb": round(mb),
+            "verify_mbps": round(mb / elapsed, 1) if elapsed else 0.0,
+            "verify_refetched": len(refetched),
+            "verify_unsigned": signed.count(None),
+            "verify_bad": len(bad),
+        }
+        if bad:
+            names = ", ".join(sorted(f["name"] for f in bad))
+            raise PackageVerificationError(
+                f"Corrupt packages on the install medium: {names}. "
+                "The target disk has not been touched; re-create the USB stick and try again."
+            )
+        return metrics
+
+    def _check_signature(self, f: Dict, gpg_dir: Optional[str]) -> Optional[bool]:
+        """True/False for a (in)valid signature, None if the package is unsigned."""
+        sig_path = f"{f['path']}.sig"
+        tmp = None
+        if f.get("pgpsig"):
+            fd, tmp = tempfile.mkstemp(prefix="endos-verify-", suffix=".sig")
+            with os.fdopen(fd, "wb") as out:
+                out.write(base64.b64decode(f["pgpsig"]))
+            sig_path = tmp
+        elif not os.path.exists(sig_path):
+            return None
+        try:
+            result = self.executor.run(
+                ["pacman-key", "--gpgdir", gpg_dir or GNUPG_DIR, "--verify", sig_path, f["path"]],
+                check=False,
+            )
+            if result.returncode != 0:
+                logger.warning(f"Bad signature: {f['path']}")
+            return result.returncode == 0
+        finally:
+            if tmp:
+                os.unlink(tmp)
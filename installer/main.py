@@ -19,10 +19,10 @@ logger = logging.getLogger("EndOS-Installer")
 class InstallerBackend(QObject):
     """Bridge between QML and Python Logic."""
     
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, simulation=None):
         super().__init__()
-        self._dry_run = dry_run
-        self.executor = get_executor(dry_run)
+        self._dry_run = dry_run or simulation is not None
+        self.executor = get_executor(dry_run, simulation=simulation)
         logger.info(f"Initialized Backend (Dry-Run: {dry_run})")
 
     @Slot(str, result=str)
@@ -97,8 +97,15 @@ class ThemeManager(QObject):
 def main():
     parser = argparse.ArgumentParser(description="EndOS Graphical Installer")
     parser.add_argument("--dry-run", action="store_true", help="Simulate installation without making changes")
+    parser.add_argument("--simulate", metavar="PROFILE", help="Dry run against the hardware described in a JSON profile")
     args, qt_args = parser.parse_known_args()
 
+    # One simulated machine, shared by everything that runs commands
+    simulation = None
+    if args.simulate:
+        from backend.simulator import HardwareSimulation
+        simulation = HardwareSimulation.load(args.simulate)
+
     # Force Basic style and ignore user config
     os.environ["QT_QUICK_CONTROLS_STYLE"] = "Basic"
     os.environ["QT_QUICK_CONTROLS_CONF"] = "/dev/null"
@@ -136,10 +143,10 @@ def main():
     engine = QQmlApplicationEngine()
 
     # Backend
-    backend = InstallerBackend(dry_run=args.dry_run)
+    backend = InstallerBackend(dry_run=args.dry_run, simulation=simulation)
     backend.setParent(app)
     
-    installer = Installer(dry_run=args.dry_run)
+    installer = Installer(dry_run=args.dry_run, simulation=simulation)
     installer.setParent(app)
     
     theme = ThemeManager()
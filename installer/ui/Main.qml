@@ -152,6 +152,17 @@ ApplicationWindow {
                         Layout.fillWidth: true
                     }
                     
+                    Text {
+                        text: "Locales (first one is the system language)"; color: ThemeBridge.color("on_surface")
+                        font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
+                    }
+                    StyledTextField {
+                        id: localesField
+                        text: "en_US.UTF-8"
+                        placeholderText: "en_US.UTF-8, de_DE.UTF-8"
+                        Layout.fillWidth: true
+                    }
+
                     Component.onCompleted: {
                         var tzs = Installer.getTimezones()
                         for (var i=0; i<tzs.length; i++) regionModel.append({text: tzs[i]})
@@ -192,6 +203,25 @@ ApplicationWindow {
                         onClicked: diskSelectionPage.refreshDisks()
                     }
 
+                    CheckBox {
+                        id: encryptCheck
+                        text: "Encrypt the disk (LUKS2)"
+                        contentItem: Text {
+                            text: encryptCheck.text
+                            leftPadding: encryptCheck.indicator.width + encryptCheck.spacing
+                            verticalAlignment: Text.AlignVCenter
+                            color: ThemeBridge.color("on_surface")
+                            font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
+                        }
+                    }
+                    StyledTextField {
+                        id: encryptionPassphraseField
+                        visible: encryptCheck.checked
+                        echoMode: TextInput.Password
+                        placeholderText: "Disk passphrase (defaults to your user password)"
+                        Layout.fillWidth: true
+                    }
+
                     Item { Layout.fillHeight: true }
                     
                     RowLayout {
@@ -206,14 +236,30 @@ ApplicationWindow {
                     }
 
                     function refreshDisks() {
+                        var previous = diskSelector.currentIndex >= 0 && diskModel.count > 0
+                            ? diskModel.get(diskSelector.currentIndex).device : ""
                         diskModel.clear()
                         var disks = Installer.scanDisks()
+                        var pick = 0
                         for (var i=0; i<disks.length; i++) {
                             var d = disks[i]
                             var label = d.device + " (" + d.size + ") - " + d.model
+                            if (d.mbps !== undefined)
+                                label += " - " + Math.round(d.mbps) + " MB/s, " + d.iops + " IOPS"
+                            if (d.recommended) {
+                                label += " (recommended)"
+                                if (!previous) pick = i
+                            }
+                            if (d.device === previous) pick = i
                             diskModel.append({text: label, device: d.device})
                         }
-                        if (diskModel.count > 0) diskSelector.currentIndex = 0
+                        if (diskModel.count > 0) diskSelector.currentIndex = pick
+                    }
+
+                    // Benchmarks finish in the background; relabel when they do
+                    Connections {
+                        target: Installer
+                        function onDisksBenchmarked() { diskSelectionPage.refreshDisks() }
                     }
                 }
                 
@@ -326,6 +372,11 @@ ApplicationWindow {
                          color: ThemeBridge.color("on_surface")
                          font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
                      }
+                     Text {
+                         text: "Locales: " + selectedLocales().join(", ")
+                         color: ThemeBridge.color("on_surface")
+                         font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
+                     }
                      Text { 
                         text: "User: " + usernameField.text
                         color: ThemeBridge.color("on_surface")
@@ -379,7 +430,26 @@ ApplicationWindow {
                         font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
                         Layout.alignment: Qt.AlignHCenter
                     }
+
+                    Text {
+                        text: formatEta(installEta)
+                        visible: !installFinished && installEta > 0
+                        color: ThemeBridge.color("on_surface_variant")
+                        font.family: "Google Sans Flex"; font.weight: 450; font.variableAxes: ({"wght": 450, "wdth": 100})
+                        Layout.alignment: Qt.AlignHCenter
+                    }
                     
+                    StyledButton {
+                        text: installCancelling ? "Cancelling..." : "Cancel"
+                        visible: !installFinished
+                        enabled: !installCancelling
+                        Layout.alignment: Qt.AlignHCenter
+                        onClicked: {
+                            installCancelling = true
+                            Installer.cancelInstall()
+                        }
+                    }
+
                     StyledButton {
                         text: "Close"
                         visible: installFinished
@@ -395,13 +465,25 @@ ApplicationWindow {
     property string installStatus: "Installing..."
     property string installMessage: "Initializing..."
     property real installPercent: 0
+    property real installEta: 0
     property bool installFinished: false
+    property bool installCancelling: false
 
     Connections {
         target: Installer
-        function onProgressChanged(percent, msg) {
+        function onProgressChanged(percent, msg, eta) {
             installPercent = percent
             installMessage = msg
+            installEta = eta
+        }
+        function onCancelled() {
+            // Target is unmounted again; back to the summary so the user can retry
+            installCancelling = false
+            installPercent = 0
+            installEta = 0
+            installStatus = "Installing..."
+            installMessage = "Initializing..."
+            stackLayout.currentIndex = 5
         }
         function onFinished(success, msg) {
             installFinished = true
@@ -411,6 +493,16 @@ ApplicationWindow {
         }
     }
 
+    function formatEta(seconds) {
+        if (seconds < 60) return "Less than a minute remaining"
+        var minutes = Math.round(seconds / 60)
+        return "About " + minutes + (minutes === 1 ? " minute" : " minutes") + " remaining"
+    }
+
+    function selectedLocales() {
+        return localesField.text.split(/[\s,]+/).filter(l => l !== "")
+    }
+
     function beginInstall() {
         var selectedDisk = ""
         if (diskModel.count > 0 && diskSelector.currentIndex >= 0) {
@@ -427,8 +519,11 @@ ApplicationWindow {
         var config = {
             targetDisk: selectedDisk,
             timezone: timezoneSelector.currentText,
+            locales: selectedLocales(),
             username: usernameField.text || "endos",
             password: passwordField.text || "password",
+            encryption: encryptCheck.checked,
+            encryptionPassphrase: encryptionPassphraseField.text,
             packages: packageList
         }
         Installer.startInstall(config)
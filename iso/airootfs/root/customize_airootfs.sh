@@ -46,11 +46,23 @@ pip list
 echo "Deactivating venv..."
 deactivate
 
-# Optional: Clean up wheels to save ISO space?
-# build.sh handles cleanup of the source, but the copies in airootfs might persist
-# unless we delete them here.
-echo "Cleaning up airootfs wheels..."
-rm -rf "$WHEELS_DIR"
+# Keep the wheels: the installer builds the target's venv from this cache
+# instead of copying the live venv (see installer/backend/venv.py).
+
+echo "=== Pacman Keyring Snapshot ==="
+# The installer verifies packages with this keyring and copies it into the
+# target instead of running pacman-key --init/--populate per install
+# (see installer/backend/keyring.py). It ships without the private master
+# key: verifying needs only the public keyring and trustdb, and a key baked
+# into the ISO would be the same on every machine.
+KEYRING_DIR="/usr/share/endos/pacman-keyring"
+rm -rf "$KEYRING_DIR"
+mkdir -p "$(dirname "$KEYRING_DIR")"
+pacman-key --gpgdir "$KEYRING_DIR" --init
+pacman-key --gpgdir "$KEYRING_DIR" --populate
+gpgconf --homedir "$KEYRING_DIR" --kill all || true
+rm -f "$KEYRING_DIR"/S.*
+rm -rf "$KEYRING_DIR"/private-keys-v1.d "$KEYRING_DIR"/secring.gpg "$KEYRING_DIR"/openpgp-revocs.d
 
 echo "=== System Configuration Setup ==="
 